@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Batch Logging
+Low-overhead per-record output for batch runs: events are queued on the
+matching thread and formatted and written by a background thread
+"""
+
+import json
+import logging
+import queue
+import sys
+import os
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from match import (MATCH_SUCCESS, MATCH_SKIP_ZERO, MATCH_NO_MATCH, MATCH_NODECISION,
+                   MATCH_ERROR)
+
+LOGGER_NAME = "batch_matching"
+
+# Log level of the per-record event of each match status
+STATUS_LEVELS = {
+    MATCH_SUCCESS: logging.INFO,
+    MATCH_SKIP_ZERO: logging.DEBUG,
+    MATCH_NO_MATCH: logging.INFO,
+    MATCH_NODECISION: logging.WARNING,
+    MATCH_ERROR: logging.ERROR,
+}
+
+LOG_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+# Text format of a per-record event
+RECORD_MESSAGE = "#%d rowid=%s %s %s %s 定额=%s → %s %s"
+
+# Bytes buffered before the background thread writes to the output
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+# Records between two clock checks of the progress line
+PROGRESS_CHECK_INTERVAL = 256
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+class EventFormatter(logging.Formatter):
+    """
+    Format per-record events as text lines or as JSON lines.  Events carry
+    a `payload` (number, rowid, payroll record, MatchResult) or `fields`
+    dict; the NODECISION message is only rendered here, off the matching thread.
+    """
+
+    def __init__(self, jsonl=False):
+        super().__init__("%(levelname)s %(message)s")
+        self.jsonl = jsonl
+
+    def format(self, record):
+        payload = getattr(record, 'payload', None)
+        if not self.jsonl:
+            if payload is not None:
+                number, payroll_rowid, payroll_record, result = payload
+                record.msg = RECORD_MESSAGE
+                record.args = (number, payroll_rowid, payroll_record['文件名'],
+                               payroll_record['sheet名'], payroll_record['职员全名'],
+                               payroll_record['定额'], result.status, _short_detail(result))
+            text = super().format(record)
+            fields = getattr(record, 'fields', None)
+            if fields:
+                text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+            return text
+
+        if payload is not None:
+            number, payroll_rowid, payroll_record, result = payload
+            event = {
+                'event': 'record',
+                'level': record.levelname.lower(),
+                'number': number,
+                'rowid': payroll_rowid,
+                '文件名': payroll_record['文件名'],
+                'sheet名': payroll_record['sheet名'],
+                '职员全名': payroll_record['职员全名'],
+                '定额': payroll_record['定额'],
+                'status': result.status,
+                'effected_from': result.effected_from,
+                'filter1_count': result.filter1_count,
+                'filter2_count': result.filter2_count,
+                '代码': result.code,
+            }
+            if result.message is not None:
+                event['message'] = str(result.message)
+            if result.near_miss:
+                event['near_miss'] = True
+        else:
+            event = {'event': record.getMessage(), 'level': record.levelname.lower()}
+            event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def _short_detail(result):
+    """One-line detail of a result for the text format"""
+    if result.code is not None:
+        return result.code
+    if result.status == MATCH_NODECISION:
+        return f"候选 {result.filter2_count} 条"
+    if result.status == MATCH_ERROR:
+        return str(result.message)
+    return ""
+
+
+def open_log_file(path):
+    """Open a log file with a large write buffer"""
+    return open(path, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+
+
+class _BufferedStreamHandler(logging.StreamHandler):
+    """
+    StreamHandler that only flushes when closed, not after every line, and
+    drops further events once the reader of a pipe has gone away
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self.broken = False
+
+    def emit(self, record):
+        if self.broken:
+            return
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except BrokenPipeError:
+            self.broken = True
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if not self.broken:
+            try:
+                super().flush()
+            except BrokenPipeError:
+                self.broken = True
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class ProgressLine:
+    """
+    Throttled progress line (count, rate and ETA) on stderr.  Rewritten in
+    place on a terminal; printed as a new line every `interval` * 10 seconds
+    otherwise.
+    """
+
+    def __init__(self, total=None, stream=None, interval=1.0):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.interval = interval if self.tty else interval * 10
+        self.count = 0
+        self._start = time.perf_counter()
+        self._next = self._start + self.interval
+        self._until_check = PROGRESS_CHECK_INTERVAL
+
+    def update(self, count):
+        """Set the processed count, redrawing at most once per interval"""
+        self.count = count
+        self._until_check -= 1
+        if self._until_check:
+            return
+        self._until_check = PROGRESS_CHECK_INTERVAL
+        now = time.perf_counter()
+        if now >= self._next:
+            self._next = now + self.interval
+            self._draw(now)
+
+    def _draw(self, now, final=False):
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        line = f"已处理 {self.count}"
+        if self.total:
+            line += f"/{self.total} ({self.count / self.total:.1%})"
+        line += f"  {rate:,.0f} 条/秒"
+        if final:
+            line += f"  用时 {_format_seconds(elapsed)}"
+        elif self.total and rate > 0:
+            line += f"  预计剩余 {_format_seconds((self.total - self.count) / rate)}"
+        if self.tty:
+            self.stream.write("\r" + line + ("\n" if final else "\x1b[K"))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def finish(self):
+        """Draw the final line"""
+        self._draw(time.perf_counter(), final=True)
+
+
+def _format_seconds(seconds):
+    """H:MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class BatchLog:
+    """
+    Per-record output of --quiet and --log-format jsonl runs.
+
+    record() only decides whether an event is logged (level and sampling)
+    and queues it; a QueueListener thread formats and writes the events to a
+    buffered stream.  Events below WARNING are sampled: one in `sample` is
+    logged.  Warnings (undecided records) and errors are always logged.
+    """
+
+    def __init__(self, log_format='text', level=logging.WARNING, sample=1, stream=None,
+                 total=None, progress=True):
+        """
+        Args:
+            log_format (str): 'text' or 'jsonl'
+            level (int): Lowest logged level
+            sample (int): Log one in `sample` events below WARNING
+            stream (file, optional): Output stream, sys.stdout by default
+            total (int, optional): Records expected, for the progress ETA
+            progress (bool): Show the progress line on stderr
+        """
+        self.level = level
+        self.sample = max(1, sample)
+        self._sampled = 0
+        self.progress = ProgressLine(total) if progress else None
+
+        self.queue = queue.SimpleQueue()
+        self.handler = _BufferedStreamHandler(stream or sys.stdout)
+        self.handler.setFormatter(EventFormatter(jsonl=log_format == 'jsonl'))
+        self.listener = QueueListener(self.queue, self.handler)
+
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.handlers = [_DeferredQueueHandler(self.queue)]
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+        self.listener.start()
+
+    def record(self, number, payroll_rowid, payroll_record, result):
+        """Log the result of one payroll record (the process_results() report callback)"""
+        if self.progress is not None:
+            self.progress.update(number)
+        level = STATUS_LEVELS.get(result.status, logging.ERROR)
+        if level < self.level:
+            return
+        if level < logging.WARNING and self.sample > 1:
+            self._sampled += 1
+            if self._sampled % self.sample:
+                return
+        self.logger.log(level, "record",
+                        extra={'payload': (number, payroll_rowid, payroll_record, result)})
+
+    def event(self, name, level=logging.INFO, **fields):
+        """Log a named event with extra fields (e.g. the run summary)"""
+        if level >= self.level:
+            self.logger.log(level, name, extra={'fields': fields})
+
+    def close(self):
+        """Finish the progress line and write out every queued event"""
+        if self.progress is not None:
+            self.progress.finish()
+        self.listener.stop()
+        self.handler.flush()
+        self.logger.handlers = []
@@ -4,97 +4,591 @@ Batch Matching Program
 Process payroll records in batch mode to match with quota data
 """
 
+import argparse
+import contextlib
 import sys
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # Add the current directory to the path to import local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from query_quota_table import query_quota_table
-from payroll_generator import payroll_records_gen
-from match import filter_quota_data, final_decision, NODECISION
+from payroll_generator import payroll_rowid_bounds, payroll_records_in_range
+from match import (match_record, BatchCounters, MATCH_SUCCESS, MATCH_SKIP_ZERO,
+                   MATCH_NO_MATCH, MATCH_NODECISION)
+import quota_cache
+from quota_cache import load_quota_index
+from config import QUOTA_TOLERANCE, QUOTA_ROUND_DIGITS, QUOTA_NEAR_MISS_WINDOW
+from db import get_connection
+from sql_engine import sql_match_records
+from results_store import MatchResultWriter, DEFAULT_COMMIT_INTERVAL, connect_writable
+from incremental import incremental_results, IncrementalStats
+from metrics import RunMetrics
+from batch_log import BatchLog, LOG_LEVELS, open_log_file
+from pipeline import pipeline_results, PIPELINE_BATCH_SIZE, PIPELINE_QUEUE_SIZE
+from dedup import dedup_results, DedupStats
+from checkpoint import checkpointed_results, unfinished_run, CheckpointStats
 
+# Target number of payroll records per chunk in --workers mode
+CHUNK_SIZE = 20000
 
-def main():
+
+def report_result(number, payroll_record, result):
+    """
+    Print the processing details of one payroll record
+
+    Args:
+        number (int): 1-based position of the record in this run
+        payroll_record (dict): Payroll record, at least 文件名/sheet名/职员全名/定额
+        result (MatchResult): Result returned by match_record()
+    """
+    print(f"\n处理记录 #{number}:")
+    print(f"  文件名: {payroll_record['文件名']}")
+    print(f"  工作表名: {payroll_record['sheet名']}")
+    print(f"  职员: {payroll_record['职员全名']}")
+    print(f"  定额: {payroll_record['定额']}")
+
+    if result.status == MATCH_SKIP_ZERO:
+        print("  → 定额为0，跳过匹配")
+        return
+
+    if result.effected_from is not None:
+        effected_from = result.effected_from
+        print(f"the value of {effected_from =}")
+    if result.filter1_count is not None:
+        print(f"  过滤结果: 条件1={result.filter1_count}, 条件1+2={result.filter2_count}")
+
+    if result.status == MATCH_SUCCESS:
+        print(f"  → 最终决策代码: {result.code}")
+    elif result.status == MATCH_NO_MATCH:
+        print(f"  → 无匹配记录")
+    elif result.status == MATCH_NODECISION:
+        print(f"  → 决策失败: {result.message}")
+    else:
+        print(f"  → 处理错误: {result.message}")
+
+
+def serial_results(quota_data, limit=None, clock=None):
+    """
+    Match payroll records one by one in this process
+
+    Args:
+        quota_data (QuotaIndex): Quota index from load_quota_index()
+        limit (int, optional): Only match the first `limit` records
+        clock (metrics.StageClock, optional): Lapped after reading each
+            record ('read') and inside match_record()
+
+    Yields:
+        tuple: (payroll rowid, payroll_record, MatchResult) in rowid order
+    """
+    bounds = payroll_rowid_bounds(limit)
+    if bounds is None:
+        return
+    first_rowid, last_rowid, _ = bounds
+
+    records = payroll_records_in_range(first_rowid, last_rowid, with_rowid=True,
+                                       row_format='record')
+    if clock is None:
+        for payroll_rowid, payroll_record in records:
+            yield payroll_rowid, payroll_record, match_record(quota_data, payroll_record)
+        return
+
+    for payroll_rowid, payroll_record in records:
+        clock.lap('read')
+        yield payroll_rowid, payroll_record, match_record(quota_data, payroll_record, clock)
+
+
+def columnar_results(quota_data, limit=None, payroll_columns=None):
+    """
+    Match payroll records with the pandas columnar engine (columnar_engine.py),
+    reading the payroll columns from the column cache when given
+
+    Yields:
+        tuple: (payroll rowid, payroll summary, MatchResult) in rowid order
+    """
+    from columnar_engine import columnar_match_records
+
+    yield from columnar_match_records(quota_data, limit, columns=payroll_columns)
+
+
+# Quota index of a worker process, built once by _init_worker
+_worker_quota_data = None
+
+
+def _init_worker(use_quota_cache=True, tolerance=QUOTA_TOLERANCE,
+                 round_digits=QUOTA_ROUND_DIGITS):
+    """Process pool initializer: load the quota index once per worker"""
+    global _worker_quota_data
+    _worker_quota_data = load_quota_index(use_quota_cache)
+    _worker_quota_data.set_tolerance(tolerance, round_digits)
+
+
+def _init_shared_worker(shared_name, tolerance=QUOTA_TOLERANCE, round_digits=QUOTA_ROUND_DIGITS):
+    """Process pool initializer: attach to the parent's shared-memory quota index"""
+    global _worker_quota_data
+    from shared_quota import SharedQuotaIndex
+
+    _worker_quota_data = SharedQuotaIndex.attach(shared_name)
+    _worker_quota_data.set_tolerance(tolerance, round_digits)
+
+
+def _match_chunk(rowid_range):
+    """
+    Match the payroll records of one rowid range in a worker process,
+    reading through the worker's pooled read-only connection
+
+    Returns:
+        list: (payroll rowid, payroll summary, MatchResult) tuples in rowid order
+    """
+    first_rowid, last_rowid = rowid_range
+    results = []
+    for payroll_rowid, payroll_record in payroll_records_in_range(
+            first_rowid, last_rowid, conn=get_connection(), with_rowid=True,
+            row_format='record'):
+        summary = {key: payroll_record[key] for key in ('文件名', 'sheet名', '职员全名', '定额')}
+        results.append((payroll_rowid, summary, match_record(_worker_quota_data, payroll_record)))
+    return results
+
+
+def split_rowid_range(first_rowid, last_rowid, chunk_count):
+    """
+    Split [first_rowid, last_rowid] into at most chunk_count contiguous ranges
+    """
+    span = last_rowid - first_rowid + 1
+    chunk_count = max(1, min(chunk_count, span))
+    step = -(-span // chunk_count)
+    return [
+        (start, min(start + step - 1, last_rowid))
+        for start in range(first_rowid, last_rowid + 1, step)
+    ]
+
+
+def parallel_results(workers, limit=None, use_quota_cache=True, tolerance=QUOTA_TOLERANCE,
+                     round_digits=QUOTA_ROUND_DIGITS, quota_index=None):
+    """
+    Match payroll records in a pool of worker processes.
+
+    payroll_details is split into contiguous rowid ranges; each worker reads
+    its ranges through its own read-only connection and the results are
+    yielded in rowid order, so the output is the same as serial_results().
+
+    With a quota_index, it is encoded once into shared memory (shared_quota.py)
+    and the workers attach to it; otherwise (or when it cannot be encoded)
+    every worker loads its own copy.
+
+    Yields:
+        tuple: (payroll rowid, payroll summary, MatchResult) in rowid order
+    """
+    bounds = payroll_rowid_bounds(limit)
+    if bounds is None:
+        return
+    first_rowid, last_rowid, record_count = bounds
+
+    chunk_count = max(workers * 4, -(-record_count // CHUNK_SIZE))
+    rowid_ranges = split_rowid_range(first_rowid, last_rowid, chunk_count)
+    print(f"使用 {workers} 个进程并行处理 {len(rowid_ranges)} 个数据块")
+
+    shared_index = None
+    if quota_index is not None:
+        from shared_quota import SharedQuotaIndex
+
+        try:
+            shared_index = SharedQuotaIndex.create(quota_index)
+        except ValueError as e:
+            print(f"无法建立共享内存定额索引, 各进程分别加载: {e}")
+    if shared_index is not None:
+        initializer = _init_shared_worker
+        initargs = (shared_index.name, tolerance, round_digits)
+    else:
+        initializer = _init_worker
+        initargs = (use_quota_cache, tolerance, round_digits)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                                 initargs=initargs) as executor:
+            for chunk_results in executor.map(_match_chunk, rowid_ranges):
+                yield from chunk_results
+    finally:
+        if shared_index is not None:
+            shared_index.close()
+
+
+def print_result(number, payroll_rowid, payroll_record, result):
+    """Default report callback of process_results(): print the report_result() block"""
+    report_result(number, payroll_record, result)
+
+
+def process_results(results, counters, writer=None, metrics=None, report=print_result):
+    """
+    Count, report and optionally persist the results of a matching engine
+
+    Args:
+        results (iterable): (payroll rowid, payroll record, MatchResult) tuples
+        counters (BatchCounters): Counters to update
+        writer (MatchResultWriter, optional): Writer persisting the decisions
+        metrics (RunMetrics, optional): Per-stage timing of every record; the
+            engine time not lapped by the engine itself is counted as 'match'
+        report (callable): Called as report(number, payroll rowid, payroll
+            record, MatchResult) for every record
+    """
+    if metrics is None:
+        for payroll_rowid, payroll_record, result in results:
+            counters.add(result)
+            report(counters.processed_count, payroll_rowid, payroll_record, result)
+            if writer is not None:
+                writer.add(payroll_rowid, result, payroll_record)
+        return
+
+    clock = metrics.clock
+    results = iter(results)
+    while True:
+        clock.start()
+        try:
+            payroll_rowid, payroll_record, result = next(results)
+        except StopIteration:
+            break
+        clock.lap('match')
+        counters.add(result)
+        report(counters.processed_count, payroll_rowid, payroll_record, result)
+        clock.lap('report')
+        if writer is not None:
+            writer.add(payroll_rowid, result, payroll_record)
+            clock.lap('write')
+        metrics.record_done()
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="批量匹配程序 - Batch Matching Program")
+    parser.add_argument("--engine", choices=["python", "sql", "columnar"], default="python",
+                        help="匹配引擎: python 逐条匹配, sql 由SQLite一次联接完成, "
+                             "columnar 使用 pandas 列式计算 (默认: python)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="并行处理的进程数 (默认: 1, 单进程; 仅用于 python 引擎)")
+    parser.add_argument("--column-cache", action="store_true",
+                        help="从内存映射的工资列缓存读取工资记录, 工资表最大 rowid 或记录数变化时"
+                             "自动重新导出 (仅用于单进程 python 及 columnar 引擎)")
+    parser.add_argument("--no-shared-quota", action="store_true",
+                        help="--workers 模式下各进程分别加载定额索引, 不使用共享内存")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="最多处理的记录数 (默认: 处理所有记录)")
+    parser.add_argument("--no-quota-cache", action="store_true",
+                        help="不使用定额缓存文件，直接查询定额表")
+    parser.add_argument("--write-results", action="store_true",
+                        help="将匹配决策写入数据库的 match_results 表")
+    parser.add_argument("--incremental", action="store_true",
+                        help="只匹配新增、内容变化或定额候选变化的记录 (隐含 --write-results)")
+    parser.add_argument("--commit-interval", type=int, default=None,
+                        help=f"写入结果时每个事务提交的记录数 (默认: {DEFAULT_COMMIT_INTERVAL}; "
+                             f"分区运行按分区提交)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="统计各阶段耗时、吞吐量、延迟分位数和内存, 并在摘要中显示")
+    parser.add_argument("--metrics-json", default=None,
+                        help="将运行指标写入 JSON 文件 (隐含 --metrics)")
+    parser.add_argument("--metrics-prom", default=None,
+                        help="将运行指标写入 Prometheus textfile (隐含 --metrics)")
+    parser.add_argument("--metrics-interval", type=float, default=None,
+                        help="运行期间每隔多少秒刷新一次指标文件 (默认: 只在结束时写入)")
+    parser.add_argument("--tolerance", type=float, default=QUOTA_TOLERANCE,
+                        help="定额相差不超过该值即视为匹配 (默认: "
+                             f"{QUOTA_TOLERANCE}, 精确匹配; 仅用于 python 引擎)")
+    parser.add_argument("--round-digits", type=int, default=QUOTA_ROUND_DIGITS,
+                        help="定额四舍五入到该小数位数后相等即视为匹配 "
+                             "(默认: 不舍入; 仅用于 python 引擎)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="每个不同的 (文件名月份, 工作表名, 定额) 键只匹配一次, "
+                             "再将结果分发给该键的所有记录 (仅用于单进程 python 引擎)")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="按文件名分区匹配, 每个分区的决策与检查点一起独立提交 "
+                             "(隐含 --write-results; 仅用于单进程 python 引擎)")
+    parser.add_argument("--resume", action="store_true",
+                        help="继续最近一次未完成的分区运行, 跳过已完成的分区 (隐含 --checkpoint)")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="分区运行超过该秒数后, 在当前分区完成时停止, 之后可用 --resume 继续 "
+                             "(隐含 --checkpoint)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="读取、匹配、输出三个阶段通过有界队列并行流水处理 (仅用于单进程 python 引擎)")
+    parser.add_argument("--pipeline-batch-size", type=int, default=PIPELINE_BATCH_SIZE,
+                        help=f"流水线中每批的记录数 (默认: {PIPELINE_BATCH_SIZE})")
+    parser.add_argument("--pipeline-queue-size", type=int, default=PIPELINE_QUEUE_SIZE,
+                        help=f"流水线各阶段之间队列的最大批数 (默认: {PIPELINE_QUEUE_SIZE})")
+    parser.add_argument("--quiet", action="store_true",
+                        help="不逐条打印记录, 只由后台线程输出警告/错误记录并显示进度行")
+    parser.add_argument("--log-format", choices=["text", "jsonl"], default=None,
+                        help="逐条记录事件的输出格式; jsonl 每行一个 JSON 事件 (隐含 --quiet)")
+    parser.add_argument("--log-level", choices=list(LOG_LEVELS), default=None,
+                        help="输出的最低事件级别: 成功/无匹配为 info, 定额为0为 debug, "
+                             "无法决策为 warning, 错误为 error "
+                             "(默认: text 为 warning, jsonl 为 info)")
+    parser.add_argument("--log-sample", type=int, default=1,
+                        help="warning 以下的事件每 N 条输出 1 条 (默认: 1, 全部输出)")
+    parser.add_argument("--log-file", default=None,
+                        help="逐条记录事件写入的文件 (默认: 标准输出)")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="--quiet 模式下不显示进度行")
+    args = parser.parse_args(argv)
+    if args.engine != "python" and args.workers > 1:
+        parser.error("--workers 只能与 python 引擎一起使用")
+    if args.incremental and (args.engine != "python" or args.workers > 1):
+        parser.error("--incremental 只能与单进程 python 引擎一起使用")
+    if args.dedup and (args.engine != "python" or args.workers > 1 or args.incremental
+                       or args.pipeline):
+        parser.error("--dedup 只能与单进程 python 引擎一起使用 "
+                     "(不能与 --incremental 或 --pipeline 同时使用)")
+    if args.pipeline and (args.engine != "python" or args.workers > 1 or args.incremental):
+        parser.error("--pipeline 只能与单进程 python 引擎一起使用 (不能与 --incremental 同时使用)")
+    if args.pipeline and (args.metrics_json or args.metrics_prom or args.metrics):
+        parser.error("--pipeline 各阶段并发运行, 不能与 --metrics 一起使用")
+    if args.resume or args.time_limit is not None:
+        args.checkpoint = True
+    if args.checkpoint and (args.engine != "python" or args.workers > 1 or args.incremental
+                            or args.dedup or args.pipeline or args.limit is not None):
+        parser.error("--checkpoint/--resume 只能与单进程 python 引擎一起使用 "
+                     "(不能与 --incremental、--dedup、--pipeline 或 --limit 同时使用)")
+    if args.checkpoint and args.commit_interval is not None:
+        parser.error("--checkpoint/--resume 每个分区提交一次, 不能与 --commit-interval 一起使用")
+    if args.commit_interval is not None and args.commit_interval < 1:
+        parser.error("--commit-interval 必须为正整数")
+    if args.column_cache and (args.engine == "sql" or args.workers > 1 or args.incremental
+                              or args.dedup or args.pipeline or args.checkpoint):
+        parser.error("--column-cache 只能与单进程 python 或 columnar 引擎一起使用 "
+                     "(不能与 --incremental、--dedup、--pipeline 或 --checkpoint 同时使用)")
+    if args.tolerance and args.round_digits is not None:
+        parser.error("--tolerance 与 --round-digits 不能同时使用")
+    if args.tolerance < 0:
+        parser.error("--tolerance 不能为负数")
+    if (args.tolerance or args.round_digits is not None) and args.engine != "python":
+        parser.error("--tolerance/--round-digits 只能与 python 引擎一起使用")
+    if args.incremental or args.checkpoint:
+        args.write_results = True
+    if args.metrics_json or args.metrics_prom:
+        args.metrics = True
+    if args.log_format is not None:
+        args.quiet = True
+    elif args.quiet:
+        args.log_format = "text"
+    if args.log_level is None:
+        args.log_level = "info" if args.log_format == "jsonl" else "warning"
+    return args
+
+
+def main(argv=None):
     """
     Main function for batch matching
     """
+    args = parse_args(argv)
+    if not args.quiet:
+        run_batch(args)
+        return
+
+    # Per-record events go to stdout (or --log-file); in jsonl mode the
+    # human-readable lines move to stderr so stdout stays valid JSON lines
+    log_stream = open_log_file(args.log_file) if args.log_file else sys.stdout
+    to_stderr = args.log_format == "jsonl" and not args.log_file
+    try:
+        with contextlib.redirect_stdout(sys.stderr) if to_stderr else contextlib.nullcontext():
+            run_batch(args, log_stream)
+    finally:
+        if args.log_file:
+            log_stream.close()
+        else:
+            sys.stdout.flush()
+
+
+def run_batch(args, log_stream=None):
+    """
+    Run a batch matching with parsed arguments
+
+    Args:
+        args (argparse.Namespace): Arguments from parse_args()
+        log_stream (file, optional): Stream of the per-record events in quiet mode
+    """
     print("=" * 60)
     print("批量匹配程序 - Batch Matching Program")
     print("=" * 60)
-    
-    # Step 1: Load quota data
-    print("正在查询定额数据...")
-    quota_data = query_quota_table()
-    print(f"获取到 {len(quota_data)} 条定额记录")
+
+    engine_name = args.engine
+    if args.incremental:
+        engine_name = "incremental"
+    elif args.checkpoint:
+        engine_name = "checkpoint"
+    metrics = None
+    if args.metrics:
+        metrics = RunMetrics(engine_name, args.workers, args.metrics_json,
+                             args.metrics_prom, args.metrics_interval)
+
+    # Step 1: Load quota data, unless every worker process loads its own
+    quota_data = None
+    if args.workers > 1 and args.no_shared_quota:
+        print("定额索引由各工作进程分别加载")
+    else:
+        print("正在查询定额数据...")
+        start = time.perf_counter()
+        quota_data = load_quota_index(not args.no_quota_cache)
+        quota_data.set_tolerance(args.tolerance, args.round_digits)
+        if metrics is not None:
+            metrics.add_stage('quota_load', time.perf_counter() - start)
+            metrics.quota_cache = quota_cache.last_load_source
+        print(f"获取到 {len(quota_data)} 条定额记录")
     print()
-    
-    # Step 2: Create payroll records generator (no file_name prefix to get all records)
+
+    # Step 2: Match payroll records (no file_name prefix to get all records)
     print("正在获取工资记录...")
-    generator = payroll_records_gen()  # No parameters to get all records
-    
-    # Counter for processed records
-    processed_count = 0
-    success_count = 0
-    skip_count = 0
-    error_count = 0
-    
-    try:
-        # Process records one by one (limit to first 100 records for now)
-        while processed_count < 100:
-            payroll_record = next(generator)
-            processed_count += 1
-            
-            print(f"\n处理记录 #{processed_count}:")
-            print(f"  文件名: {payroll_record['文件名']}")
-            print(f"  工作表名: {payroll_record['sheet名']}")
-            print(f"  职员: {payroll_record['职员全名']}")
-            print(f"  定额: {payroll_record['定额']}")
-            
-            # Skip if quota is 0
-            if payroll_record['定额'] == 0:
-                print("  → 定额为0，跳过匹配")
-                skip_count += 1
-                continue
-            
-            # Get file name from payroll record
-            file_name = payroll_record['文件名']
-            
+    payroll_columns = None
+    if args.column_cache:
+        import payroll_columns as column_cache
+
+        start = time.perf_counter()
+        payroll_columns = column_cache.load_payroll_columns()
+        if metrics is not None:
+            metrics.add_stage('column_cache', time.perf_counter() - start)
+        source = "缓存" if column_cache.last_load_source == 'cache' else "重新导出"
+        print(f"工资列缓存: {len(payroll_columns)} 条记录 ({source})")
+    counters = BatchCounters()
+    incremental_stats = None
+    dedup_stats = None
+    checkpoint_stats = None
+
+    if args.incremental:
+        incremental_stats = IncrementalStats()
+        results = incremental_results(quota_data, args.limit, incremental_stats)
+    elif args.engine == "sql":
+        results = sql_match_records(quota_data, args.limit)
+    elif args.engine == "columnar":
+        results = columnar_results(quota_data, args.limit, payroll_columns)
+    elif args.workers > 1:
+        results = parallel_results(args.workers, args.limit, not args.no_quota_cache,
+                                   args.tolerance, args.round_digits,
+                                   quota_data)
+    elif args.dedup:
+        dedup_stats = DedupStats()
+        results = dedup_results(quota_data, args.limit, dedup_stats)
+    elif args.pipeline or args.checkpoint:
+        # Started below, once the results writer exists
+        results = None
+    elif payroll_columns is not None:
+        results = column_cache.column_results(quota_data, payroll_columns, args.limit)
+    else:
+        results = serial_results(quota_data, args.limit,
+                                 metrics.clock if metrics is not None else None)
+
+    batch_log = None
+    report = print_result
+    if args.quiet:
+        total = None
+        if payroll_columns is not None:
+            total = len(payroll_columns) if args.limit is None else min(args.limit,
+                                                                         len(payroll_columns))
+        elif not args.incremental:
+            bounds = payroll_rowid_bounds(args.limit)
+            total = bounds[2] if bounds is not None else 0
+        batch_log = BatchLog(args.log_format, LOG_LEVELS[args.log_level], args.log_sample,
+                             log_stream, total, progress=not args.no_progress)
+        report = batch_log.record
+
+    writer = None
+    if args.write_results:
+        run_id = None
+        if args.resume:
+            conn = connect_writable()
             try:
-                # Step 3: Filter quota data
-                filter1_count, filter2_count, filtered_data = filter_quota_data(
-                    quota_data, payroll_record, file_name
-                )
-                
-                print(f"  过滤结果: 条件1={filter1_count}, 条件1+2={filter2_count}")
-                
-                # Step 4: Make final decision
-                if filter2_count > 0:
-                    decision_code = final_decision(payroll_record, filtered_data)
-                    print(f"  → 最终决策代码: {decision_code}")
-                    success_count += 1
-                else:
-                    print(f"  → 无匹配记录")
-                    skip_count += 1
-                    
-            except NODECISION as e:
-                print(f"  → 决策失败: {e}")
-                error_count += 1
-            except Exception as e:
-                print(f"  → 处理错误: {e}")
-                error_count += 1
-        
-        print(f"\n处理完成 (限制前100条记录)")
-        
-    except StopIteration:
-        print(f"\n所有记录已处理完毕 (共 {processed_count} 条记录)")
-    
+                run_id = unfinished_run(conn)
+            finally:
+                conn.close()
+            if run_id is None:
+                print("没有未完成的分区运行, 开始新的运行")
+        # In pipeline mode rows are added from the output thread
+        # Checkpointed runs commit once per partition, never in between
+        commit_interval = (None if args.checkpoint
+                           else args.commit_interval or DEFAULT_COMMIT_INTERVAL)
+        writer = MatchResultWriter(engine_name, commit_interval=commit_interval,
+                                   check_same_thread=not args.pipeline, run_id=run_id)
+        if run_id is not None:
+            print(f"继续未完成的运行 (运行编号: {writer.run_id})")
+        print(f"匹配决策将写入 match_results 表 (运行编号: {writer.run_id})")
+
+    if args.checkpoint:
+        checkpoint_stats = CheckpointStats()
+        results = checkpointed_results(quota_data, writer, counters, checkpoint_stats,
+                                       args.time_limit)
+
+    # A checkpointed run stays unfinished (resumable) unless every partition is done
+    finished = not args.checkpoint
+    try:
+        if args.pipeline:
+            pipeline_results(
+                quota_data,
+                lambda batch: process_results(batch, counters, writer, report=report),
+                args.limit, args.pipeline_batch_size, args.pipeline_queue_size
+            )
+        else:
+            process_results(results, counters, writer, metrics, report)
+        if checkpoint_stats is not None:
+            finished = not checkpoint_stats.stopped
+    finally:
+        if batch_log is not None:
+            batch_log.event("summary", processed=counters.processed_count,
+                            success=counters.success_count, skip=counters.skip_count,
+                            error=counters.error_count, near_miss=counters.near_miss_count)
+            batch_log.close()
+        if writer is not None:
+            start = time.perf_counter()
+            writer.close(counters, finished)
+            if metrics is not None:
+                metrics.add_stage('write_close', time.perf_counter() - start)
+        if metrics is not None:
+            metrics.finish(counters)
+
+    if checkpoint_stats is not None and checkpoint_stats.stopped:
+        print(f"\n已达到时间限制, 在分区边界停止 (已处理 {counters.processed_count} 条记录)")
+    elif args.limit is None or counters.processed_count < args.limit:
+        print(f"\n所有记录已处理完毕 (共 {counters.processed_count} 条记录)")
+    else:
+        print(f"\n处理完成 (限制前{args.limit}条记录)")
+
     # Print summary
     print("\n" + "=" * 60)
     print("处理摘要:")
-    print(f"  总处理记录数: {processed_count}")
-    print(f"  成功匹配数: {success_count}")
-    print(f"  跳过数 (定额为0或无匹配): {skip_count}")
-    print(f"  错误数: {error_count}")
+    print(f"  总处理记录数: {counters.processed_count}")
+    print(f"  成功匹配数: {counters.success_count}")
+    print(f"  跳过数 (定额为0或无匹配): {counters.skip_count}")
+    print(f"  错误数: {counters.error_count}")
+    if args.tolerance or args.round_digits is not None:
+        mode = (f"±{args.tolerance}" if args.round_digits is None
+                else f"舍入到 {args.round_digits} 位小数")
+        print(f"  近似定额匹配数 ({mode}, 无完全相等的定额): {counters.near_miss_count}")
+    elif QUOTA_NEAR_MISS_WINDOW:
+        print(f"  近似未匹配数 (定额相差 ±{QUOTA_NEAR_MISS_WINDOW} 内): "
+              f"{counters.near_miss_count}")
+    if incremental_stats is not None:
+        print(f"  增量模式 (上次水位 rowid: {incremental_stats.watermark}):")
+        print(f"    新增记录数: {incremental_stats.new_count}")
+        print(f"    内容变化记录数: {incremental_stats.changed_count}")
+        print(f"    定额候选变化记录数: {incremental_stats.quota_changed_count}")
+        print(f"    未变化跳过数: {incremental_stats.unchanged_count}")
+    if dedup_stats is not None:
+        statuses = dedup_stats.key_statuses
+        key_success = statuses[MATCH_SUCCESS]
+        key_skip = statuses[MATCH_SKIP_ZERO] + statuses[MATCH_NO_MATCH]
+        average = dedup_stats.row_count / dedup_stats.key_count if dedup_stats.key_count else 0
+        print(f"  去重模式: {dedup_stats.key_count} 个不同键, {dedup_stats.row_count} 条记录 "
+              f"(平均每键 {average:.1f} 条)")
+        print(f"    成功匹配键数: {key_success}")
+        print(f"    跳过键数 (定额为0或无匹配): {key_skip}")
+        print(f"    错误键数: {dedup_stats.key_count - key_success - key_skip}")
+    if checkpoint_stats is not None:
+        print(f"  分区运行 (运行编号 {checkpoint_stats.run_id}): "
+              f"共 {checkpoint_stats.partition_count} 个文件名分区")
+        print(f"    本次完成分区数: {checkpoint_stats.completed_count}")
+        print(f"    之前已完成跳过数: {checkpoint_stats.resumed_count}")
+        if checkpoint_stats.stopped:
+            remaining = (checkpoint_stats.partition_count - checkpoint_stats.completed_count
+                         - checkpoint_stats.resumed_count)
+            print(f"    剩余分区数: {remaining} (使用 --resume 继续)")
+    if metrics is not None:
+        print("运行指标:")
+        for line in metrics.summary_lines():
+            print(line)
     print("=" * 60)
 
 
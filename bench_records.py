@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Record Memory Benchmark
+Compare the memory per row of plain dicts and slotted records
+"""
+
+import argparse
+import sys
+import os
+import time
+import tracemalloc
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from quota_cache import fetch_quota_rows
+from records import PayrollRecord, QuotaRecord
+
+
+def measure(build):
+    """
+    Run build() and return (result, bytes allocated, seconds)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated, elapsed
+
+
+def report(name, rows, allocated, elapsed):
+    """Print one benchmark line"""
+    per_row = allocated / len(rows) if rows else 0
+    print(f"  {name:<22} {len(rows):>9} 行  {allocated / 1024 / 1024:>9.2f} MB  "
+          f"{per_row:>8.1f} 字节/行  {elapsed:>7.3f} 秒")
+
+
+def main(argv=None):
+    """
+    Load payroll and quota rows as dicts and as slotted records and report
+    the memory used per row
+    """
+    parser = argparse.ArgumentParser(description="记录类型内存基准测试")
+    parser.add_argument("--limit", type=int, default=100000,
+                        help="读取的工资记录数 (默认: 100000)")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("记录类型内存基准测试 - Record Memory Benchmark")
+    print("=" * 60)
+
+    # Raw tuples are shared by both formats; only the per-row container is measured
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("select * from payroll_details order by rowid limit ?", (args.limit,))
+        columns = [description[0] for description in cursor.description]
+        payroll_rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    print("工资记录:")
+    rows, allocated, elapsed = measure(lambda: [dict(zip(columns, row)) for row in payroll_rows])
+    report("dict", rows, allocated, elapsed)
+    del rows
+    record_class = PayrollRecord.for_columns(columns)
+    rows, allocated, elapsed = measure(lambda: [record_class(*row) for row in payroll_rows])
+    report("PayrollRecord", rows, allocated, elapsed)
+    del rows
+
+    quota_columns, quota_rows = fetch_quota_rows()
+    print("定额记录:")
+    rows, allocated, elapsed = measure(lambda: [dict(zip(quota_columns, row)) for row in quota_rows])
+    report("dict", rows, allocated, elapsed)
+    del rows
+    record_class = QuotaRecord.for_columns(quota_columns)
+    rows, allocated, elapsed = measure(lambda: [record_class(*row) for row in quota_rows])
+    report("QuotaRecord", rows, allocated, elapsed)
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End-to-End Benchmark
+Time each matching stage on a synthetic database and report the results as JSON
+"""
+
+import argparse
+import contextlib
+import json
+import platform
+import sqlite3
+import sys
+import os
+import tempfile
+import time
+from collections import Counter
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import config
+from config import calculate_effected_from, compile_category_mapping, effected_from_cache_info
+from synthetic_data import generate_database
+from quota_cache import load_quota_index, cache_path
+from payroll_generator import read_payroll
+from match import filter_quota_data, final_decision, match_record, NODECISION
+from results_store import MatchResultWriter
+from batch_matching import (BatchCounters, process_results, serial_results,
+                            columnar_results)
+from sql_engine import sql_match_records
+
+ENGINES = {
+    'python': serial_results,
+    'sql': sql_match_records,
+    'columnar': columnar_results,
+}
+
+
+def progress(message):
+    """Progress messages go to stderr so stdout can carry the JSON report"""
+    print(message, file=sys.stderr)
+
+
+def timed(records, seconds):
+    """Stage entry of the report"""
+    return {
+        'seconds': round(seconds, 6),
+        'records': records,
+        'records_per_sec': round(records / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def benchmark_stages(commit_interval):
+    """
+    Time the matching stages one after another on the configured database.
+
+    Returns:
+        tuple: (stage entries, match status counts, effected_from cache info)
+    """
+    stages = {}
+
+    # Quota load: built from the table, then from a warm cache file
+    start = time.perf_counter()
+    quota_index = load_quota_index(use_cache=False)
+    stages['quota_load'] = timed(len(quota_index), time.perf_counter() - start)
+    if os.path.exists(cache_path()):
+        os.remove(cache_path())
+    load_quota_index()
+    start = time.perf_counter()
+    load_quota_index()
+    stages['quota_load_cached'] = timed(len(quota_index), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    records = [
+        (payroll_rowid, record)
+        for payroll_rowid, record in read_payroll(with_rowid=True, row_format='record')
+    ]
+    stages['payroll_streaming'] = timed(len(records), time.perf_counter() - start)
+
+    # calculate_effected_from from a cold cache
+    compile_category_mapping()
+    start = time.perf_counter()
+    for _, record in records:
+        try:
+            calculate_effected_from(record['文件名'], record['sheet名'])
+        except ValueError:
+            pass
+    stages['calculate_effected_from'] = timed(len(records), time.perf_counter() - start)
+    cache_info = effected_from_cache_info()
+
+    # filter_quota_data prints a line per call; time it as it runs in match.py
+    filtered = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for _, record in records:
+            if record['定额'] == 0:
+                continue
+            try:
+                _, filter2_count, filter2_data = filter_quota_data(
+                    quota_index, record, record['文件名'])
+            except ValueError:
+                continue
+            if filter2_count:
+                filtered.append((record, filter2_data))
+        elapsed = time.perf_counter() - start
+    stages['filter_quota_data'] = timed(len(records), elapsed)
+
+    start = time.perf_counter()
+    for record, filter2_data in filtered:
+        try:
+            final_decision(record, filter2_data)
+        except NODECISION:
+            pass
+    stages['final_decision'] = timed(len(filtered), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = [(payroll_rowid, record, match_record(quota_index, record))
+               for payroll_rowid, record in records]
+    stages['match_record'] = timed(len(results), time.perf_counter() - start)
+    statuses = Counter(result.status for _, _, result in results)
+
+    start = time.perf_counter()
+    writer = MatchResultWriter("benchmark", commit_interval=commit_interval)
+    for payroll_rowid, record, result in results:
+        writer.add(payroll_rowid, result, record)
+    writer.close()
+    stages['result_writing'] = timed(len(results), time.perf_counter() - start)
+
+    return quota_index, stages, dict(statuses), cache_info
+
+
+def benchmark_engines(quota_index, engines):
+    """
+    Time complete batch runs (matching and the per-record report, written to
+    /dev/null) with each engine.
+
+    Returns:
+        dict: Engine name -> stage entry with the success/skip/error counts
+    """
+    timings = {}
+    for engine in engines:
+        counters = BatchCounters()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            process_results(ENGINES[engine](quota_index), counters)
+            elapsed = time.perf_counter() - start
+        timings[engine] = timed(counters.processed_count, elapsed)
+        timings[engine].update(success=counters.success_count, skip=counters.skip_count,
+                               error=counters.error_count)
+    return timings
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="端到端性能基准测试 (合成数据)")
+    parser.add_argument("--db", default=None,
+                        help="合成数据库路径 (默认: 临时文件, 结束后删除)")
+    parser.add_argument("--reuse", action="store_true",
+                        help="直接使用 --db 指定的已有数据库, 不重新生成")
+    parser.add_argument("--payroll-rows", type=int, default=100000,
+                        help="工资记录数 (默认: 100000)")
+    parser.add_argument("--quota-rows", type=int, default=5000,
+                        help="定额记录数 (默认: 5000)")
+    parser.add_argument("--ambiguity", type=float, default=0.02,
+                        help="与已有定额键重复的定额记录比例 (默认: 0.02)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 (默认: 0)")
+    parser.add_argument("--engines", default="python,sql,columnar",
+                        help="要计时的引擎, 逗号分隔 (默认: python,sql,columnar)")
+    parser.add_argument("--commit-interval", type=int, default=50000,
+                        help="结果写入阶段每个事务的记录数 (默认: 50000)")
+    parser.add_argument("--output", default="-",
+                        help="JSON 结果文件 (默认: - 输出到标准输出)")
+    args = parser.parse_args(argv)
+    args.engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    unknown = [engine for engine in args.engines if engine not in ENGINES]
+    if unknown:
+        parser.error(f"未知引擎: {', '.join(unknown)}")
+    if args.reuse and args.db is None:
+        parser.error("--reuse 需要 --db")
+    return args
+
+
+def main(argv=None):
+    """Generate (or reuse) the synthetic database, run the benchmark, write JSON"""
+    args = parse_args(argv)
+
+    temp_dir = None
+    db_path = args.db
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+
+    # Every module resolves config.DATABASE_PATH at call time
+    original_path = config.DATABASE_PATH
+    config.DATABASE_PATH = db_path
+    try:
+        if not args.reuse:
+            progress(f"正在生成合成数据库 {db_path} ...")
+            start = time.perf_counter()
+            generate_database(db_path, args.payroll_rows, args.quota_rows,
+                              args.ambiguity, args.seed)
+            progress(f"生成完成 ({time.perf_counter() - start:.1f} 秒)")
+
+        with sqlite3.connect(db_path) as conn:
+            payroll_count = conn.execute("SELECT COUNT(*) FROM payroll_details").fetchone()[0]
+            quota_count = conn.execute("SELECT COUNT(*) FROM quota").fetchone()[0]
+        conn.close()
+
+        progress("正在计时各阶段 ...")
+        quota_index, stages, statuses, cache_info = benchmark_stages(args.commit_interval)
+        progress("正在计时各引擎 ...")
+        engines = benchmark_engines(quota_index, args.engines)
+    finally:
+        config.DATABASE_PATH = original_path
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    report = {
+        'database': {
+            'path': None if temp_dir is not None else db_path,
+            'payroll_rows': payroll_count,
+            'quota_rows': quota_count,
+            'ambiguity': None if args.reuse else args.ambiguity,
+            'seed': None if args.reuse else args.seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'stages': stages,
+        'engines': engines,
+        'statuses': statuses,
+        'effected_from_cache': cache_info,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        progress(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
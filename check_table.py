@@ -5,12 +5,12 @@ import os
 
 # Add the parent directory to the path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import DATABASE_PATH
+from db import connect
 
 def check_table_structure():
     """Check the structure of the payroll_details table"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = connect(row_factory=None)
         cursor = conn.cursor()
         
         # Get table structure
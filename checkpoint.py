@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checkpointed Matching
+Match payroll records one 文件名 partition at a time, committing each
+partition's decisions together with a checkpoint row, so an interrupted
+run can be resumed from the first unfinished partition
+"""
+
+import sys
+import os
+import time
+from datetime import datetime
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from match import match_record
+from records import PayrollRecord
+
+SCHEMA = """
+-- Partitions (文件名) completed by a checkpointed run, with their counters
+CREATE TABLE IF NOT EXISTS match_checkpoints (
+    run_id INTEGER NOT NULL,
+    文件名 TEXT,
+    processed_count INTEGER,
+    success_count INTEGER,
+    skip_count INTEGER,
+    error_count INTEGER,
+    near_miss_count INTEGER,
+    finished_at TEXT,
+    PRIMARY KEY (run_id, 文件名)
+);
+"""
+
+# Every partition with its size, in the order of its first record
+PARTITIONS_QUERY = """
+    SELECT 文件名, COUNT(*) FROM payroll_details
+    GROUP BY 文件名
+    ORDER BY MIN(rowid)
+"""
+
+# Records of one partition (IS also selects the NULL 文件名 partition)
+PARTITION_RECORDS_QUERY = "SELECT rowid, * FROM payroll_details WHERE 文件名 IS ? ORDER BY rowid"
+
+# Counters stored per partition, as BatchCounters attribute names
+COUNTER_NAMES = ('processed_count', 'success_count', 'skip_count', 'error_count',
+                 'near_miss_count')
+
+# Rows fetched per fetchmany() call
+FETCH_BATCH_SIZE = 1000
+
+
+class CheckpointStats:
+    """Partition counts of a checkpointed run"""
+
+    def __init__(self):
+        self.run_id = None
+        self.partition_count = 0
+        self.resumed_count = 0
+        self.completed_count = 0
+        # Set when the run stopped at its time limit with partitions left
+        self.stopped = False
+
+
+def unfinished_run(conn):
+    """
+    The latest checkpointed run that did not finish, or None
+    """
+    conn.executescript(SCHEMA)
+    return conn.execute(
+        "SELECT MAX(r.run_id) FROM match_runs r "
+        "WHERE r.finished_at IS NULL "
+        "AND EXISTS (SELECT 1 FROM match_checkpoints c WHERE c.run_id = r.run_id)"
+    ).fetchone()[0]
+
+
+def completed_partitions(conn, run_id):
+    """
+    Partitions already completed by a run
+
+    Returns:
+        dict: 文件名 -> tuple of the COUNTER_NAMES values
+    """
+    return {
+        row[0]: tuple(row[1:])
+        for row in conn.execute(
+            f"SELECT 文件名, {', '.join(COUNTER_NAMES)} FROM match_checkpoints WHERE run_id = ?",
+            (run_id,)
+        )
+    }
+
+
+def _partition_records(conn, file_name):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(PARTITION_RECORDS_QUERY, (file_name,))
+    record_class = PayrollRecord.for_columns(
+        [description[0] for description in cursor.description][1:]
+    )
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            yield row[0], record_class(*row[1:])
+
+
+def checkpointed_results(quota_index, writer, counters, stats, time_limit=None):
+    """
+    Match payroll records partition by partition, checkpointing each one.
+
+    A partition is every record of one 文件名.  Once the consumer has
+    counted and written a partition's last result, the partition's rows and
+    its checkpoint row are committed in one transaction; the writer's
+    interval commits are turned off, so no partition is committed in part.  Partitions already
+    completed by the writer's run are skipped and their stored counters are
+    added to `counters`.
+
+    Args:
+        quota_index (QuotaIndex): Quota index from load_quota_index()
+        writer (MatchResultWriter): Writer of the run (a resumed run reuses its run_id);
+            its commit_interval is set to None
+        counters (BatchCounters): Counters updated by the consumer (process_results())
+        stats (CheckpointStats): Filled with the partition counts
+        time_limit (float, optional): Stop after the first partition that ends
+            once this many seconds have elapsed, leaving the run resumable
+
+    Yields:
+        tuple: (payroll rowid, payroll_record, MatchResult), partition by partition
+    """
+    start = time.monotonic()
+    stats.run_id = writer.run_id
+    writer.commit_interval = None
+    writer.conn.executescript(SCHEMA)
+    done = completed_partitions(writer.conn, writer.run_id)
+
+    conn = connect()
+    try:
+        partitions = conn.execute(PARTITIONS_QUERY).fetchall()
+        stats.partition_count = len(partitions)
+        for file_name, _ in partitions:
+            if file_name in done:
+                for name, value in zip(COUNTER_NAMES, done[file_name]):
+                    setattr(counters, name, getattr(counters, name) + value)
+                stats.resumed_count += 1
+                continue
+            # Each session completes at least one partition
+            if (time_limit is not None and stats.completed_count
+                    and time.monotonic() - start >= time_limit):
+                stats.stopped = True
+                return
+
+            before = [getattr(counters, name) for name in COUNTER_NAMES]
+            for payroll_rowid, payroll_record in _partition_records(conn, file_name):
+                yield payroll_rowid, payroll_record, match_record(quota_index, payroll_record)
+
+            # The consumer has handled the whole partition: commit it atomically
+            writer.flush()
+            writer.conn.execute(
+                f"INSERT OR REPLACE INTO match_checkpoints (run_id, 文件名, "
+                f"{', '.join(COUNTER_NAMES)}, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (writer.run_id, file_name,
+                 *[getattr(counters, name) - value for name, value in zip(COUNTER_NAMES, before)],
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+            writer.commit()
+            stats.completed_count += 1
+    finally:
+        conn.close()
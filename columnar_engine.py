@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Columnar Matching Engine
+Resolve every payroll record with pandas merges and groupby counts
+"""
+
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import category_mapping, calculate_effected_from
+from db import connect
+from payroll_generator import payroll_rowid_bounds, read_payroll
+from match import (match_record, MatchResult, MATCH_SUCCESS, MATCH_SKIP_ZERO,
+                   MATCH_NO_MATCH)
+
+# Status of rows that need match_record() for their diagnostics
+FALLBACK = 'fallback'
+
+# Number of rowids per query when re-reading fallback rows
+FALLBACK_BATCH_SIZE = 500
+
+# Payroll rows fetched per batch when loading the payroll frame
+READ_BATCH_SIZE = 10000
+
+# Payroll columns reported for every record by batch_matching.report_result
+SUMMARY_COLUMNS = ['文件名', 'sheet名', '职员全名', '定额']
+
+QUOTA_QUERY = "SELECT 类别1, effected_from, 定额, 代码 FROM quota"
+
+
+def category_mapping_frame():
+    """
+    Explode category_mapping into a join table.
+
+    Returns:
+        DataFrame: Distinct (sheet名, effected_from, 类别1) rows
+    """
+    return pd.DataFrame(
+        [
+            (sheet_name, effected_from, category)
+            for sheet_name, date_mapping in category_mapping.items()
+            for effected_from, categories in date_mapping.items()
+            for category in categories
+        ],
+        columns=['sheet名', 'effected_from', '类别1'],
+    ).drop_duplicates()
+
+
+def _resolve_effected_from(file_name, sheet_name):
+    """calculate_effected_from, or None when it cannot be resolved"""
+    try:
+        return calculate_effected_from(file_name, sheet_name)
+    except Exception:
+        return None
+
+
+def match_frame(payroll, quota):
+    """
+    Classify every payroll row at once.
+
+    Args:
+        payroll (DataFrame): Payroll rows with at least 文件名, sheet名 and 定额
+        quota (DataFrame): Quota rows with at least 类别1, effected_from, 定额 and 代码
+
+    Returns:
+        DataFrame: payroll with effected_from, filter1_count, filter2_count,
+        code and status columns added, in the original row order.  status is
+        one of the match.MATCH_* values, or FALLBACK for rows (unresolvable
+        effected_from, several candidates) whose diagnostics come from
+        match_record().
+    """
+    # effected_from only depends on (文件名, sheet名): resolve each pair once
+    keys = payroll[['文件名', 'sheet名']].drop_duplicates()
+    keys['effected_from'] = [
+        _resolve_effected_from(file_name, sheet_name)
+        for file_name, sheet_name in zip(keys['文件名'], keys['sheet名'])
+    ]
+    result = payroll.merge(keys, on=['文件名', 'sheet名'], how='left')
+
+    candidates = category_mapping_frame().merge(
+        quota[['类别1', 'effected_from', '定额', '代码']],
+        on=['effected_from', '类别1'],
+    )
+    filter1 = (
+        candidates.groupby(['sheet名', 'effected_from'])
+        .size()
+        .rename('filter1_count')
+        .reset_index()
+    )
+    filter2 = (
+        candidates.groupby(['sheet名', 'effected_from', '定额'], dropna=False)
+        .agg(filter2_count=('代码', 'size'), code=('代码', 'first'))
+        .reset_index()
+    )
+    result = result.merge(filter1, on=['sheet名', 'effected_from'], how='left')
+    result = result.merge(filter2, on=['sheet名', 'effected_from', '定额'], how='left')
+
+    result['filter1_count'] = result['filter1_count'].fillna(0).astype('int64')
+    result['filter2_count'] = result['filter2_count'].fillna(0).astype('int64')
+
+    resolved = result['effected_from'].notna()
+    result['status'] = np.select(
+        [
+            result['定额'] == 0,
+            resolved & (result['filter2_count'] == 0),
+            resolved & (result['filter2_count'] == 1) & result['code'].notna(),
+        ],
+        [MATCH_SKIP_ZERO, MATCH_NO_MATCH, MATCH_SUCCESS],
+        default=FALLBACK,
+    )
+    return result
+
+
+def load_frames(conn, first_rowid, last_rowid):
+    """
+    Load payroll_details (within a rowid range) and quota into DataFrames.
+    Only the payroll columns needed for matching and reporting are read.
+
+    定额 is made numeric for the merges; rows whose 定额 is not stored as a
+    REAL (or NULL) value are flagged irregular and matched by match_record(),
+    like the irregular rows of the column cache.
+
+    Returns:
+        tuple: (payroll, quota); payroll carries its rowid in payroll_rowid
+        and the irregular flag
+    """
+    payroll_columns = {name: [] for name in ['payroll_rowid'] + SUMMARY_COLUMNS}
+    for batch in read_payroll(columns=SUMMARY_COLUMNS, rowid_range=(first_rowid, last_rowid),
+                              with_rowid=True, row_format='columns', batches=True,
+                              batch_size=READ_BATCH_SIZE, conn=conn):
+        for values, target in zip(batch.values(), payroll_columns.values()):
+            target.extend(values)
+    quota_values = payroll_columns['定额']
+    payroll_columns['irregular'] = [value is not None and type(value) is not float
+                                    for value in quota_values]
+    payroll_columns['定额'] = pd.to_numeric(pd.Series(quota_values, dtype=object),
+                                          errors='coerce')
+    payroll = pd.DataFrame(payroll_columns)
+    quota = pd.read_sql_query(QUOTA_QUERY, conn)
+    return payroll, quota
+
+
+def column_frames(conn, columns, limit=None):
+    """
+    Build the payroll DataFrame from the memory-mapped column cache
+    (payroll_columns.py) instead of reading payroll_details, and load quota.
+
+    Returns:
+        tuple: (payroll, quota); payroll also carries the cache's irregular flag
+    """
+    count = len(columns) if limit is None else max(0, min(limit, len(columns)))
+    arrays = columns.arrays
+    payroll = pd.DataFrame({
+        'payroll_rowid': arrays['rowid'][:count],
+        '文件名': np.array(columns.files, dtype=object)[arrays['file'][:count]],
+        'sheet名': np.array(columns.sheets, dtype=object)[arrays['sheet'][:count]],
+        '职员全名': np.array(columns.employees, dtype=object)[arrays['employee'][:count]],
+        '定额': arrays['quota'][:count],
+        'irregular': arrays['irregular'][:count],
+    })
+    quota = pd.read_sql_query(QUOTA_QUERY, conn)
+    return payroll, quota
+
+
+def _python_values(series):
+    """Column values as Python objects, with missing values as None"""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _fetch_payroll_records(conn, rowids):
+    """Re-read full payroll records by rowid, exactly as the generator returns them"""
+    records = {}
+    for start in range(0, len(rowids), FALLBACK_BATCH_SIZE):
+        batch = rowids[start:start + FALLBACK_BATCH_SIZE]
+        placeholders = ", ".join("?" * len(batch))
+        cursor = conn.execute(
+            f"SELECT rowid, * FROM payroll_details WHERE rowid IN ({placeholders})", batch
+        )
+        columns = [description[0] for description in cursor.description][1:]
+        for row in cursor:
+            records[row[0]] = dict(zip(columns, row[1:]))
+    return records
+
+
+def columnar_match_records(quota_index, limit=None, conn=None, columns=None):
+    """
+    Match payroll records with the columnar engine.
+
+    Args:
+        quota_index (QuotaIndex): Quota index used for the fallback rows and
+            the near-miss check of unmatched rows
+        limit (int, optional): Only match the first `limit` records
+        conn (sqlite3.Connection, optional): Connection to use; a read-only
+            connection is opened (and closed) when not given
+        columns (PayrollColumns, optional): Read the payroll columns from
+            the column cache (payroll_columns.py) instead of the table
+
+    Yields:
+        tuple: (payroll rowid, payroll summary, MatchResult) in rowid order; the summary holds
+        文件名, sheet名, 职员全名 and 定额, or the full record for fallback rows
+    """
+    if columns is None:
+        bounds = payroll_rowid_bounds(limit)
+        if bounds is None:
+            return
+        first_rowid, last_rowid, _ = bounds
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
+        if columns is None:
+            payroll, quota = load_frames(conn, first_rowid, last_rowid)
+        else:
+            payroll, quota = column_frames(conn, columns, limit)
+        result = match_frame(payroll, quota)
+        # A 定额 not stored as REAL is matched from the full record
+        result.loc[result['irregular'], 'status'] = FALLBACK
+
+        fallback_rowids = result.loc[result['status'] == FALLBACK, 'payroll_rowid'].tolist()
+        fallback_records = _fetch_payroll_records(conn, fallback_rowids)
+
+        columns = [_python_values(result[column]) for column in SUMMARY_COLUMNS]
+        rows = zip(
+            result['payroll_rowid'].tolist(),
+            result['status'].tolist(),
+            _python_values(result['effected_from']),
+            result['filter1_count'].tolist(),
+            result['filter2_count'].tolist(),
+            _python_values(result['code']),
+            *columns,
+        )
+        for payroll_rowid, status, effected_from, filter1_count, filter2_count, code, *values in rows:
+            if status == FALLBACK:
+                payroll_record = fallback_records[payroll_rowid]
+                yield payroll_rowid, payroll_record, match_record(quota_index, payroll_record)
+                continue
+
+            summary = dict(zip(SUMMARY_COLUMNS, values))
+            if status == MATCH_SKIP_ZERO:
+                match_result = MatchResult(status, None, None, None, None, None)
+            elif status == MATCH_NO_MATCH:
+                near_miss = quota_index.near_miss(summary['sheet名'], effected_from,
+                                                  summary['定额'], [])
+                match_result = MatchResult(status, effected_from, filter1_count, 0, None, None,
+                                           near_miss)
+            else:
+                match_result = MatchResult(status, effected_from, filter1_count, 1, code, None)
+            yield payroll_rowid, summary, match_result
+    finally:
+        if own_conn:
+            conn.close()
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import bisect
+import functools
 import os
+import re
 from pathlib import Path
 
 # Configuration file for the quota processing system
@@ -22,6 +25,27 @@ TRANSLATION_DICT = str(CURRENT_DIR.parent / "common" / "translation_dict.pkl")
 # 绕嵌排 对应 绕嵌排
 # 19000101 TODO
 
+# 定额 comparison of filter 2: exact by default.  QUOTA_TOLERANCE matches
+# values within an absolute difference; QUOTA_ROUND_DIGITS matches values
+# equal after rounding to that many decimals (use one or the other)
+QUOTA_TOLERANCE = 0.0
+QUOTA_ROUND_DIGITS = None
+
+# In exact mode, unmatched 定额 values this close to a quota value are
+# reported as near misses
+QUOTA_NEAR_MISS_WINDOW = 0.01
+
+# Matches the leading YYYYMM of a payroll file name
+_FILE_MONTH_RE = re.compile(r'^(\d{6})')
+
+# Upper bound on memoized (YYYYMM, sheet名) pairs; only a few hundred occur in practice
+EFFECTED_FROM_CACHE_SIZE = 4096
+
+# sheet名 -> (sorted YYYYMM ints, matching date strings, earliest date string),
+# built from category_mapping by compile_category_mapping()
+_compiled_mapping = {}
+
+
 def calculate_effected_from(file_name, sheet_name):
     """
     Calculate the effected_from value based on file_name and sheet_name.
@@ -37,14 +61,19 @@ def calculate_effected_from(file_name, sheet_name):
     """
     # Extract year and month from filename (first 6 characters)
     # Handle patterns like YYYYMM.xls, YYYYMM_x.xls, YYYYMM.xlsx, YYYYMM_x.xlsx
-    import re
-    
-    # Extract the first 6 digits from the filename
-    match = re.search(r'^(\d{6})', file_name)
+    match = _FILE_MONTH_RE.search(file_name)
     if not match:
         raise ValueError(f"Cannot extract year and month from filename: {file_name}")
     
-    yyyymm = match.group(1)
+    return _resolve_effected_from(match.group(1), sheet_name)
+
+
+@functools.lru_cache(maxsize=EFFECTED_FROM_CACHE_SIZE)
+def _resolve_effected_from(yyyymm, sheet_name):
+    """
+    Resolve the effected_from date for a YYYYMM string and sheet name.
+    Results are memoized; invalid sheet names raise and are not cached.
+    """
     year = int(yyyymm[:4])
     month = int(yyyymm[4:6])
     
@@ -52,32 +81,64 @@ def calculate_effected_from(file_name, sheet_name):
     target_date = year * 100 + month
     
     # Check if sheet_name exists in category_mapping
-    if sheet_name not in category_mapping:
+    if sheet_name not in _compiled_mapping:
         raise ValueError(f"Sheet name '{sheet_name}' not found in category_mapping")
     
-    # Get available date keys for this sheet
-    available_dates = list(category_mapping[sheet_name].keys())
-    
-    # Convert date strings to integers and extract YYYYMM part for comparison
-    date_ints = [int(date[:6]) for date in available_dates]
+    date_ints, date_strs, earliest = _compiled_mapping[sheet_name]
     
     # Find the largest date that is <= target_date
-    valid_dates = [date for date in date_ints if date <= target_date]
-    
-    if not valid_dates:
+    position = bisect.bisect_right(date_ints, target_date)
+    if position == 0:
         # If no valid dates found, use the earliest available date
-        return min(available_dates)
+        if earliest is None:
+            raise ValueError(f"Sheet name '{sheet_name}' has no dates in category_mapping")
+        return earliest
     
     # Return the largest valid date (most recent that is <= target_date)
-    max_valid_date = max(valid_dates)
+    return date_strs[position - 1]
+
+
+def compile_category_mapping():
+    """
+    Compile category_mapping into per-sheet sorted arrays for bisect lookups
+    and reset the effected_from cache.  Call again after changing
+    category_mapping at runtime.
+    """
+    compiled = {}
+    for sheet_name, date_mapping in category_mapping.items():
+        by_month = {}
+        for date_str in date_mapping:
+            # When several dates share a YYYYMM, the first configured one wins
+            by_month.setdefault(int(date_str[:6]), date_str)
+        date_ints = sorted(by_month)
+        compiled[sheet_name] = (
+            date_ints,
+            [by_month[date_int] for date_int in date_ints],
+            min(date_mapping) if date_mapping else None,
+        )
     
-    # Find the original date string that matches the YYYYMM part
-    for date_str in available_dates:
-        if int(date_str[:6]) == max_valid_date:
-            return date_str
+    _compiled_mapping.clear()
+    _compiled_mapping.update(compiled)
+    _resolve_effected_from.cache_clear()
+
+
+def effected_from_cache_info():
+    """
+    Return hit/miss statistics of the effected_from cache.
     
-    # Fallback: return the earliest available date
-    return min(available_dates)
+    Returns:
+        dict: hits, misses, maxsize, currsize and hit_rate
+    """
+    info = _resolve_effected_from.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'maxsize': info.maxsize,
+        'currsize': info.currsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
+
 
 # the structure of the following dictionary
 # "精加工": the sheet name in the payroll file
@@ -104,3 +165,5 @@ category_mapping = {
         "20211201": ["绕嵌排"], 
           }
 }
+
+compile_category_mapping()
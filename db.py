@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Database Connections
+Shared, tuned SQLite connections for all modules
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+from urllib.parse import quote
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import config
+
+# Bytes of the database file SQLite may memory-map
+MMAP_SIZE = 1024 * 1024 * 1024
+
+# Page cache size in KiB (passed to SQLite as a negative cache_size)
+CACHE_SIZE_KIB = 256 * 1024
+
+
+def database_path(db_path=None):
+    """The database path, read from config at call time so it can be overridden"""
+    return db_path or config.DATABASE_PATH
+
+
+def apply_read_pragmas(conn):
+    """Apply the read performance pragmas (mmap, page cache, in-memory temp storage)"""
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def connect(readonly=True, db_path=None, query_only=None, row_factory=sqlite3.Row,
+            check_same_thread=True):
+    """
+    Open a tuned connection to the payroll database.
+
+    Args:
+        readonly (bool): Open read-only through a mode=ro URI
+        db_path (str, optional): Database path, config.DATABASE_PATH by default
+        query_only (bool, optional): Set PRAGMA query_only.  Defaults to
+            readonly; pass False for read-only connections that need temp tables.
+        row_factory: Row factory of the connection (sqlite3.Row by default)
+        check_same_thread (bool): Pass False when the connection is handed to
+            another thread (used by one thread at a time)
+
+    Returns:
+        sqlite3.Connection: The connection
+    """
+    path = database_path(db_path)
+    if readonly:
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                               check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    conn.row_factory = row_factory
+    apply_read_pragmas(conn)
+    if readonly if query_only is None else query_only:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+# Pooled connections of the current thread: (pid, {(path, readonly): connection})
+_pool = threading.local()
+
+
+def get_connection(readonly=True, db_path=None):
+    """
+    Return the pooled connection of the current thread and process, opening
+    it on first use.  Connections inherited across fork() are not reused.
+
+    Args:
+        readonly (bool): Read-only (query_only) or writable connection
+        db_path (str, optional): Database path, config.DATABASE_PATH by default
+
+    Returns:
+        sqlite3.Connection: The pooled connection; do not close it
+    """
+    pid = os.getpid()
+    if getattr(_pool, 'pid', None) != pid:
+        _pool.pid = pid
+        _pool.connections = {}
+
+    key = (database_path(db_path), readonly)
+    conn = _pool.connections.get(key)
+    if conn is None:
+        conn = connect(readonly=readonly, db_path=db_path)
+        _pool.connections[key] = conn
+    return conn
+
+
+def close_connections():
+    """Close the pooled connections of the current thread"""
+    if getattr(_pool, 'pid', None) == os.getpid():
+        for conn in _pool.connections.values():
+            conn.close()
+    _pool.connections = {}
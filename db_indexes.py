@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Database Indexes
+Create the indexes the matching queries rely on and verify with
+EXPLAIN QUERY PLAN that no query falls back to an unintended full scan
+"""
+
+import argparse
+import sqlite3
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from payroll_generator import build_payroll_query
+from sql_engine import (prepare_connection, payroll_columns, match_query,
+                        QUOTA_FILTER1_SELECT, QUOTA_FILTER2_SELECT)
+from incremental import STORED_RESULTS_QUERY
+from checkpoint import PARTITIONS_QUERY, PARTITION_RECORDS_QUERY
+
+# (index name, table, indexed columns, queries served)
+INDEXES = [
+    ("idx_payroll_file_sheet", "payroll_details", "文件名 COLLATE NOCASE, sheet名",
+     "文件名前缀 (LIKE) 及 sheet名 过滤"),
+    ("idx_payroll_sheet", "payroll_details", "sheet名",
+     "仅按 sheet名 过滤"),
+    ("idx_payroll_file", "payroll_details", "文件名",
+     "分区运行按 文件名 读取分区及列出分区"),
+    ("idx_quota_match", "quota", "类别1, effected_from, 定额, 代码",
+     "定额过滤 (类别1 + effected_from [+ 定额]), 覆盖 代码"),
+]
+
+# Rows sampled per index by ANALYZE, so it stays fast on large tables
+ANALYSIS_LIMIT = 1000
+
+
+def create_indexes(conn):
+    """Create the missing indexes and refresh the planner statistics"""
+    for name, table, columns, _ in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def existing_indexes(conn):
+    """Names of the indexes of payroll_details and quota"""
+    return {
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name IN ('payroll_details', 'quota')"
+        )
+    }
+
+
+def project_queries(conn):
+    """
+    The queries the project issues, with sample parameters.
+
+    Returns:
+        list: (name, sql, params, full scan intended) tuples
+    """
+    queries = []
+    for name, kwargs in [
+        ("工资记录 (文件名前缀)", {'file_name_prefix': '2020'}),
+        ("工资记录 (文件名前缀 + sheet名)", {'file_name_prefix': '2020', 'sheet_name': '绕嵌排'}),
+        ("工资记录 (sheet名)", {'sheet_name': '绕嵌排'}),
+        ("工资记录 (rowid 范围)", {'rowid_range': (1, 1000), 'with_rowid': True}),
+    ]:
+        sql, params = build_payroll_query(**kwargs)
+        queries.append((name, sql, params, False))
+
+    queries.append(("工资记录 (全表顺序读取)", *build_payroll_query(), True))
+    queries.append(("定额表 (全表读取)", "SELECT * FROM quota ORDER BY rowid", (), True))
+    # The SQL engine aggregates the whole quota table once per run
+    queries.append(("SQL引擎 过滤1 (定额表聚合)", QUOTA_FILTER1_SELECT, (), True))
+    queries.append(("SQL引擎 过滤2 (定额表聚合)", QUOTA_FILTER2_SELECT, (), True))
+    queries.append(("SQL引擎 匹配", match_query(payroll_columns(conn)), (1, 1000), False))
+    # Partitions are listed once per checkpointed run
+    queries.append(("分区运行 列出分区", PARTITIONS_QUERY, (), True))
+    queries.append(("分区运行 分区记录", PARTITION_RECORDS_QUERY, ("202005.xls",), False))
+
+    has_results = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'match_results'"
+    ).fetchone()
+    if has_results:
+        queries.append(("增量匹配 已存结果", STORED_RESULTS_QUERY, (1, 1000), False))
+    return queries
+
+
+def full_scans(plan):
+    """Plan lines that read a whole table or index (SCAN without a search key)"""
+    return [
+        detail for detail in plan
+        if detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+    ]
+
+
+def verify_plans(conn, verbose=False):
+    """
+    Print the plan of every project query and flag unintended full scans.
+
+    Returns:
+        int: Number of queries with an unintended full scan
+    """
+    prepare_connection(conn)
+    problems = 0
+    for name, sql, params, full_scan_intended in project_queries(conn):
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        scans = full_scans(plan)
+        sorts = [detail for detail in plan if detail.startswith("USE TEMP B-TREE")]
+
+        if scans and not full_scan_intended:
+            problems += 1
+            status = "全表扫描!"
+        elif scans:
+            status = "预期的全表扫描"
+        else:
+            status = "使用索引"
+        print(f"  {name:<28} {status}")
+        if verbose or (scans and not full_scan_intended):
+            for detail in plan:
+                print(f"      {detail}")
+        elif sorts:
+            for detail in sorts:
+                print(f"      {detail}")
+    return problems
+
+
+def main(argv=None):
+    """Create (or only check) the indexes and verify the query plans"""
+    parser = argparse.ArgumentParser(description="数据库索引管理与查询计划检查")
+    parser.add_argument("--check", action="store_true",
+                        help="只检查查询计划, 不创建索引")
+    parser.add_argument("--verbose", action="store_true",
+                        help="显示每个查询的完整查询计划")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("数据库索引 - Database Indexes")
+    print("=" * 60)
+
+    try:
+        if not args.check:
+            conn = connect(readonly=False)
+            try:
+                create_indexes(conn)
+            finally:
+                conn.close()
+
+        # Read-only, but the SQL engine queries need temp tables
+        conn = connect(query_only=False)
+        try:
+            present = existing_indexes(conn)
+            for name, table, columns, purpose in INDEXES:
+                mark = "已存在" if name in present else "缺失"
+                print(f"  [{mark}] {name} ON {table} ({columns})  -- {purpose}")
+            print("-" * 60)
+            print("查询计划检查:")
+            problems = verify_plans(conn, args.verbose)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return 1
+
+    print("-" * 60)
+    if problems:
+        print(f"{problems} 个查询存在意外的全表扫描")
+        return 1
+    print("所有查询均使用索引或预期的全表扫描")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Distinct-Key Matching
+Resolve every distinct (文件名 month, sheet名, 定额) key once and fan the
+decision back out to the payroll records sharing it
+"""
+
+import sys
+import os
+from collections import Counter
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from payroll_generator import payroll_rowid_bounds
+from match import match_record, NODECISION, MATCH_NODECISION
+from records import PayrollRecord
+
+# Matching key of a payroll record: the YYYYMM prefix of 文件名 (the whole
+# 文件名 when it has none, so its error message is kept), sheet名 and 定额
+KEY_MONTH_SQL = ("CASE WHEN {table}文件名 GLOB '[0-9][0-9][0-9][0-9][0-9][0-9]*' "
+                 "THEN substr({table}文件名, 1, 6) ELSE {table}文件名 END")
+
+# Rows fetched per fetchmany() call when fanning results out
+FETCH_BATCH_SIZE = 1000
+
+
+class DedupStats:
+    """Distinct-key and record counts of a deduplicated run"""
+
+    def __init__(self):
+        self.key_count = 0
+        self.row_count = 0
+        self.key_statuses = Counter()
+
+
+def resolve_keys(quota_index, conn, first_rowid, last_rowid, stats):
+    """
+    Collect the distinct matching keys of a rowid range into temp.dedup_keys
+    and match each key once.
+
+    Returns:
+        dict: dedup_keys rowid -> MatchResult of the key
+    """
+    # CREATE TABLE AS keeps the column affinities of payroll_details, so the
+    # join back can use the index on all three key columns
+    conn.execute("DROP TABLE IF EXISTS temp.dedup_keys")
+    conn.execute(f"""
+        CREATE TEMP TABLE dedup_keys AS
+        SELECT {KEY_MONTH_SQL.format(table='')} AS month, sheet名, 定额,
+               MIN(文件名) AS file_name, COUNT(*) AS row_count
+        FROM payroll_details
+        WHERE rowid BETWEEN ? AND ?
+        GROUP BY 1, 2, 3
+    """, (first_rowid, last_rowid))
+    conn.execute("CREATE INDEX temp.dedup_keys_key ON dedup_keys (month, sheet名, 定额)")
+
+    results = {}
+    for key_id, file_name, sheet_name, quota_value, row_count in conn.execute(
+            "SELECT rowid, file_name, sheet名, 定额, row_count FROM temp.dedup_keys"):
+        result = match_record(quota_index, {'文件名': file_name, 'sheet名': sheet_name,
+                                            '定额': quota_value})
+        results[key_id] = result
+        stats.key_count += 1
+        stats.row_count += row_count
+        stats.key_statuses[result.status] += 1
+    return results
+
+
+def dedup_results(quota_index, limit=None, stats=None):
+    """
+    Match payroll records by distinct key.
+
+    Each distinct (文件名 month, sheet名, 定额) key is matched once; the key
+    results are then joined back to payroll_details.  Undecided records get
+    their own NODECISION (with their own record) so messages are unchanged.
+
+    Args:
+        quota_index (QuotaIndex): Quota index from load_quota_index()
+        limit (int, optional): Only match the first `limit` records
+        stats (DedupStats, optional): Filled with the key and record counts
+
+    Yields:
+        tuple: (payroll rowid, payroll_record, MatchResult) in rowid order
+    """
+    if stats is None:
+        stats = DedupStats()
+    bounds = payroll_rowid_bounds(limit)
+    if bounds is None:
+        return
+    first_rowid, last_rowid, _ = bounds
+
+    # Read-only, but the key table is a temp table
+    conn = connect(query_only=False)
+    try:
+        key_results = resolve_keys(quota_index, conn, first_rowid, last_rowid, stats)
+
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f"""
+            SELECT k.rowid, p.rowid, p.*
+            FROM payroll_details p
+            JOIN temp.dedup_keys k
+              ON k.month IS {KEY_MONTH_SQL.format(table='p.')}
+             AND k.sheet名 IS p.sheet名 AND k.定额 IS p.定额
+            WHERE p.rowid BETWEEN ? AND ?
+            ORDER BY p.rowid
+        """, (first_rowid, last_rowid))
+        record_class = PayrollRecord.for_columns(
+            [description[0] for description in cursor.description][2:]
+        )
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                result = key_results[row[0]]
+                payroll_record = record_class(*row[2:])
+                if result.status == MATCH_NODECISION:
+                    result = result._replace(
+                        message=NODECISION(payroll_record, result.message.filter2_data)
+                    )
+                yield row[1], payroll_record, result
+    finally:
+        conn.close()
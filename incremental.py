@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental Matching
+Select only the payroll records whose decision may have changed since the
+last run that wrote match_results
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from payroll_generator import payroll_rowid_bounds, payroll_records_by_rowid
+from match import match_record
+from results_store import payroll_content_hash
+
+# Key columns of the already matched records with their stored result
+STORED_RESULTS_QUERY = """
+    SELECT p.rowid, p.文件名, p.sheet名, p.定额, r.content_hash,
+           r.status, r.effected_from, r.filter1_count, r.filter2_count, r.代码
+    FROM payroll_details p
+    LEFT JOIN match_results r ON r.payroll_rowid = p.rowid
+    WHERE p.rowid BETWEEN ? AND ?
+    ORDER BY p.rowid
+"""
+
+
+class IncrementalStats:
+    """Counters of the selection phase of an incremental run"""
+
+    def __init__(self):
+        self.watermark = None
+        self.new_count = 0
+        self.changed_count = 0
+        self.quota_changed_count = 0
+        self.unchanged_count = 0
+
+
+def last_watermark(conn):
+    """
+    Highest payroll rowid covered by a finished run, or None before the first run
+    """
+    return conn.execute(
+        "SELECT MAX(watermark) FROM match_runs WHERE finished_at IS NOT NULL"
+    ).fetchone()[0]
+
+
+def select_rowids(quota_index, conn, first_rowid, last_rowid, stats):
+    """
+    Return the payroll rowids that have to be (re-)matched.
+
+    A record is selected when it is new (above the watermark or without a
+    stored result), when its 文件名/sheet名/定额 changed (content hash), or
+    when its quota candidates changed: the stored effected_from, filter counts,
+    代码 and status differ from what the current quota index gives for the
+    record's key.  The current answer is computed once per distinct key.
+    """
+    watermark = last_watermark(conn) or 0
+    stats.watermark = watermark
+    selected = []
+
+    # Rows above the watermark have never been matched
+    for (payroll_rowid,) in conn.execute(
+            "SELECT rowid FROM payroll_details WHERE rowid BETWEEN ? AND ? ORDER BY rowid",
+            (max(first_rowid, watermark + 1), last_rowid)):
+        selected.append(payroll_rowid)
+        stats.new_count += 1
+
+    expected_by_key = {}
+    cursor = conn.execute(STORED_RESULTS_QUERY, (first_rowid, min(last_rowid, watermark)))
+    for payroll_rowid, file_name, sheet_name, quota_value, stored_hash, *stored in cursor:
+        key_record = {'文件名': file_name, 'sheet名': sheet_name, '定额': quota_value}
+        if stored_hash is None:
+            stats.new_count += 1
+        elif stored_hash != payroll_content_hash(key_record):
+            stats.changed_count += 1
+        else:
+            key = (file_name, sheet_name, quota_value)
+            if key not in expected_by_key:
+                result = match_record(quota_index, key_record)
+                expected_by_key[key] = [result.status, result.effected_from,
+                                        result.filter1_count, result.filter2_count, result.code]
+            if stored == expected_by_key[key]:
+                stats.unchanged_count += 1
+                continue
+            stats.quota_changed_count += 1
+        selected.append(payroll_rowid)
+
+    selected.sort()
+    return selected
+
+
+def incremental_results(quota_index, limit=None, stats=None):
+    """
+    Match only new or changed payroll records.
+
+    Args:
+        quota_index (QuotaIndex): Quota index from load_quota_index()
+        limit (int, optional): Only consider the first `limit` records
+        stats (IncrementalStats, optional): Filled with the selection counters
+
+    Yields:
+        tuple: (payroll rowid, payroll_record, MatchResult) in rowid order
+    """
+    if stats is None:
+        stats = IncrementalStats()
+    bounds = payroll_rowid_bounds(limit)
+    if bounds is None:
+        return
+    first_rowid, last_rowid, _ = bounds
+
+    conn = connect()
+    try:
+        rowids = select_rowids(quota_index, conn, first_rowid, last_rowid, stats)
+        for payroll_rowid, payroll_record in payroll_records_by_rowid(rowids, conn):
+            yield payroll_rowid, payroll_record, match_record(quota_index, payroll_record)
+    finally:
+        conn.close()
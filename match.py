@@ -5,12 +5,16 @@ Match payroll records with quota data
 
 import sys
 import os
+from collections import namedtuple
 
 # Add the current directory to the path to import local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from query_quota_table import query_quota_table
-from payroll_generator import payroll_records_gen, format_record
-from config import category_mapping, calculate_effected_from
+from payroll_generator import format_record
+from config import calculate_effected_from
+from quota_index import QuotaIndex
+from quota_cache import load_quota_index
+from prefetch import Prefetcher
+from payroll_cursor import PayrollCursor
 
 
 def filter_quota_data(quota_data, payroll_record, file_name):
@@ -18,13 +22,17 @@ def filter_quota_data(quota_data, payroll_record, file_name):
     Filter quota data based on payroll record information
     
     Args:
-        quota_data (list): List of quota data dictionaries
+        quota_data (QuotaIndex or list): Quota index from load_quota_index(),
+            or a plain list of quota data dictionaries (indexed on the fly)
         payroll_record (dict): Payroll record from generator
         file_name (str): The filename being processed
         
     Returns:
         tuple: (filter1_count, filter2_count, filtered_data)
     """
+    if not isinstance(quota_data, QuotaIndex):
+        quota_data = QuotaIndex(quota_data)
+    
     # Get sheet name from payroll record
     sheet_name = payroll_record['sheet名']
     
@@ -33,37 +41,31 @@ def filter_quota_data(quota_data, payroll_record, file_name):
     # print the value of effected_from
     print(f"the value of {effected_from =}")
     
-    
     # Filter 1: quota_data[类别1] in category_mapping[sheet名][effected_from]
     # and quota_data[effected_from] == effected_from
-    
-    if sheet_name in category_mapping and effected_from in category_mapping[sheet_name]:
-        valid_categories = category_mapping[sheet_name][effected_from]
-    else:
-        valid_categories = []
-    
-    filter1_data = []
-    for item in quota_data:
-        if (item.get('类别1') in valid_categories and 
-            item.get('effected_from') == effected_from):
-            filter1_data.append(item)
-    
-    filter1_count = len(filter1_data)
-    
     # Filter 2: quota_data[定额] == returned_record[定额]
-    filter2_data = []
-    for item in filter1_data:
-        if item.get('定额') == payroll_record['定额']:
-            filter2_data.append(item)
-    
-    filter2_count = len(filter2_data)
-    
-    return filter1_count, filter2_count, filter2_data
+    return quota_data.lookup(sheet_name, effected_from, payroll_record['定额'])
 
 
 class NODECISION(Exception):
-    """Exception raised when no single decision can be made"""
-    pass
+    """
+    Exception raised when no single decision can be made.
+
+    The message embeds the payroll record and every candidate, so it is only
+    formatted when the exception is converted to a string.
+    """
+
+    def __init__(self, payroll_record, filter2_data):
+        super().__init__(payroll_record, filter2_data)
+        self.payroll_record = payroll_record
+        self.filter2_data = filter2_data
+
+    def __str__(self):
+        return (
+            f"Cannot make decision - found {len(self.filter2_data)} matching records\n"
+            f"Payroll Record: {self.payroll_record}\n"
+            f"Filtered Data: {self.filter2_data}"
+        )
 
 
 def final_decision(payroll_record, filter2_data):
@@ -83,12 +85,193 @@ def final_decision(payroll_record, filter2_data):
     if len(filter2_data) == 1:
         return filter2_data[0]['代码']
     else:
-        raise NODECISION(
-            f"Cannot make decision - found {len(filter2_data)} matching records\n"
-            f"Payroll Record: {payroll_record}\n"
-            f"Filtered Data: {filter2_data}"
+        raise NODECISION(payroll_record, filter2_data)
+
+
+
+# Match status of a single payroll record, as reported by batch processing
+MATCH_SUCCESS = 'success'        # exactly one quota record matched
+MATCH_SKIP_ZERO = 'skip_zero'    # 定额 is 0, matching skipped
+MATCH_NO_MATCH = 'no_match'      # no quota record passed both filters
+MATCH_NODECISION = 'nodecision'  # more than one quota record passed both filters
+MATCH_ERROR = 'error'            # matching raised an error
+
+# message is the error text, or the NODECISION exception itself for undecided
+# records: str(message) formats the full text only when it is shown.
+# near_miss: no quota 定额 equals the payroll 定额 exactly but one is close
+# (see QuotaIndex.near_miss)
+MatchResult = namedtuple(
+    'MatchResult',
+    ['status', 'effected_from', 'filter1_count', 'filter2_count', 'code', 'message',
+     'near_miss'],
+    defaults=(False,)
+)
+
+
+class BatchCounters:
+    """Success/skip/error counters of a batch run"""
+
+    def __init__(self):
+        self.processed_count = 0
+        self.success_count = 0
+        self.skip_count = 0
+        self.error_count = 0
+        self.near_miss_count = 0
+
+    def add(self, result):
+        """Count one MatchResult"""
+        self.processed_count += 1
+        if result.status == MATCH_SUCCESS:
+            self.success_count += 1
+        elif result.status in (MATCH_SKIP_ZERO, MATCH_NO_MATCH):
+            self.skip_count += 1
+        else:
+            self.error_count += 1
+        if result.near_miss:
+            self.near_miss_count += 1
+
+
+def match_record(quota_index, payroll_record, clock=None):
+    """
+    Run both filters and the final decision for one payroll record without
+    printing anything.
+    
+    Args:
+        quota_index (QuotaIndex): Quota index from load_quota_index()
+        payroll_record (dict): Payroll record from generator
+        clock (metrics.StageClock, optional): Lapped after calculating
+            effected_from ('effected_from'), the quota filters ('filter') and
+            the final decision ('decision')
+        
+    Returns:
+        MatchResult: The status, the intermediate filter counts and either the
+        decision code or the error message
+    """
+    if payroll_record['定额'] == 0:
+        return MatchResult(MATCH_SKIP_ZERO, None, None, None, None, None)
+    
+    effected_from = filter1_count = filter2_count = None
+    try:
+        sheet_name = payroll_record['sheet名']
+        effected_from = calculate_effected_from(payroll_record['文件名'], sheet_name)
+        if clock is not None:
+            clock.lap('effected_from')
+        filter1_count, filter2_count, filtered_data = quota_index.lookup(
+            sheet_name, effected_from, payroll_record['定额']
         )
+        near_miss = quota_index.near_miss(sheet_name, effected_from, payroll_record['定额'],
+                                          filtered_data)
+        if clock is not None:
+            clock.lap('filter')
+        if filter2_count == 0:
+            return MatchResult(MATCH_NO_MATCH, effected_from, filter1_count, 0, None, None,
+                               near_miss)
+        code = final_decision(payroll_record, filtered_data)
+        if clock is not None:
+            clock.lap('decision')
+        return MatchResult(MATCH_SUCCESS, effected_from, filter1_count, filter2_count, code, None,
+                           near_miss)
+    except NODECISION as e:
+        if clock is not None:
+            clock.lap('decision')
+        return MatchResult(MATCH_NODECISION, effected_from, filter1_count, filter2_count, None, e,
+                           near_miss)
+    except Exception as e:
+        return MatchResult(MATCH_ERROR, effected_from, filter1_count, filter2_count, None, str(e))
+
+
+# A payroll record with its filter results and candidate table, prepared
+# ahead on the prefetch thread of the interactive session
+PreparedRecord = namedtuple(
+    'PreparedRecord',
+    ['payroll_record', 'effected_from', 'filter1_count', 'filter2_count', 'filtered_data',
+     'table']
+)
+
+
+def format_quota_table(filtered_data):
+    """
+    Render quota records as the transposed table shown by option 1
+
+    Args:
+        filtered_data (list): Quota records passing both filters
+
+    Returns:
+        str: The table text
+    """
+    # Create a DataFrame for better formatting
+    import pandas as pd
+
+    # Prepare data for DataFrame
+    records_data = []
+    for i, record in enumerate(filtered_data, 1):
+        record_data = {
+            '记录': f'记录{i}',
+            '类别1': record.get('类别1', 'N/A'),
+            '类别2': record.get('类别2', 'N/A'),
+            '加工工序': record.get('加工工序', 'N/A'),
+            '型号': record.get('型号', 'N/A'),
+            '定额': record.get('定额', 'N/A'),
+            'effected_from': record.get('effected_from', 'N/A')
+        }
+        records_data.append(record_data)
+
+    # Create DataFrame and transpose it
+    df = pd.DataFrame(records_data)
+    df_transposed = df.set_index('记录')
+    return df_transposed.to_string()
+
+
+def prepare_record(quota_data, payroll_record, file_name):
+    """
+    Filter one payroll record and render its candidate table without printing
+    anything, so it can run on the prefetch thread
+
+    Args:
+        quota_data (QuotaIndex): Quota index from load_quota_index()
+        payroll_record (dict): Payroll record from generator
+        file_name (str): The filename being processed
+
+    Returns:
+        PreparedRecord: The record, its filter results and the table text
+        (None when no quota record matched)
+    """
+    sheet_name = payroll_record['sheet名']
+    effected_from = calculate_effected_from(file_name, sheet_name)
+    filter1_count, filter2_count, filtered_data = quota_data.lookup(
+        sheet_name, effected_from, payroll_record['定额']
+    )
+    table = format_quota_table(filtered_data) if filtered_data else None
+    return PreparedRecord(payroll_record, effected_from, filter1_count, filter2_count,
+                          filtered_data, table)
+
+
+def next_ambiguous(cursor, quota_data, file_name, position):
+    """
+    Find the next payroll record that matches more than one quota record.
+    Records that cannot be looked up (e.g. an unknown sheet名) are not
+    ambiguous and are skipped, as match_record() reports them as errors.
+
+    Args:
+        cursor (PayrollCursor): Cursor over the session's payroll records
+        quota_data (QuotaIndex): Quota index from load_quota_index()
+        file_name (str): The filename being processed
+        position (int): Search after this position
 
+    Returns:
+        int: Position of the record, or None when there is none
+    """
+    for next_position, _, payroll_record in cursor.iter_from(position + 1):
+        sheet_name = payroll_record['sheet名']
+        try:
+            effected_from = calculate_effected_from(file_name, sheet_name)
+            _, filter2_count, _ = quota_data.lookup(sheet_name, effected_from,
+                                                    payroll_record['定额'])
+        except Exception:
+            continue
+        if filter2_count > 1:
+            return next_position
+    return None
 
 
 def main():
@@ -99,17 +282,33 @@ def main():
     print("工资记录与定额数据匹配程序")
     print("=" * 60)
     
-    # Check command line arguments
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("用法: python match.py <文件名前缀> [工作表名]")
+    # Check command line arguments: --start=N / --rowid=R resume a session
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    start_number = start_rowid = None
+    valid = 1 <= len(arguments) <= 2
+    for option in sys.argv[1:]:
+        if not option.startswith('--'):
+            continue
+        name, _, value = option.partition('=')
+        if name in ('--start', '--rowid') and value.isdigit():
+            if name == '--start':
+                start_number = int(value)
+            else:
+                start_rowid = int(value)
+        else:
+            valid = False
+    if not valid:
+        print("用法: python match.py <文件名前缀> [工作表名] [--start=N | --rowid=R]")
         print("例如: python match.py 202005")
         print("      python match.py 202005 精加工")
+        print("      python match.py 202005 精加工 --start=120")
         print("当只提供文件名前缀时，处理所有相关记录")
         print("当提供工作表名时，只处理指定工作表的记录")
+        print("--start=N 从第N条记录开始，--rowid=R 从 rowid 为R的记录继续上次的会话")
         return
     
-    file_prefix = sys.argv[1]
-    sheet_name = sys.argv[2] if len(sys.argv) == 3 else None
+    file_prefix = arguments[0]
+    sheet_name = arguments[1] if len(arguments) == 2 else None
     
     if sheet_name:
         print(f"正在处理文件名前缀为 '{file_prefix}'，工作表名为 '{sheet_name}' 的记录")
@@ -117,9 +316,9 @@ def main():
         print(f"正在处理文件名前缀为 '{file_prefix}' 的所有记录")
     print()
     
-    # Step a: Call query_quota_table and store as quota_data
+    # Step a: Load the quota index (from the cache file when still valid)
     print("正在查询定额数据...")
-    quota_data = query_quota_table()
+    quota_data = load_quota_index()
     print(f"获取到 {len(quota_data)} 条定额记录")
     print()
     
@@ -132,27 +331,49 @@ def main():
     # Reconstruct file name for display and filter purposes
     file_name = f"{file_prefix}.xls"
     
-    generator = payroll_records_gen(file_prefix, sheet_name)
+    # Seekable cursor over the records: resuming jumps straight to the record
+    cursor = PayrollCursor(file_prefix, sheet_name)
+    total = len(cursor)
+    print(f"共 {total} 条工资记录")
+    print()
+    if start_rowid is not None:
+        position = cursor.position_of(start_rowid)
+    elif start_number is not None:
+        position = max(start_number - 1, 0)
+    else:
+        position = 0
+    
+    def prefetch_from(position):
+        # Step c runs ahead on a background thread: the next records are
+        # read, filtered and rendered while the current one is shown
+        return Prefetcher(
+            cursor.iter_from(position),
+            lambda item: (item[0], item[1], prepare_record(quota_data, item[2], file_name))
+        )
     
+    records = prefetch_from(position)
     try:
         # Process records one by one
         while True:
-            payroll_record = next(generator)
+            position, rowid, prepared = next(records)
+            payroll_record = prepared.payroll_record
+            effected_from = prepared.effected_from
+            filter1_count = prepared.filter1_count
+            filter2_count = prepared.filter2_count
+            filtered_data = prepared.filtered_data
             
             # Display the payroll record
-            print("当前工资记录:")
+            print(f"当前工资记录 (第 {position + 1}/{total} 条, rowid {rowid}):")
             print(format_record(payroll_record))
             
-            # Step c: Filter quota data
-            filter1_count, filter2_count, filtered_data = filter_quota_data(
-                quota_data, payroll_record, file_name
-            )
+            # Step c: Filter quota data (prepared in the background)
+            print(f"the value of {effected_from =}")
             
             # Display detailed filter information
             print(f"过滤条件详情:")
             print(f"  文件名: {file_name}")
             print(f"  工作表名: {payroll_record['sheet名']}")
-            print(f"  生效日期: {calculate_effected_from(file_name, payroll_record['sheet名'])}")
+            print(f"  生效日期: {effected_from}")
             print(f"  定额值: {payroll_record['定额']}")
             print()
             
@@ -167,37 +388,19 @@ def main():
                 print("1. 显示所有匹配过滤条件1+2的定额记录")
                 print("2. 处理下一条工资记录")
                 print("3. 退出程序")
+                print("4. 返回上一条工资记录")
+                print("5. 跳转到第N条工资记录")
+                print("6. 跳到下一条无法决策的工资记录 (匹配多条定额)")
                 
-                choice = input("请输入选择 (1/2/3): ").strip()
+                choice = input("请输入选择 (1-6): ").strip()
                 
                 if choice == '1':
                     if filtered_data:
                         print(f"\n显示 {len(filtered_data)} 条匹配的定额记录:")
                         print("-" * 80)
                         
-                        # Create a DataFrame for better formatting
-                        import pandas as pd
-                        
-                        # Prepare data for DataFrame
-                        records_data = []
-                        for i, record in enumerate(filtered_data, 1):
-                            record_data = {
-                                '记录': f'记录{i}',
-                                '类别1': record.get('类别1', 'N/A'),
-                                '类别2': record.get('类别2', 'N/A'),
-                                '加工工序': record.get('加工工序', 'N/A'),
-                                '型号': record.get('型号', 'N/A'),
-                                '定额': record.get('定额', 'N/A'),
-                                'effected_from': record.get('effected_from', 'N/A')
-                            }
-                            records_data.append(record_data)
-                        
-                        # Create DataFrame and transpose it
-                        df = pd.DataFrame(records_data)
-                        df_transposed = df.set_index('记录')
-                        
-                        # Display the transposed DataFrame
-                        print(df_transposed.to_string())
+                        # Display the transposed table rendered in the background
+                        print(prepared.table)
                         print("-" * 80)
                     else:
                         print("没有匹配的定额记录")
@@ -208,9 +411,32 @@ def main():
                     break
                     
                 elif choice == '3':
+                    print(f"下次可用 --rowid={rowid} 从当前记录继续")
                     print("程序结束。")
                     return
                     
+                elif choice in ('4', '5', '6'):
+                    if choice == '4':
+                        target = position - 1 if position > 0 else None
+                        if target is None:
+                            print("已经是第一条工资记录")
+                    elif choice == '5':
+                        number = input(f"请输入记录序号 (1-{total}): ").strip()
+                        target = int(number) - 1 if number.isdigit() else None
+                        if target is None or not 0 <= target < total:
+                            target = None
+                            print("无效的记录序号")
+                    else:
+                        target = next_ambiguous(cursor, quota_data, file_name, position)
+                        if target is None:
+                            print("后面没有无法决策的工资记录")
+                    print()
+                    if target is not None:
+                        # Restart the prefetch at the new position
+                        records.close()
+                        records = prefetch_from(target)
+                        break
+                    
                 else:
                     print("无效选择，请重新输入")
                     print()
@@ -218,6 +444,9 @@ def main():
     except StopIteration:
         print("所有工资记录已处理完毕！")
         print("程序结束。")
+    finally:
+        records.close()
+        cursor.close()
 
 
 if __name__ == "__main__":
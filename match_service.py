@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Matching Service
+Long-lived localhost HTTP server keeping the quota index warm and answering
+match requests for single records, batches and (文件名前缀, sheet名)
+"""
+
+import argparse
+import json
+import sys
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import quota_cache
+from quota_cache import load_quota_index
+from match import match_record
+from payroll_generator import read_payroll
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# Payroll columns a match request must provide
+REQUIRED_FIELDS = ('文件名', 'sheet名', '定额')
+
+
+class RequestError(Exception):
+    """A request the service cannot answer (reported with HTTP 400 / 404)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def result_json(result):
+    """JSON-ready dict of a MatchResult"""
+    return {
+        'status': result.status,
+        'effected_from': result.effected_from,
+        'filter1_count': result.filter1_count,
+        'filter2_count': result.filter2_count,
+        '代码': result.code,
+        'message': str(result.message) if result.message is not None else None,
+        'near_miss': result.near_miss,
+    }
+
+
+class MatchService:
+    """
+    The warm state of the service: the quota index and its reload.
+
+    Requests read self.quota_index once and use that index to the end, so a
+    reload swapping in a new index never disturbs requests in flight.
+    """
+
+    def __init__(self, use_cache=True):
+        self.use_cache = use_cache
+        self._reload_lock = threading.Lock()
+        self.quota_index = None
+        self.loaded_at = None
+        self.load_source = None
+        self.reload()
+
+    def reload(self):
+        """Reload the quota index (from the cache file when the quota table is unchanged)"""
+        with self._reload_lock:
+            start = time.perf_counter()
+            quota_index = load_quota_index(self.use_cache)
+            self.quota_index = quota_index
+            self.loaded_at = time.time()
+            self.load_source = quota_cache.last_load_source
+            return {
+                'quota_count': len(quota_index),
+                'source': self.load_source,
+                'seconds': round(time.perf_counter() - start, 6),
+            }
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'quota_count': len(self.quota_index),
+            'source': self.load_source,
+            'loaded_at': self.loaded_at,
+        }
+
+    def match_one(self, quota_index, payroll_record):
+        if not isinstance(payroll_record, dict):
+            raise RequestError("A payroll record must be a JSON object")
+        missing = [field for field in REQUIRED_FIELDS if field not in payroll_record]
+        if missing:
+            raise RequestError(f"Missing payroll fields: {', '.join(missing)}")
+        return result_json(match_record(quota_index, payroll_record))
+
+    def match(self, payroll_record):
+        """Match one payroll record"""
+        return self.match_one(self.quota_index, payroll_record)
+
+    def match_batch(self, body):
+        """Match {"records": [...]} in order"""
+        records = body.get('records') if isinstance(body, dict) else None
+        if not isinstance(records, list):
+            raise RequestError('Expected {"records": [...]}')
+        quota_index = self.quota_index
+        return {'results': [self.match_one(quota_index, record) for record in records]}
+
+    def match_prefix(self, file_prefix, sheet_name=None, limit=None):
+        """Match the stored payroll records of a 文件名 prefix (and sheet名)"""
+        if not file_prefix:
+            raise RequestError("file_prefix is required")
+        quota_index = self.quota_index
+        results = []
+        for payroll_rowid, payroll_record in read_payroll(file_name_prefix=file_prefix,
+                                                          sheet_name=sheet_name,
+                                                          with_rowid=True,
+                                                          row_format='record'):
+            if limit is not None and len(results) >= limit:
+                break
+            result = result_json(match_record(quota_index, payroll_record))
+            result['rowid'] = payroll_rowid
+            results.append(result)
+        return {'results': results}
+
+
+class MatchRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health                                   service and index state
+    POST /match            {payroll record}        one result
+    POST /match/batch      {"records": [...]}      {"results": [...]}
+    GET  /match/prefix?file_prefix=&sheet=&limit=  {"results": [...]} with rowids
+    POST /reload                                   reload the quota index
+    """
+
+    # Keep-alive connections: clients pay the TCP handshake once, and the
+    # headers and body of a response are not held back by Nagle's algorithm
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server_version = "PayrollMatch/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _content_length(self):
+        """
+        Body length of the request, validated before anything is read.
+
+        A bad length leaves the connection out of step, so it is closed
+        after the error response.
+        """
+        header = self.headers.get("Content-Length")
+        if header is None:
+            if self.headers.get("Transfer-Encoding"):
+                self.close_connection = True
+                raise RequestError("Content-Length required")
+            return 0
+        try:
+            length = int(header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            raise RequestError(f"Invalid Content-Length: {header}")
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            raise RequestError("Request body too large", 413)
+        return length
+
+    def _read_json(self):
+        length = self._content_length()
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except ValueError as e:
+            raise RequestError(f"Invalid JSON: {e}")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        service = self.server.service
+        try:
+            # Read every POST body, so a keep-alive connection stays in step
+            body = self._read_json() if method == "POST" else None
+            if method == "GET" and url.path == "/health":
+                payload = service.health()
+            elif method == "GET" and url.path == "/match/prefix":
+                query = parse_qs(url.query)
+                limit = query.get('limit', [None])[0]
+                if limit is not None and not (limit.isascii() and limit.isdigit()):
+                    raise RequestError("limit must be a non-negative integer")
+                payload = service.match_prefix(query.get('file_prefix', [None])[0],
+                                               query.get('sheet', [None])[0],
+                                               int(limit) if limit is not None else None)
+            elif method == "POST" and url.path == "/match":
+                payload = service.match(body)
+            elif method == "POST" and url.path == "/match/batch":
+                payload = service.match_batch(body)
+            elif method == "POST" and url.path == "/reload":
+                payload = service.reload()
+            else:
+                raise RequestError(f"No such endpoint: {method} {url.path}", 404)
+        except RequestError as e:
+            self._send(e.status, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+            return
+        self._send(200, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, use_cache=True, verbose=False):
+    """
+    Create the HTTP server with a warm MatchService (port 0 picks a free port)
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever() to answer requests
+    """
+    server = ThreadingHTTPServer((host, port), MatchRequestHandler)
+    server.daemon_threads = True
+    server.service = MatchService(use_cache)
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    """Run the matching service until interrupted"""
+    parser = argparse.ArgumentParser(description="匹配服务 - 常驻内存的本地 HTTP 匹配服务")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"监听地址 (默认: {DEFAULT_HOST}, 仅本机)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"监听端口 (默认: {DEFAULT_PORT})")
+    parser.add_argument("--no-quota-cache", action="store_true",
+                        help="不使用定额缓存文件，直接查询定额表")
+    parser.add_argument("--verbose", action="store_true",
+                        help="打印每个请求的访问日志")
+    args = parser.parse_args(argv)
+
+    print("正在加载定额数据...")
+    server = make_server(args.host, args.port, not args.no_quota_cache, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"获取到 {len(server.service.quota_index)} 条定额记录")
+    print(f"匹配服务已启动: http://{host}:{port} (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n匹配服务已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Batch Run Metrics
+Per-stage timing, throughput, latency percentiles and memory of a batch run,
+exported as a JSON report and a Prometheus textfile
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import effected_from_cache_info
+
+# Smallest latency bucket and number of buckets per doubling (about 9% resolution)
+LATENCY_BASE_SECONDS = 1e-6
+BUCKETS_PER_DOUBLING = 8
+
+# Records between two checks of the periodic flush deadline
+FLUSH_CHECK_INTERVAL = 1000
+
+# Prometheus metric name prefix
+METRIC_PREFIX = "payroll_batch"
+
+
+class StageClock:
+    """
+    Lap timer splitting the wall time of each record between stages.
+
+    start() marks the beginning of a record; lap(stage) adds the time since
+    the previous mark to `stage`.  Engines and match_record() call lap() for
+    the stages they can see, so unaccounted time falls into the next lap.
+    """
+
+    __slots__ = ('seconds', 'counts', '_started', '_last')
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._started = self._last = time.perf_counter()
+
+    def start(self):
+        """Mark the beginning of a record"""
+        self._started = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """Add the time since the previous mark to `stage`"""
+        now = time.perf_counter()
+        self.seconds[stage] += now - self._last
+        self.counts[stage] += 1
+        self._last = now
+
+    def elapsed(self):
+        """Time from start() to the last lap"""
+        return self._last - self._started
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed histogram of per-record latencies.  Memory does not grow
+    with the number of records; quantiles are exact to one bucket.
+    """
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Count one latency"""
+        if seconds <= LATENCY_BASE_SECONDS:
+            index = 0
+        else:
+            index = int(math.log2(seconds / LATENCY_BASE_SECONDS) * BUCKETS_PER_DOUBLING) + 1
+        self.buckets[index] += 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, or None when empty"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for index in sorted(self.buckets):
+            cumulative += self.buckets[index]
+            if cumulative >= target:
+                upper = LATENCY_BASE_SECONDS * 2 ** (index / BUCKETS_PER_DOUBLING)
+                return min(upper, self.max)
+        return self.max
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process and its finished children, or None"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def _write_atomic(path, text):
+    """Replace `path` atomically, so collectors never read a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunMetrics:
+    """
+    Metrics of one batch run.
+
+    process_results() starts the clock for every record and laps 'match',
+    'report' and 'write'; the python engine additionally laps 'read',
+    'effected_from', 'filter' and 'decision'.  When json_path or prom_path
+    is set the metrics are written at the end of the run and, with
+    flush_interval, periodically while it runs.
+    """
+
+    def __init__(self, engine, workers=1, json_path=None, prom_path=None,
+                 flush_interval=None):
+        self.engine = engine
+        self.workers = workers
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.flush_interval = flush_interval
+        self.clock = StageClock()
+        self.latency = LatencyHistogram()
+        self.counters = None
+        self.quota_cache = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self._start = time.perf_counter()
+        self._next_flush = self._start + flush_interval if flush_interval else None
+        self._until_check = FLUSH_CHECK_INTERVAL
+
+    def add_stage(self, stage, seconds):
+        """Add a one-off stage outside the per-record loop (e.g. quota load)"""
+        self.clock.seconds[stage] += seconds
+        self.clock.counts[stage] += 1
+
+    def record_done(self):
+        """Close the current record: count its latency, flush when due"""
+        self.latency.add(self.clock.elapsed())
+        if self._next_flush is not None:
+            self._until_check -= 1
+            if not self._until_check:
+                self._until_check = FLUSH_CHECK_INTERVAL
+                if time.perf_counter() >= self._next_flush:
+                    self._next_flush = time.perf_counter() + self.flush_interval
+                    self.write()
+
+    def finish(self, counters):
+        """Mark the run as finished and write the final metrics"""
+        self.counters = counters
+        self.finished_at = datetime.now()
+        self.write()
+
+    def report(self):
+        """
+        The metrics as a JSON-serializable dict.
+
+        Returns:
+            dict: Run info, per-stage timings, throughput, latency quantiles,
+            peak RSS and cache statistics
+        """
+        elapsed = time.perf_counter() - self._start
+        records = self.latency.count
+        counters = self.counters
+        stages = {}
+        for stage, seconds in self.clock.seconds.items():
+            count = self.clock.counts[stage]
+            stages[stage] = {
+                'seconds': round(seconds, 6),
+                'count': count,
+                'per_record_us': round(seconds / count * 1e6, 3) if count else None,
+                'share': round(seconds / elapsed, 4) if elapsed > 0 else None,
+            }
+        return {
+            'engine': self.engine,
+            'workers': self.workers,
+            'running': self.finished_at is None,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': (self.finished_at.isoformat(timespec='seconds')
+                            if self.finished_at else None),
+            'elapsed_seconds': round(elapsed, 6),
+            'records': records,
+            'records_per_sec': round(records / elapsed, 1) if elapsed > 0 else None,
+            'counters': None if counters is None else {
+                'processed': counters.processed_count,
+                'success': counters.success_count,
+                'skip': counters.skip_count,
+                'error': counters.error_count,
+            },
+            'stages': stages,
+            'latency_seconds': {
+                'p50': self.latency.quantile(0.50),
+                'p95': self.latency.quantile(0.95),
+                'p99': self.latency.quantile(0.99),
+                'max': self.latency.max if records else None,
+            },
+            'peak_rss_bytes': peak_rss_bytes(),
+            'caches': {
+                # Worker processes keep their own effected_from caches
+                'effected_from': effected_from_cache_info(),
+                'quota_index': self.quota_cache,
+            },
+        }
+
+    def prometheus_text(self, report=None):
+        """The metrics in the Prometheus text exposition format"""
+        report = report or self.report()
+        engine = f'engine="{self.engine}"'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{labels}}} {value}")
+
+        metric("running", "gauge", "1 while the batch run is in progress",
+               [(engine, int(report['running']))])
+        metric("last_update_timestamp_seconds", "gauge", "Time of this metrics update",
+               [(engine, round(time.time(), 3))])
+        metric("elapsed_seconds", "gauge", "Wall time of the run so far",
+               [(engine, report['elapsed_seconds'])])
+        metric("records_total", "counter", "Payroll records processed",
+               [(engine, report['records'])])
+        if report['counters'] is not None:
+            metric("results_total", "counter", "Processed records by outcome",
+                   [(f'{engine},outcome="{outcome}"', value)
+                    for outcome, value in report['counters'].items() if outcome != 'processed'])
+        metric("records_per_second", "gauge", "Average throughput of the run",
+               [(engine, report['records_per_sec'])])
+        metric("stage_seconds_total", "counter", "Cumulative wall time per stage",
+               [(f'{engine},stage="{stage}"', entry['seconds'])
+                for stage, entry in report['stages'].items()])
+        metric("record_latency_seconds", "gauge", "Per-record latency quantiles",
+               [(f'{engine},quantile="{q}"', report['latency_seconds'][key])
+                for q, key in (("0.5", 'p50'), ("0.95", 'p95'), ("0.99", 'p99'))])
+        metric("peak_rss_bytes", "gauge", "Peak resident set size",
+               [(engine, report['peak_rss_bytes'])])
+        metric("effected_from_cache_hit_ratio", "gauge",
+               "Hit ratio of the calculate_effected_from cache",
+               [(engine, round(report['caches']['effected_from']['hit_rate'], 6))])
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Write the JSON report and the Prometheus textfile, when configured"""
+        if not (self.json_path or self.prom_path):
+            return
+        report = self.report()
+        if self.json_path:
+            _write_atomic(self.json_path, json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+        if self.prom_path:
+            _write_atomic(self.prom_path, self.prometheus_text(report))
+
+    def summary_lines(self):
+        """Human-readable lines for the end-of-run summary"""
+        report = self.report()
+        lines = [f"  吞吐量: {report['records_per_sec']} 条/秒 "
+                 f"(耗时 {report['elapsed_seconds']:.2f} 秒)"]
+        latency = report['latency_seconds']
+        if latency['p50'] is not None:
+            lines.append(f"  单条延迟: p50={latency['p50'] * 1e6:.1f}µs "
+                         f"p95={latency['p95'] * 1e6:.1f}µs p99={latency['p99'] * 1e6:.1f}µs")
+        for stage, entry in sorted(report['stages'].items(),
+                                   key=lambda item: -item[1]['seconds']):
+            lines.append(f"    {stage:<14} {entry['seconds']:>10.3f} 秒  "
+                         f"{entry['per_record_us'] or 0:>9.2f} µs/次  {(entry['share'] or 0):>6.1%}")
+        if report['peak_rss_bytes'] is not None:
+            lines.append(f"  峰值内存 (RSS): {report['peak_rss_bytes'] / 1024 / 1024:.1f} MB")
+        cache = report['caches']['effected_from']
+        lines.append(f"  生效日期缓存命中率: {cache['hit_rate']:.1%} "
+                     f"(命中 {cache['hits']}, 未命中 {cache['misses']})")
+        if report['caches']['quota_index']:
+            lines.append(f"  定额索引来源: {report['caches']['quota_index']}")
+        return lines
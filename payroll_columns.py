@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Payroll Column Cache
+Export the matching-relevant columns of payroll_details to memory-mapped
+.npy files next to DATABASE_PATH, reused until the table's max rowid or
+row count changes
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect, database_path
+from match import match_record, NODECISION, MATCH_NODECISION
+from payroll_generator import payroll_records_by_rowid
+
+# Bump when the exported files change
+CACHE_FORMAT_VERSION = 1
+
+# Exported arrays and their dtypes.  文件名, sheet名 and 职员全名 are stored
+# as codes into the string lists of meta.json; month is the YYYYMM prefix
+# of 文件名 (-1 without one); NULL 定额/金额 are NaN.
+ARRAYS = {
+    'rowid': np.int64,
+    'file': np.int32,
+    'month': np.int32,
+    'sheet': np.int32,
+    'employee': np.int32,
+    'quota': np.float64,
+    'amount': np.float64,
+    # 定额 or 金额 not stored as REAL/NULL: re-read from the table when matched
+    'irregular': np.bool_,
+}
+
+# Invalidation key of the cache
+STAMP_QUERY = "SELECT MAX(rowid), COUNT(*) FROM payroll_details"
+
+EXPORT_QUERY = "SELECT rowid, 文件名, sheet名, 职员全名, 定额, 金额 FROM payroll_details ORDER BY rowid"
+
+# Rows fetched per fetchmany() call when exporting
+EXPORT_BATCH_SIZE = 10000
+
+# Records decoded (and diagnostic rows re-read) per batch when matching
+MATCH_BATCH_SIZE = 1000
+
+# How the last load_payroll_columns() call got its columns: 'cache' or 'exported'
+last_load_source = None
+
+
+def cache_dir(db_path=None):
+    """Directory of the payroll column cache of a database"""
+    return database_path(db_path) + ".payroll_columns"
+
+
+def table_stamp(conn):
+    """[max rowid, row count] of payroll_details"""
+    return list(conn.execute(STAMP_QUERY).fetchone())
+
+
+def _file_month(file_name):
+    """YYYYMM prefix of a 文件名 as an int, or -1"""
+    if isinstance(file_name, str) and len(file_name) >= 6 and file_name[:6].isdigit():
+        return int(file_name[:6])
+    return -1
+
+
+def _real(value):
+    """Whether a value is stored as it comes back from a REAL column (float or NULL)"""
+    return value is None or type(value) is float
+
+
+class PayrollColumns:
+    """
+    The exported payroll columns, memory-mapped read-only.
+
+    Arrays are in rowid order and only the pages a run reads are loaded;
+    summaries() decodes a slice back into the 文件名/sheet名/职员全名/定额
+    summaries the batch engines report.
+    """
+
+    def __init__(self, directory, meta):
+        self.stamp = meta['stamp']
+        self.files = meta['files']
+        self.sheets = meta['sheets']
+        self.employees = meta['employees']
+        # An empty file cannot be mapped
+        mmap_mode = 'r' if self.stamp[1] else None
+        self.arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAYS
+        }
+        if any(len(array) != self.stamp[1] for array in self.arrays.values()):
+            raise ValueError("Payroll column files do not match their stamp")
+
+    def __len__(self):
+        return self.stamp[1]
+
+    def summaries(self, start, stop):
+        """
+        Decode the records at positions [start, stop).
+
+        Yields:
+            tuple: (rowid, summary dict, irregular)
+        """
+        arrays = self.arrays
+        files, sheets, employees = self.files, self.sheets, self.employees
+        quota_values = arrays['quota'][start:stop]
+        quota_values = np.where(np.isnan(quota_values), None, quota_values).tolist()
+        for rowid, file_code, sheet_code, employee_code, quota_value, irregular in zip(
+                arrays['rowid'][start:stop].tolist(), arrays['file'][start:stop].tolist(),
+                arrays['sheet'][start:stop].tolist(), arrays['employee'][start:stop].tolist(),
+                quota_values, arrays['irregular'][start:stop].tolist()):
+            yield rowid, {
+                '文件名': files[file_code],
+                'sheet名': sheets[sheet_code],
+                '职员全名': employees[employee_code],
+                '定额': quota_value,
+            }, irregular
+
+
+def export_columns(db_path=None):
+    """
+    Export the payroll columns, replacing the cache directory.
+
+    Returns:
+        list: The [max rowid, row count] stamp of the exported table
+    """
+    conn = connect(db_path=db_path, row_factory=None)
+    try:
+        # One read transaction: the stamp describes exactly the exported rows
+        conn.execute("BEGIN")
+        stamp = table_stamp(conn)
+        strings = {'files': {}, 'sheets': {}, 'employees': {}}
+        columns = {name: [] for name in ARRAYS}
+        cursor = conn.execute(EXPORT_QUERY)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            for rowid, file_name, sheet_name, employee, quota_value, amount in rows:
+                columns['rowid'].append(rowid)
+                columns['file'].append(strings['files'].setdefault(file_name,
+                                                                   len(strings['files'])))
+                columns['month'].append(_file_month(file_name))
+                columns['sheet'].append(strings['sheets'].setdefault(sheet_name,
+                                                                     len(strings['sheets'])))
+                columns['employee'].append(strings['employees'].setdefault(
+                    employee, len(strings['employees'])))
+                regular = _real(quota_value) and _real(amount)
+                columns['quota'].append(quota_value if regular and quota_value is not None
+                                        else np.nan)
+                columns['amount'].append(amount if regular and amount is not None else np.nan)
+                columns['irregular'].append(not regular)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    directory = cache_dir(db_path)
+    tmp_directory = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    try:
+        for name, dtype in ARRAYS.items():
+            np.save(os.path.join(tmp_directory, f"{name}.npy"),
+                    np.array(columns[name], dtype=dtype))
+        with open(os.path.join(tmp_directory, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CACHE_FORMAT_VERSION,
+                'stamp': stamp,
+                'files': list(strings['files']),
+                'sheets': list(strings['sheets']),
+                'employees': list(strings['employees']),
+            }, f, ensure_ascii=False)
+        # Swap directories; readers holding old mappings keep their (unlinked) files
+        old_directory = f"{directory}.{os.getpid()}.old"
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    return stamp
+
+
+def cached_columns(db_path=None):
+    """
+    The cached PayrollColumns when they match the current table, else None
+    """
+    directory = cache_dir(db_path)
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or meta.get('version') != CACHE_FORMAT_VERSION:
+        return None
+
+    conn = connect(db_path=db_path, row_factory=None)
+    try:
+        stamp = table_stamp(conn)
+    finally:
+        conn.close()
+    if meta['stamp'] != stamp:
+        return None
+    try:
+        return PayrollColumns(directory, meta)
+    except (OSError, ValueError):
+        return None
+
+
+def load_payroll_columns(rebuild=False, db_path=None):
+    """
+    Return the memory-mapped payroll columns, exporting them first when the
+    cache is missing or the table's max rowid or row count changed.
+
+    Updates that keep both unchanged are not detected: export again with
+    rebuild=True (python payroll_columns.py --rebuild) after editing rows.
+    """
+    global last_load_source
+    columns = None if rebuild else cached_columns(db_path)
+    if columns is not None:
+        last_load_source = 'cache'
+        return columns
+    export_columns(db_path)
+    last_load_source = 'exported'
+    return cached_columns(db_path)
+
+
+def column_results(quota_index, columns, limit=None, conn=None):
+    """
+    Match payroll records read from the column cache.
+
+    Records are matched from their decoded summaries.  Rows whose full
+    record is part of the diagnostics (NODECISION messages) or whose
+    定额 is not a REAL value are re-read from the table by rowid, so the
+    results are the same as serial_results().
+
+    Args:
+        quota_index (QuotaIndex): Quota index from load_quota_index()
+        columns (PayrollColumns): Columns from load_payroll_columns()
+        limit (int, optional): Only match the first `limit` records
+        conn (sqlite3.Connection, optional): Connection for the re-read rows;
+            a read-only connection is opened (and closed) when not given
+
+    Yields:
+        tuple: (payroll rowid, payroll summary or record, MatchResult) in rowid order
+    """
+    count = len(columns) if limit is None else max(0, min(limit, len(columns)))
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
+        for start in range(0, count, MATCH_BATCH_SIZE):
+            batch = []
+            reread = []
+            for rowid, summary, irregular in columns.summaries(
+                    start, min(start + MATCH_BATCH_SIZE, count)):
+                result = None if irregular else match_record(quota_index, summary)
+                if result is None or result.status == MATCH_NODECISION:
+                    reread.append(rowid)
+                batch.append((rowid, summary, result))
+            records = dict(payroll_records_by_rowid(reread, conn)) if reread else {}
+
+            for rowid, summary, result in batch:
+                record = records.get(rowid)
+                if record is None:
+                    yield rowid, summary, result
+                elif result is None:
+                    yield rowid, record, match_record(quota_index, record)
+                else:
+                    # Same candidates, with the full record in the message
+                    yield rowid, record, result._replace(
+                        message=NODECISION(record, result.message.filter2_data))
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def main(argv=None):
+    """Export the payroll column cache, or report whether it is current"""
+    parser = argparse.ArgumentParser(description="工资列缓存 - 导出内存映射的工资记录列")
+    parser.add_argument("--check", action="store_true",
+                        help="只检查缓存是否与工资表一致, 不导出")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="即使缓存有效也重新导出 (修改已有记录后使用)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.check:
+            columns = cached_columns()
+            if columns is None:
+                print(f"工资列缓存不存在或已过期: {cache_dir()}")
+                return 1
+            print(f"工资列缓存有效: {len(columns)} 条记录 (最大 rowid {columns.stamp[0]})")
+            return 0
+
+        start = time.perf_counter()
+        columns = load_payroll_columns(args.rebuild)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    action = "已导出" if last_load_source == 'exported' else "已是最新"
+    print(f"工资列缓存{action}: {len(columns)} 条记录, "
+          f"{len(columns.files)} 个文件名, {len(columns.sheets)} 个工作表, "
+          f"{len(columns.employees)} 个职员 ({time.perf_counter() - start:.2f} 秒)")
+    print(f"缓存目录: {cache_dir()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
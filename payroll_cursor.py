@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Seekable Payroll Cursor
+Random access to the payroll records of a file name prefix / sheet by
+position or rowid, using rowid keyset pagination and a small page cache
+"""
+
+import sys
+import os
+import threading
+from collections import OrderedDict
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from payroll_generator import build_payroll_query
+
+# Payroll records per page
+PAGE_SIZE = 200
+
+# Pages kept in memory (least recently used pages are dropped)
+CACHE_PAGES = 16
+
+# Smallest and largest SQLite rowids, for open-ended keyset ranges
+MIN_ROWID = -2 ** 63
+MAX_ROWID = 2 ** 63 - 1
+
+
+class PayrollCursor:
+    """
+    Seekable cursor over the payroll records matching a 文件名 prefix and an
+    optional sheet名, in rowid order.
+
+    Records are addressed by their 0-based position.  Pages are read with
+    keyset conditions (rowid after the previous page / before the next page)
+    whenever a neighbouring page has been read, so stepping forwards or
+    backwards never re-reads earlier records; only a jump to a page with no
+    known neighbour locates its first rowid with a rowid-only OFFSET query.
+
+    The cursor may be shared between threads: page reads are serialized.
+    """
+
+    def __init__(self, file_name_prefix=None, sheet_name=None, page_size=PAGE_SIZE,
+                 cache_pages=CACHE_PAGES, db_path=None):
+        self.file_name_prefix = file_name_prefix
+        self.sheet_name = sheet_name
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._conn = connect(db_path=db_path, row_factory=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        # page number -> list of (rowid, record dict), least recently used first
+        self._pages = OrderedDict()
+        # page number -> (first rowid, last rowid), kept after the page is dropped
+        self._bounds = {}
+        self._count = None
+        description = self._conn.execute(*self._query(limit=0)).description
+        self._names = [column[0] for column in description][1:]
+
+    def _query(self, rowid_range=(MIN_ROWID, MAX_ROWID), columns=None, **kwargs):
+        return build_payroll_query(columns, self.file_name_prefix, self.sheet_name,
+                                   rowid_range, with_rowid=True, **kwargs)
+
+    def _count_rows(self, rowid_range=(MIN_ROWID, MAX_ROWID)):
+        sql, params = self._query(rowid_range, columns=[])
+        return self._conn.execute(f"select count(*) from ({sql})", params).fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            if self._count is None:
+                self._count = self._count_rows()
+            return self._count
+
+    def _read_page(self, page_number):
+        """Read a page, by keyset from a neighbouring page when one is known"""
+        if page_number - 1 in self._bounds:
+            previous_last = self._bounds[page_number - 1][1]
+            sql, params = self._query((previous_last + 1, MAX_ROWID), limit=self.page_size)
+            rows = self._conn.execute(sql, params).fetchall()
+        elif page_number + 1 in self._bounds:
+            next_first = self._bounds[page_number + 1][0]
+            sql, params = self._query((MIN_ROWID, next_first - 1), descending=True,
+                                      limit=self.page_size)
+            rows = self._conn.execute(sql, params).fetchall()[::-1]
+        else:
+            sql, params = self._query(columns=[], limit=1,
+                                      offset=page_number * self.page_size)
+            first = self._conn.execute(sql, params).fetchone()
+            if first is None:
+                return []
+            sql, params = self._query((first[0], MAX_ROWID), limit=self.page_size)
+            rows = self._conn.execute(sql, params).fetchall()
+
+        if not rows:
+            return []
+        self._bounds[page_number] = (rows[0][0], rows[-1][0])
+        return [(row[0], dict(zip(self._names, row[1:]))) for row in rows]
+
+    def _page(self, page_number):
+        with self._lock:
+            page = self._pages.get(page_number)
+            if page is not None:
+                self._pages.move_to_end(page_number)
+                return page
+            page = self._read_page(page_number)
+            self._pages[page_number] = page
+            while len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+            return page
+
+    def get(self, position):
+        """
+        Return the record at a 0-based position.
+
+        Returns:
+            tuple: (rowid, record dict)
+
+        Raises:
+            IndexError: When the position is out of range
+        """
+        if position < 0:
+            raise IndexError(position)
+        page = self._page(position // self.page_size)
+        offset = position % self.page_size
+        if offset >= len(page):
+            raise IndexError(position)
+        return page[offset]
+
+    def position_of(self, rowid):
+        """Position of the first record whose rowid is at least `rowid`"""
+        with self._lock:
+            return self._count_rows((MIN_ROWID, rowid - 1))
+
+    def iter_from(self, position=0):
+        """
+        Yield records from a position onwards.
+
+        Yields:
+            tuple: (position, rowid, record dict)
+        """
+        while position >= 0:
+            page = self._page(position // self.page_size)
+            offset = position % self.page_size
+            if offset >= len(page):
+                return
+            for rowid, record in page[offset:]:
+                yield position, rowid, record
+                position += 1
+            if len(page) < self.page_size:
+                return
+
+    def close(self):
+        """Close the cursor's connection"""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -10,7 +10,146 @@ import os
 
 # Add the parent directory to the path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import DATABASE_PATH
+from db import connect
+from records import PayrollRecord
+
+
+# Rows fetched from SQLite per fetchmany() call
+DEFAULT_BATCH_SIZE = 1000
+
+# Rowids per query of payroll_records_by_rowid()
+ROWID_BATCH_SIZE = 500
+
+# Row formats supported by read_payroll()
+ROW_FORMATS = ('dict', 'record', 'tuple', 'columns')
+
+
+def build_payroll_query(columns=None, file_name_prefix=None, sheet_name=None,
+                        rowid_range=None, with_rowid=False, descending=False, limit=None,
+                        offset=None):
+    """
+    Build a parameterized payroll_details query.
+    
+    Args:
+        columns (list, optional): Columns to select; all columns when None
+        file_name_prefix (str, optional): Only records whose 文件名 starts with this prefix
+        sheet_name (str, optional): Only records of this sheet名
+        rowid_range (tuple, optional): (first_rowid, last_rowid), both inclusive
+        with_rowid (bool): Select the rowid as the first column
+        descending (bool): Order by rowid descending instead of ascending
+        limit (int, optional): Return at most this many rows
+        offset (int, optional): Skip this many rows first (requires limit)
+        
+    Returns:
+        tuple: (sql, params)
+    """
+    if columns is None:
+        projection = ["*"]
+    else:
+        for column in columns:
+            if '"' in column:
+                raise ValueError(f"Invalid column name: {column}")
+        projection = [f'"{column}"' for column in columns]
+    if with_rowid:
+        projection.insert(0, "rowid")
+    
+    conditions = []
+    params = []
+    if file_name_prefix:
+        # Bind the whole pattern so SQLite can use an index for the prefix
+        conditions.append("文件名 like ?")
+        params.append(f"{file_name_prefix}%")
+    if sheet_name:
+        conditions.append("sheet名 = ?")
+        params.append(sheet_name)
+    if rowid_range is not None:
+        conditions.append("rowid between ? and ?")
+        params.extend(rowid_range)
+    
+    sql = f"select {', '.join(projection)} from payroll_details"
+    if conditions:
+        sql += " where " + " and ".join(conditions)
+    sql += " order by rowid desc" if descending else " order by rowid"
+    if limit is not None:
+        sql += " limit ?"
+        params.append(limit)
+        if offset is not None:
+            sql += " offset ?"
+            params.append(offset)
+    return sql, params
+
+
+def read_payroll(columns=None, file_name_prefix=None, sheet_name=None, rowid_range=None,
+                 with_rowid=False, row_format='dict', batch_size=DEFAULT_BATCH_SIZE,
+                 batches=False, conn=None):
+    """
+    Stream payroll records with bound parameters and fetchmany().
+    
+    Args:
+        columns (list, optional): Column projection; all columns when None
+        file_name_prefix (str, optional): Only records whose 文件名 starts with this prefix
+        sheet_name (str, optional): Only records of this sheet名
+        rowid_range (tuple, optional): (first_rowid, last_rowid), both inclusive
+        with_rowid (bool): Include the rowid: as the first tuple element, as the
+            'rowid' column, or as the first item of a (rowid, dict) pair
+        row_format (str): 'dict', 'record' (slotted PayrollRecord), 'tuple'
+            (raw SQLite tuples) or 'columns' (column name -> list of values,
+            batches only)
+        batch_size (int): Rows fetched per fetchmany() call
+        batches (bool): Yield one list (or column mapping) per fetched batch
+            instead of single records
+        conn (sqlite3.Connection, optional): Connection to read from. A
+            read-only connection is opened (and closed) when not given.
+        
+    Yields:
+        Records in rowid order, or batches of records when batches is True
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"Unknown row format: {row_format}")
+    if row_format == 'columns' and not batches:
+        raise ValueError("The 'columns' row format requires batches=True")
+    
+    sql, params = build_payroll_query(columns, file_name_prefix, sheet_name,
+                                      rowid_range, with_rowid)
+    
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        names = [description[0] for description in cursor.description]
+        
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            
+            if row_format == 'tuple':
+                batch = rows
+            elif row_format == 'columns':
+                batch = dict(zip(names, (list(values) for values in zip(*rows))))
+            elif row_format == 'record':
+                if with_rowid:
+                    record_class = PayrollRecord.for_columns(names[1:])
+                    batch = [(row[0], record_class(*row[1:])) for row in rows]
+                else:
+                    record_class = PayrollRecord.for_columns(names)
+                    batch = [record_class(*row) for row in rows]
+            elif with_rowid:
+                # The rowid column is named after an INTEGER PRIMARY KEY alias, if any
+                batch = [(row[0], dict(zip(names[1:], row[1:]))) for row in rows]
+            else:
+                batch = [dict(zip(names, row)) for row in rows]
+            
+            if batches:
+                yield batch
+            else:
+                yield from batch
+    finally:
+        if own_conn:
+            conn.close()
 
 
 def payroll_records_gen(file_name_prefix=None, sheet_name=None):
@@ -18,51 +157,100 @@ def payroll_records_gen(file_name_prefix=None, sheet_name=None):
     Generator function that yields payroll records one at a time.
     
     Args:
-        file_name_prefix (str, optional): The file name prefix to use in the SQL query template.
+        file_name_prefix (str, optional): The file name prefix to filter by.
                                          If None, returns all records from payroll_details.
         sheet_name (str, optional): The sheet name to filter by. If None, returns all records.
         
     Yields:
         dict: A payroll record from the database
     """
-    # Build SQL query based on parameters
-    if file_name_prefix:
-        if sheet_name:
-            sql_template = "select * from payroll_details where 文件名 like '{}%' and sheet名 = '{}';"
-            sql_query = sql_template.format(file_name_prefix, sheet_name)
-        else:
-            sql_template = "select * from payroll_details where 文件名 like '{}%';"
-            sql_query = sql_template.format(file_name_prefix)
-    else:
-        if sheet_name:
-            sql_template = "select * from payroll_details where sheet名 = '{}';"
-            sql_query = sql_template.format(sheet_name)
-        else:
-            sql_query = "select * from payroll_details;"
-    
-    print(f"Executing: {sql_query}")
+    sql_query, params = build_payroll_query(file_name_prefix=file_name_prefix,
+                                            sheet_name=sheet_name)
+    print(f"Executing: {sql_query} {params}")
     
     try:
-        # Connect to the actual database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  # This enables column access by name
-        cursor = conn.cursor()
-        
-        # Execute the query
-        cursor.execute(sql_query)
-        
-        # Yield records one by one
-        for row in cursor:
-            # Convert sqlite3.Row to dictionary
-            record = dict(row)
-            yield record
-            
+        yield from read_payroll(file_name_prefix=file_name_prefix, sheet_name=sheet_name)
     except sqlite3.Error as e:
         print(f"数据库错误: {e}")
         return
+
+
+def payroll_rowid_bounds(limit=None):
+    """
+    Return the rowid range covering the payroll records in table order.
+    
+    Args:
+        limit (int, optional): Only cover the first `limit` records
+        
+    Returns:
+        tuple: (first_rowid, last_rowid, record_count), or None when the table is empty
+    """
+    conn = connect()
+    try:
+        first_rowid, last_rowid, record_count = conn.execute(
+            "select min(rowid), max(rowid), count(*) from payroll_details"
+        ).fetchone()
+        if record_count == 0 or (limit is not None and limit <= 0):
+            return None
+        if limit is not None and limit < record_count:
+            last_rowid = conn.execute(
+                "select rowid from payroll_details order by rowid limit 1 offset ?",
+                (limit - 1,)
+            ).fetchone()[0]
+            record_count = limit
+        return first_rowid, last_rowid, record_count
     finally:
-        if 'conn' in locals():
-            conn.close()
+        conn.close()
+
+
+def payroll_records_in_range(first_rowid, last_rowid, conn=None, with_rowid=False,
+                             row_format='dict'):
+    """
+    Generator function that yields the payroll records whose rowid lies in
+    [first_rowid, last_rowid], in rowid order.
+    
+    Args:
+        first_rowid (int): First rowid of the range (inclusive)
+        last_rowid (int): Last rowid of the range (inclusive)
+        conn (sqlite3.Connection, optional): Connection to read from. A
+            read-only connection is opened (and closed) when not given.
+        with_rowid (bool): Yield (rowid, record) pairs instead of records
+        row_format (str): 'dict' or 'record' (slotted PayrollRecord)
+        
+    Yields:
+        dict: A payroll record from the database
+    """
+    return read_payroll(rowid_range=(first_rowid, last_rowid), with_rowid=with_rowid,
+                        row_format=row_format, conn=conn)
+
+
+def payroll_records_by_rowid(rowids, conn):
+    """
+    Generator function that yields the payroll records with the given rowids
+    as (rowid, PayrollRecord) pairs, reading ROWID_BATCH_SIZE rowids per query.
+    
+    Args:
+        rowids (list): Sorted payroll rowids
+        conn (sqlite3.Connection): Connection to read from
+        
+    Yields:
+        tuple: (rowid, PayrollRecord) in rowid order
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    for start in range(0, len(rowids), ROWID_BATCH_SIZE):
+        batch = rowids[start:start + ROWID_BATCH_SIZE]
+        placeholders = ", ".join("?" * len(batch))
+        cursor.execute(
+            f"SELECT rowid, * FROM payroll_details WHERE rowid IN ({placeholders}) "
+            f"ORDER BY rowid",
+            batch
+        )
+        record_class = PayrollRecord.for_columns(
+            [description[0] for description in cursor.description][1:]
+        )
+        for row in cursor.fetchall():
+            yield row[0], record_class(*row[1:])
 
 
 def format_record(record):
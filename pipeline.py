@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pipelined Matching
+Run the payroll reader, the matcher and the result output as three asyncio
+stages connected by bounded queues, so reading the next batch overlaps with
+matching and writing the previous ones
+"""
+
+import asyncio
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from payroll_generator import payroll_rowid_bounds, read_payroll
+from match import match_record
+
+# Payroll records per batch flowing through the pipeline
+PIPELINE_BATCH_SIZE = 5000
+
+# Batches each queue may hold before the stage feeding it waits
+PIPELINE_QUEUE_SIZE = 4
+
+
+async def _read_stage(batches, executor, queue):
+    """Fetch batches on the reader thread and queue them; None marks the end"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = await loop.run_in_executor(executor, next, batches, None)
+        await queue.put(batch)
+        if batch is None:
+            return
+
+
+async def _match_stage(quota_index, in_queue, out_queue):
+    """Match each queued batch in the event loop thread"""
+    while True:
+        batch = await in_queue.get()
+        if batch is None:
+            await out_queue.put(None)
+            return
+        await out_queue.put([
+            (payroll_rowid, payroll_record, match_record(quota_index, payroll_record))
+            for payroll_rowid, payroll_record in batch
+        ])
+
+
+async def _output_stage(emit, executor, queue):
+    """Hand each batch of results to emit() on the output thread, in order"""
+    loop = asyncio.get_running_loop()
+    while True:
+        results = await queue.get()
+        if results is None:
+            return
+        await loop.run_in_executor(executor, emit, results)
+
+
+async def _run(quota_index, emit, rowid_range, batch_size, queue_size):
+    read_queue = asyncio.Queue(maxsize=queue_size)
+    output_queue = asyncio.Queue(maxsize=queue_size)
+
+    # One thread per blocking stage: the reader keeps its SQLite connection
+    # (and cursor) on one thread, the output keeps results in order
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="reader") as read_executor, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="output") as output_executor:
+        batches = read_payroll(rowid_range=rowid_range, with_rowid=True, row_format='record',
+                               batch_size=batch_size, batches=True)
+        try:
+            await asyncio.gather(
+                _read_stage(batches, read_executor, read_queue),
+                _match_stage(quota_index, read_queue, output_queue),
+                _output_stage(emit, output_executor, output_queue),
+            )
+        finally:
+            # Close the reader's connection on its own thread
+            await asyncio.get_running_loop().run_in_executor(read_executor, batches.close)
+
+
+def pipeline_results(quota_index, emit, limit=None, batch_size=PIPELINE_BATCH_SIZE,
+                     queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Match payroll records through the reader -> matcher -> output pipeline.
+
+    At most 2 * queue_size + 3 batches are in memory at any time, whatever
+    the size of payroll_details: a full queue blocks the stage feeding it.
+
+    Args:
+        quota_index (QuotaIndex): Quota index from load_quota_index()
+        emit (callable): Called on the output thread with each list of
+            (payroll rowid, payroll record, MatchResult) tuples, in rowid order.
+            It may write to SQLite connections opened with check_same_thread=False.
+        limit (int, optional): Only match the first `limit` records
+        batch_size (int): Payroll records per batch
+        queue_size (int): Batches per queue between two stages
+    """
+    bounds = payroll_rowid_bounds(limit)
+    if bounds is None:
+        return
+    first_rowid, last_rowid, _ = bounds
+    asyncio.run(_run(quota_index, emit, (first_rowid, last_rowid), batch_size, queue_size))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Background Prefetching
+Prepare the next items of an iterator on a background thread while the
+current one is being shown
+"""
+
+import queue
+import threading
+
+# Items prepared ahead of the one being shown
+PREFETCH_DEPTH = 8
+
+# Seconds between checks for close() while the queue is full
+_PUT_TIMEOUT = 0.1
+
+
+class Prefetcher:
+    """
+    Iterate over prepare(item) for every item of `items`, computed up to
+    `depth` items ahead on a background thread.
+
+    `items` is consumed (and closed, if it has a close() method) only on the
+    background thread, so a generator holding a SQLite connection keeps it on
+    one thread.  An exception raised by `items` or `prepare` is re-raised by
+    next() at the position where it happened.
+    """
+
+    def __init__(self, items, prepare, depth=PREFETCH_DEPTH):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, args=(items, prepare),
+                                        name="prefetch", daemon=True)
+        self._thread.start()
+
+    def _put(self, entry):
+        """Queue an entry, giving up when close() is called; returns whether it was queued"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, items, prepare):
+        try:
+            for item in items:
+                if not self._put((True, prepare(item))):
+                    return
+            self._put((False, None))
+        except Exception as e:
+            self._put((False, e))
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        prepared, value = self._queue.get()
+        if prepared:
+            return value
+        self._done = True
+        if value is None:
+            raise StopIteration
+        raise value
+
+    def close(self):
+        """Stop the background thread (discarding prepared items) and wait for it"""
+        self._done = True
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -4,15 +4,15 @@
 import sqlite3
 import json
 from config import DATABASE_PATH
+from db import connect
 
 def query_quota_table():
     """
     Query the quota table from the database and return results as list of dictionaries
     """
     try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  # This enables column access by name
+        # Connect to the SQLite database (read-only, rows accessible by name)
+        conn = connect()
         
         # Create a cursor object
         cursor = conn.cursor()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Quota Snapshot Cache
+Keep the prebuilt QuotaIndex in a cache file next to DATABASE_PATH
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect, database_path
+from quota_index import QuotaIndex
+from records import QuotaRecord
+
+# Bump when the pickled QuotaIndex layout changes
+CACHE_FORMAT_VERSION = 4
+
+# How the last load_quota_index() call got its index: 'cache' (stamp hit),
+# 'change_id' (no quota change logged since), 'checksum' (quota unchanged),
+# 'rebuilt', 'uncached' or 'error'
+last_load_source = None
+
+
+def cache_path(db_path=None):
+    """Path of the quota cache file for a database"""
+    return database_path(db_path) + ".quota_index.pkl"
+
+
+def database_stamp(db_path=None):
+    """
+    (mtime, size) of the database file and of its WAL file, if any.
+    Writes in WAL mode only reach the main file at checkpoint time.
+    """
+    db_path = database_path(db_path)
+    stamp = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stamp.append(None)
+        else:
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stamp)
+
+
+def fetch_quota_rows(db_path=None, with_rowid=False):
+    """
+    Fetch the quota table as (columns, rows) in rowid order.
+
+    Args:
+        db_path (str, optional): Database path, config.DATABASE_PATH by default
+        with_rowid (bool): Select the rowid as the first column
+    """
+    conn = connect(db_path=db_path, row_factory=None)
+    try:
+        cursor = conn.execute(f"SELECT {'rowid, ' if with_rowid else ''}* FROM quota ORDER BY rowid")
+        columns = [description[0] for description in cursor.description]
+        return columns, cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def quota_checksum(columns, rows):
+    """Checksum of the quota table contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(columns).encode('utf-8'))
+    for row in rows:
+        digest.update(repr(row).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def quota_change_id(db_path=None):
+    """
+    Id of the last change logged by the quota change triggers (quota_changes.py):
+    0 before the first change, None when quota changes are not tracked (the
+    table or one of its triggers is missing)
+    """
+    conn = connect(db_path=db_path, row_factory=None)
+    try:
+        tracked = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE (type = 'table' AND name = 'quota_changes') "
+            "OR (type = 'trigger' AND name IN ('quota_changes_insert', 'quota_changes_update', "
+            "'quota_changes_delete'))"
+        ).fetchone()[0]
+        if tracked != 4:
+            return None
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'quota_changes'"
+                           ).fetchone()
+        return row[0] if row is not None else 0
+    finally:
+        conn.close()
+
+
+def _read_cache(path):
+    """Return the cached snapshot, or None when missing or unreadable"""
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != CACHE_FORMAT_VERSION:
+        return None
+    return snapshot
+
+
+def _write_cache(path, snapshot):
+    """Atomically replace the cache file; a read-only directory only disables caching"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"无法写入定额缓存 {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def cached_snapshot(db_path=None):
+    """
+    The cached snapshot without checking it against the database: a dict with
+    'stamp', 'checksum' (None for a patched index), 'change_id' (see
+    quota_change_id()) and 'index', or None
+    """
+    return _read_cache(cache_path(db_path))
+
+
+def store_quota_index(index, checksum, change_id, db_path=None):
+    """
+    Save an index (e.g. a patched one, with checksum None) as the snapshot of
+    the database as it is now
+    """
+    _write_cache(cache_path(db_path), {
+        'version': CACHE_FORMAT_VERSION,
+        'stamp': database_stamp(db_path),
+        'checksum': checksum,
+        'change_id': change_id,
+        'index': index,
+    })
+
+
+def load_quota_index(use_cache=True, db_path=None):
+    """
+    Return the QuotaIndex of the quota table, from the cache file when valid.
+
+    The cache is valid when the database (and WAL) mtime/size are unchanged,
+    or, when quota changes are tracked (quota_changes.py), when no change was
+    logged since the snapshot.  Otherwise the quota table is re-read and its
+    checksum compared with the cached one: if only other tables changed, the
+    cached index is reused and the stamp refreshed; if quota changed, the
+    index is rebuilt and saved.
+
+    Args:
+        use_cache (bool): Read and write the cache file
+        db_path (str, optional): Database path, config.DATABASE_PATH by default
+
+    Returns:
+        QuotaIndex: The quota index (empty on database errors)
+    """
+    global last_load_source
+    path = cache_path(db_path)
+    stamp = database_stamp(db_path)
+
+    snapshot = _read_cache(path) if use_cache else None
+    if snapshot is not None and snapshot['stamp'] == stamp:
+        last_load_source = 'cache'
+        return snapshot['index']
+
+    try:
+        # Read before the rows: a change logged in between is applied again
+        change_id = quota_change_id(db_path)
+        if (snapshot is not None and change_id is not None
+                and snapshot['change_id'] == change_id):
+            # Every quota write is logged: no new change, no quota change
+            last_load_source = 'change_id'
+            store_quota_index(snapshot['index'], snapshot['checksum'], change_id, db_path)
+            return snapshot['index']
+        columns, rows = fetch_quota_rows(db_path, with_rowid=True)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        last_load_source = 'error'
+        return QuotaIndex([])
+
+    checksum = quota_checksum(columns, rows)
+    if snapshot is not None and snapshot['checksum'] == checksum:
+        index = snapshot['index']
+        last_load_source = 'checksum'
+    else:
+        record_class = QuotaRecord.for_columns(columns[1:])
+        index = QuotaIndex([record_class(*row[1:]) for row in rows],
+                           positions=[row[0] for row in rows])
+        last_load_source = 'rebuilt' if use_cache else 'uncached'
+
+    if use_cache:
+        _write_cache(path, {
+            'version': CACHE_FORMAT_VERSION,
+            'stamp': stamp,
+            'checksum': checksum,
+            'change_id': change_id,
+            'index': index,
+        })
+    return index
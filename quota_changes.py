@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Quota Change Tracking
+Log changed (effected_from, 类别1, 定额) keys of the quota table with
+triggers, patch the cached quota index in place and re-match only the
+payroll records whose effected_from and sheet名 map onto a changed key
+"""
+
+import argparse
+import sqlite3
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import category_mapping, calculate_effected_from
+from db import connect
+from quota_cache import load_quota_index, quota_change_id, cached_snapshot, store_quota_index
+import quota_cache
+from records import QuotaRecord
+from match import match_record, BatchCounters
+from payroll_generator import payroll_records_by_rowid, ROWID_BATCH_SIZE
+from results_store import MatchResultWriter
+
+SCHEMA = """
+-- Keys of inserted, updated and deleted quota rows, until applied
+CREATE TABLE IF NOT EXISTS quota_changes (
+    change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT,
+    quota_rowid INTEGER,
+    effected_from,
+    类别1,
+    定额,
+    changed_at TEXT DEFAULT (datetime('now'))
+);
+
+CREATE TRIGGER IF NOT EXISTS quota_changes_insert AFTER INSERT ON quota
+BEGIN
+    INSERT INTO quota_changes (operation, quota_rowid, effected_from, 类别1, 定额)
+    VALUES ('insert', NEW.rowid, NEW.effected_from, NEW.类别1, NEW.定额);
+END;
+
+-- An update can move a row between groups: both keys are logged
+CREATE TRIGGER IF NOT EXISTS quota_changes_update AFTER UPDATE ON quota
+BEGIN
+    INSERT INTO quota_changes (operation, quota_rowid, effected_from, 类别1, 定额)
+    VALUES ('update', OLD.rowid, OLD.effected_from, OLD.类别1, OLD.定额);
+    INSERT INTO quota_changes (operation, quota_rowid, effected_from, 类别1, 定额)
+    VALUES ('update', NEW.rowid, NEW.effected_from, NEW.类别1, NEW.定额);
+END;
+
+CREATE TRIGGER IF NOT EXISTS quota_changes_delete AFTER DELETE ON quota
+BEGIN
+    INSERT INTO quota_changes (operation, quota_rowid, effected_from, 类别1, 定额)
+    VALUES ('delete', OLD.rowid, OLD.effected_from, OLD.类别1, OLD.定额);
+END;
+"""
+
+# Quota rows of one (effected_from, 类别1) group (IS also matches NULL keys)
+GROUP_ROWS_QUERY = ("SELECT rowid, * FROM quota WHERE effected_from IS ? AND 类别1 IS ? "
+                    "ORDER BY rowid")
+
+
+class QuotaChangeStats:
+    """Counters of one apply_changes() call"""
+
+    def __init__(self):
+        self.change_count = 0
+        self.group_count = 0
+        self.patched_group_count = 0
+        # 'patched', or how load_quota_index() got the index
+        self.index_source = None
+        self.affected_count = 0
+        self.changed_count = 0
+
+
+def install(db_path=None):
+    """Create the quota_changes table and the triggers on quota"""
+    conn = connect(readonly=False, db_path=db_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def pending_changes(conn, last_change_id):
+    """
+    Logged changes up to last_change_id
+
+    Returns:
+        list: (change_id, effected_from, 类别1) tuples in change order
+    """
+    return conn.execute(
+        "SELECT change_id, effected_from, 类别1 FROM quota_changes "
+        "WHERE change_id <= ? ORDER BY change_id",
+        (last_change_id,)
+    ).fetchall()
+
+
+def patch_index(index, conn, groups):
+    """
+    Re-read the quota rows of the given (effected_from, 类别1) groups and
+    patch them into an index built with quota rowid positions
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    patch = {}
+    for effected_from, category in groups:
+        cursor.execute(GROUP_ROWS_QUERY, (effected_from, category))
+        record_class = QuotaRecord.for_columns(
+            [description[0] for description in cursor.description][1:]
+        )
+        patch[(effected_from, category)] = [(row[0], record_class(*row[1:]))
+                                            for row in cursor.fetchall()]
+    index.patch(patch)
+
+
+def current_index(conn, changes, change_id, stats, use_cache=True, db_path=None):
+    """
+    The quota index with the logged changes applied.
+
+    The cached index is patched group by group when it records which changes
+    it already contains and every change since is still in the log (change
+    ids have no gap): the snapshot's change id is read before its rows, so
+    re-reading the logged groups brings it up to date without reading the
+    rest of the table.  Otherwise the index is loaded by load_quota_index().
+
+    Args:
+        changes (list): pending_changes() up to change_id
+
+    Returns:
+        QuotaIndex: The current quota index
+    """
+    snapshot = cached_snapshot(db_path) if use_cache else None
+    snapshot_id = snapshot.get('change_id') if snapshot is not None else None
+    if snapshot_id is not None:
+        newer = [change for change in changes if change[0] > snapshot_id]
+        # Changes applied without saving the index (--no-quota-cache) leave a gap
+        if [number for number, _, _ in newer] == list(range(snapshot_id + 1, change_id + 1)):
+            index = snapshot['index']
+            groups = {(effected_from, category) for _, effected_from, category in newer}
+            patch_index(index, conn, groups)
+            stats.patched_group_count = len(groups)
+            stats.index_source = 'patched'
+            return index
+
+    index = load_quota_index(use_cache, db_path)
+    stats.index_source = quota_cache.last_load_source
+    return index
+
+
+def affected_rowids(conn, groups):
+    """
+    Payroll rowids whose effected_from and sheet名 map onto a changed
+    (effected_from, 类别1) group: every record of such a 文件名/sheet名 pair
+    has its filter 1 count (and maybe its decision) changed.
+
+    Returns:
+        list: Sorted payroll rowids
+    """
+    sheet_names = [
+        sheet_name for sheet_name, date_mapping in category_mapping.items()
+        if any((effected_from, category) in groups
+               for effected_from, categories in date_mapping.items()
+               for category in categories)
+    ]
+    if not sheet_names:
+        return []
+
+    pairs = []
+    placeholders = ", ".join("?" * len(sheet_names))
+    for file_name, sheet_name in conn.execute(
+            f"SELECT DISTINCT 文件名, sheet名 FROM payroll_details WHERE sheet名 IN ({placeholders})",
+            sheet_names):
+        try:
+            effected_from = calculate_effected_from(file_name, sheet_name)
+        except (ValueError, TypeError):
+            # Such records end as errors whatever the quota table holds
+            continue
+        categories = category_mapping[sheet_name].get(effected_from, [])
+        if any((effected_from, category) in groups for category in categories):
+            pairs.append((file_name, sheet_name))
+
+    rowids = []
+    for file_name, sheet_name in pairs:
+        rowids.extend(row[0] for row in conn.execute(
+            "SELECT rowid FROM payroll_details WHERE 文件名 IS ? AND sheet名 IS ?",
+            (file_name, sheet_name)
+        ))
+    rowids.sort()
+    return rowids
+
+
+def stored_decisions(conn, rowids):
+    """payroll rowid -> (status, 代码) stored in match_results for the given rowids"""
+    has_results = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'match_results'"
+    ).fetchone()
+    if not has_results:
+        return {}
+    stored = {}
+    for start in range(0, len(rowids), ROWID_BATCH_SIZE):
+        batch = rowids[start:start + ROWID_BATCH_SIZE]
+        placeholders = ", ".join("?" * len(batch))
+        for payroll_rowid, status, code in conn.execute(
+                f"SELECT payroll_rowid, status, 代码 FROM match_results "
+                f"WHERE payroll_rowid IN ({placeholders})", batch):
+            stored[payroll_rowid] = (status, code)
+    return stored
+
+
+def apply_changes(dry_run=False, use_cache=True, db_path=None, report=None):
+    """
+    Apply the logged quota changes: patch the quota index, re-match the
+    affected payroll records, store their decisions and clear the log.
+
+    Args:
+        dry_run (bool): Only count the affected records and changed decisions
+        use_cache (bool): Patch and save the quota cache file
+        db_path (str, optional): Database path, config.DATABASE_PATH by default
+        report (callable, optional): Called as report(payroll rowid, payroll
+            record, MatchResult, stored (status, 代码) or None) for every
+            changed decision
+
+    Returns:
+        QuotaChangeStats: The counters, or None when changes are not tracked
+    """
+    # Changes logged from here on are left for the next call
+    change_id = quota_change_id(db_path)
+    if change_id is None:
+        return None
+
+    stats = QuotaChangeStats()
+    conn = connect(db_path=db_path)
+    try:
+        changes = pending_changes(conn, change_id)
+        stats.change_count = len(changes)
+        if not changes:
+            return stats
+        groups = {(effected_from, category) for _, effected_from, category in changes}
+        stats.group_count = len(groups)
+        index = current_index(conn, changes, change_id, stats, use_cache, db_path)
+
+        rowids = affected_rowids(conn, groups)
+        stats.affected_count = len(rowids)
+        stored = stored_decisions(conn, rowids)
+
+        writer = None if dry_run else MatchResultWriter("quota_changes", db_path=db_path)
+        counters = BatchCounters()
+        try:
+            for payroll_rowid, payroll_record in payroll_records_by_rowid(rowids, conn):
+                result = match_record(index, payroll_record)
+                counters.add(result)
+                previous = stored.get(payroll_rowid)
+                if previous != (result.status, result.code):
+                    stats.changed_count += 1
+                    if report is not None:
+                        report(payroll_rowid, payroll_record, result, previous)
+                if writer is not None:
+                    writer.add(payroll_rowid, result, payroll_record)
+        except BaseException:
+            if writer is not None:
+                writer.conn.close()
+            raise
+    finally:
+        conn.close()
+
+    if dry_run:
+        return stats
+
+    # The applied changes leave the log together with the last decisions;
+    # a targeted run covers no rowid range, so it does not move the watermark
+    writer.flush()
+    writer.conn.execute("DELETE FROM quota_changes WHERE change_id <= ?", (change_id,))
+    writer.watermark = None
+    writer.close(counters)
+
+    # Save the patched index (load_quota_index() saved any other one)
+    if stats.index_source == 'patched':
+        store_quota_index(index, None, change_id, db_path)
+    return stats
+
+
+def print_change(payroll_rowid, payroll_record, result, previous):
+    """Report callback printing one changed decision"""
+    before = f"{previous[0]} {previous[1] or ''}".strip() if previous else "未匹配"
+    print(f"  rowid {payroll_rowid}: {payroll_record['文件名']} / {payroll_record['sheet名']} / "
+          f"定额 {payroll_record['定额']}: {before} -> {result.status} {result.code or ''}".rstrip())
+
+
+def main(argv=None):
+    """Install the change triggers, or apply the logged quota changes"""
+    parser = argparse.ArgumentParser(description="定额变更跟踪 - 只重新匹配受影响的工资记录")
+    parser.add_argument("--install", action="store_true",
+                        help="创建 quota_changes 表及定额表触发器")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只统计受影响的记录及改变的决策, 不写入结果")
+    parser.add_argument("--no-quota-cache", action="store_true",
+                        help="不使用定额缓存文件，直接查询定额表")
+    parser.add_argument("--verbose", action="store_true",
+                        help="打印每条改变的决策")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("定额变更跟踪 - Quota Change Tracking")
+    print("=" * 60)
+
+    try:
+        if args.install:
+            install()
+            print("已创建 quota_changes 表及触发器, 之后的定额变更将被记录")
+            return 0
+        stats = apply_changes(args.dry_run, not args.no_quota_cache,
+                              report=print_change if args.verbose else None)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return 1
+
+    if stats is None:
+        print("未跟踪定额变更, 请先运行: python quota_changes.py --install")
+        return 1
+    if not stats.change_count:
+        print("没有待处理的定额变更")
+        return 0
+    print(f"定额变更数: {stats.change_count}")
+    print(f"受影响的定额分组 (effected_from, 类别1): {stats.group_count}")
+    if stats.index_source == 'patched':
+        print(f"定额索引: 缓存索引已就地更新 {stats.patched_group_count} 个分组 (校验和一致)")
+    else:
+        print(f"定额索引: 重新加载 ({stats.index_source})")
+    print(f"重新匹配的工资记录数: {stats.affected_count}")
+    print(f"决策改变的记录数: {stats.changed_count}")
+    if args.dry_run:
+        print("(试运行, 未写入结果)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
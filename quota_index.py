@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Quota Index
+Hash index over the quota table used by the two-level filter in match.py
+"""
+
+import bisect
+import math
+
+from config import (category_mapping, QUOTA_TOLERANCE, QUOTA_ROUND_DIGITS,
+                    QUOTA_NEAR_MISS_WINDOW)
+
+
+def _numeric(value):
+    """Whether a 定额 value can be range-matched (a real, non-NaN number)"""
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and not math.isnan(value))
+
+
+class QuotaIndex:
+    """
+    Hash index over quota records.
+
+    Records are bucketed once on (effected_from, 类别1) for filter 1 and on
+    (effected_from, 类别1, 定额) for filter 2, so that each payroll record is
+    resolved with a handful of dictionary lookups instead of a full scan of
+    the quota list.  The original position of every record is kept so that
+    filtered results come back in the same order as a linear scan would
+    return them.
+
+    Filter 2 compares 定额 exactly by default.  With a tolerance (|a - b| <=
+    tolerance) or fixed-point rounding (round(a, digits) == round(b, digits))
+    it uses per-(effected_from, 类别1) sorted arrays of 定额 and bisect range
+    queries instead, so approximate matching stays logarithmic.
+    """
+
+    def __init__(self, quota_data, positions=None):
+        """
+        Build the index.
+
+        Args:
+            quota_data (list): List of quota data dictionaries, as returned
+                by query_quota_table()
+            positions (list, optional): Increasing sort position of each
+                record (the quota rowids, so that patch() can insert records
+                re-read from the table); list indexes by default
+        """
+        self.quota_data = quota_data
+        self.positions = list(positions) if positions is not None else list(range(len(quota_data)))
+        # (effected_from, 类别1) -> number of quota records
+        self._filter1_buckets = {}
+        # (effected_from, 类别1, 定额) -> list of (position, quota record)
+        self._filter2_buckets = {}
+        # (effected_from, 类别1) -> (sorted numeric 定额 values,
+        #                            (position, quota record) in the same order)
+        self._sorted_values = {}
+
+        groups = {}
+        for position, item in zip(self.positions, quota_data):
+            groups.setdefault((item.get('effected_from'), item.get('类别1')), []).append(
+                (position, item)
+            )
+        for key, entries in groups.items():
+            self._index_group(key, entries)
+
+        self.set_tolerance(QUOTA_TOLERANCE, QUOTA_ROUND_DIGITS, QUOTA_NEAR_MISS_WINDOW)
+
+    def _index_group(self, key, entries):
+        """Index the (position, record) entries of one (effected_from, 类别1) group"""
+        if not entries:
+            return
+        self._filter1_buckets[key] = len(entries)
+        numeric = []
+        for position, item in entries:
+            quota_value = item.get('定额')
+            self._filter2_buckets.setdefault(key + (quota_value,), []).append((position, item))
+            if _numeric(quota_value):
+                numeric.append((quota_value, position, item))
+        if numeric:
+            numeric.sort(key=lambda entry: (entry[0], entry[1]))
+            self._sorted_values[key] = (
+                [quota_value for quota_value, _, _ in numeric],
+                [(position, item) for _, position, item in numeric],
+            )
+
+    def patch(self, groups):
+        """
+        Replace whole (effected_from, 类别1) groups in place.
+
+        Args:
+            groups (dict): (effected_from, 类别1) -> list of (position, quota
+                record) with the group's current records in position order
+                (an empty list removes the group).  Positions must be on the
+                same scale as the index's, i.e. quota rowids.
+        """
+        for key in [key for key in self._filter2_buckets if key[:2] in groups]:
+            del self._filter2_buckets[key]
+        for key in groups:
+            self._filter1_buckets.pop(key, None)
+            self._sorted_values.pop(key, None)
+            self._index_group(key, groups[key])
+
+        kept = [
+            (position, item) for position, item in zip(self.positions, self.quota_data)
+            if (item.get('effected_from'), item.get('类别1')) not in groups
+        ]
+        merged = sorted(kept + [entry for entries in groups.values() for entry in entries],
+                        key=lambda entry: entry[0])
+        self.positions = [position for position, _ in merged]
+        self.quota_data = [item for _, item in merged]
+
+    def __len__(self):
+        return len(self.quota_data)
+
+    def __setstate__(self, state):
+        # The comparison settings are not part of the cached index: an index
+        # loaded from the cache file starts from the current config
+        self.__dict__.update(state)
+        self.set_tolerance(QUOTA_TOLERANCE, QUOTA_ROUND_DIGITS, QUOTA_NEAR_MISS_WINDOW)
+
+    def set_tolerance(self, tolerance=0.0, round_digits=None,
+                      near_miss_window=QUOTA_NEAR_MISS_WINDOW):
+        """
+        Choose how filter 2 compares 定额.
+
+        Args:
+            tolerance (float): Match 定额 within this absolute difference (0: exact)
+            round_digits (int, optional): Match 定额 equal after rounding to this
+                many decimal places
+            near_miss_window (float): In exact mode, report 定额 within this
+                difference of a quota value as near misses (0: off)
+        """
+        if tolerance and round_digits is not None:
+            raise ValueError("Use either a 定额 tolerance or rounding, not both")
+        if tolerance < 0:
+            raise ValueError(f"Negative 定额 tolerance: {tolerance}")
+        self.tolerance = tolerance
+        self.round_digits = round_digits
+        self.near_miss_window = near_miss_window
+
+    @property
+    def approximate(self):
+        """Whether filter 2 matches 定额 approximately"""
+        return bool(self.tolerance) or self.round_digits is not None
+
+    @staticmethod
+    def valid_categories(sheet_name, effected_from):
+        """
+        Return the distinct quota categories (类别1) that a payroll sheet maps
+        onto for a given effected_from date.
+        """
+        if sheet_name in category_mapping and effected_from in category_mapping[sheet_name]:
+            # dict.fromkeys drops duplicates while keeping the configured order
+            return list(dict.fromkeys(category_mapping[sheet_name][effected_from]))
+        return []
+
+    def filter1_count(self, effected_from, categories):
+        """
+        Number of quota records passing filter 1
+        (类别1 in categories and effected_from matches).
+        """
+        return sum(
+            self._filter1_buckets.get((effected_from, category), 0)
+            for category in categories
+        )
+
+    def range_data(self, effected_from, categories, low, high):
+        """
+        Quota records passing filter 1 with low <= 定额 <= high, in the same
+        order as they appear in quota_data.
+        """
+        entries = []
+        for category in categories:
+            sorted_values = self._sorted_values.get((effected_from, category))
+            if sorted_values is not None:
+                values, value_entries = sorted_values
+                entries.extend(value_entries[bisect.bisect_left(values, low):
+                                             bisect.bisect_right(values, high)])
+        entries.sort(key=lambda entry: entry[0])
+        return [item for _, item in entries]
+
+    def filter2_data(self, effected_from, categories, quota_value):
+        """
+        Quota records passing filter 1 and filter 2 (定额 matches), in the
+        same order as they appear in quota_data.
+        """
+        if self.approximate and _numeric(quota_value):
+            if self.round_digits is None:
+                return self.range_data(effected_from, categories,
+                                       quota_value - self.tolerance,
+                                       quota_value + self.tolerance)
+            # Values equal after rounding differ by less than one unit
+            unit = 10 ** -self.round_digits
+            rounded = round(quota_value, self.round_digits)
+            return [
+                item for item in self.range_data(effected_from, categories,
+                                                 quota_value - unit, quota_value + unit)
+                if round(item['定额'], self.round_digits) == rounded
+            ]
+
+        buckets = [
+            self._filter2_buckets[key]
+            for key in ((effected_from, category, quota_value) for category in categories)
+            if key in self._filter2_buckets
+        ]
+        if not buckets:
+            return []
+        if len(buckets) == 1:
+            return [item for _, item in buckets[0]]
+        return [item for _, item in sorted(
+            (entry for bucket in buckets for entry in bucket),
+            key=lambda entry: entry[0]
+        )]
+
+    def lookup(self, sheet_name, effected_from, quota_value):
+        """
+        Apply both filters for one payroll record.
+
+        Returns:
+            tuple: (filter1_count, filter2_count, filtered_data)
+        """
+        categories = self.valid_categories(sheet_name, effected_from)
+        filter1_count = self.filter1_count(effected_from, categories)
+        filter2_data = self.filter2_data(effected_from, categories, quota_value)
+        return filter1_count, len(filter2_data), filter2_data
+
+    def near_miss(self, sheet_name, effected_from, quota_value, filter2_data):
+        """
+        Whether no quota 定额 equals the payroll 定额 exactly but one is close:
+        matched only through the tolerance or rounding, or, in exact mode, an
+        unmatched 定额 within near_miss_window of a filter 1 quota record.
+        """
+        if filter2_data:
+            return self.approximate and all(
+                item.get('定额') != quota_value for item in filter2_data
+            )
+        if self.approximate or not self.near_miss_window or not _numeric(quota_value):
+            return False
+        categories = self.valid_categories(sheet_name, effected_from)
+        return bool(self.range_data(effected_from, categories,
+                                    quota_value - self.near_miss_window,
+                                    quota_value + self.near_miss_window))
+
+
+def build_quota_index(quota_data=None):
+    """
+    Build a QuotaIndex, querying the quota table when no data is given.
+    """
+    if quota_data is None:
+        from query_quota_table import query_quota_table
+        quota_data = query_quota_table()
+    return QuotaIndex(quota_data)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Record Types
+Compact, slotted record types for payroll and quota rows
+"""
+
+import keyword
+import unicodedata
+from collections.abc import Mapping
+
+
+def _usable_attr(column):
+    """Whether a column name can be used as a slot name as-is"""
+    return (column.isidentifier() and not keyword.iskeyword(column)
+            and not column.startswith('_')
+            # Python normalizes identifiers in source code to NFKC
+            and unicodedata.normalize('NFKC', column) == column)
+
+
+def _make_init(attrs):
+    """
+    Build an __init__ assigning positional values to the given slots.
+    Generated code avoids a per-column loop when millions of rows are built.
+    """
+    params = ", ".join(f"_{position}" for position in range(len(attrs)))
+    body = "".join(f"    self.{attr} = _{position}\n" for position, attr in enumerate(attrs))
+    namespace = {}
+    exec(f"def __init__(self, {params}):\n{body or '    pass'}\n", namespace)
+    return namespace['__init__']
+
+
+class SlottedRecord(Mapping):
+    """
+    Base class of the slotted record types.
+
+    Each column is stored in a __slots__ attribute instead of a per-row dict.
+    Records behave like read-only dicts keyed by the column names
+    (record['定额'], record.get('类别1'), keys(), items(), dict(record)), and
+    repr() matches the dict repr so printed diagnostics are unchanged.
+    Concrete classes are created per column list with for_columns().
+    """
+
+    __slots__ = ()
+
+    # Column names in table order and the attribute holding each column
+    _fields = ()
+    _slot_of = {}
+    _attrs = ()
+
+    # Concrete classes by column tuple, per base class
+    _classes = None
+
+    @classmethod
+    def for_columns(cls, columns):
+        """
+        Return the record class of `cls` for a column list, creating it once.
+        Columns named like a class attribute (get, keys, items, ...) are
+        stored under a generated name, so they never shadow a method.
+        """
+        columns = tuple(columns)
+        record_class = cls._classes.get(columns)
+        if record_class is None:
+            attrs = tuple(
+                column if _usable_attr(column) and not hasattr(cls, column) else f'_c{position}'
+                for position, column in enumerate(columns)
+            )
+            record_class = type(cls.__name__, (cls,), {
+                '__slots__': attrs,
+                '__init__': _make_init(attrs),
+                '_fields': columns,
+                '_slot_of': dict(zip(columns, attrs)),
+                '_attrs': attrs,
+            })
+            cls._classes[columns] = record_class
+        return record_class
+
+    @classmethod
+    def from_row(cls, columns, row):
+        """Build a record from a column list and a row tuple"""
+        return cls.for_columns(columns)(*row)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._slot_of[key])
+        except (KeyError, TypeError):
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, key):
+        try:
+            return key in self._slot_of
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        # Concrete classes are created at runtime, so pickle through the base class
+        return (_rebuild_record, (self.__class__.__mro__[1].__name__, self._fields,
+                                  tuple(getattr(self, attr) for attr in self._attrs)))
+
+    def values_tuple(self):
+        """Column values in table order"""
+        return tuple(getattr(self, attr) for attr in self._attrs)
+
+
+class PayrollRecord(SlottedRecord):
+    """A row of payroll_details"""
+
+    __slots__ = ()
+    _classes = {}
+
+
+class QuotaRecord(SlottedRecord):
+    """A row of quota"""
+
+    __slots__ = ()
+    _classes = {}
+
+
+_RECORD_BASES = {
+    'PayrollRecord': PayrollRecord,
+    'QuotaRecord': QuotaRecord,
+}
+
+
+def _rebuild_record(base_name, columns, values):
+    """Unpickle a record created by SlottedRecord.for_columns()"""
+    return _RECORD_BASES[base_name].for_columns(columns)(*values)
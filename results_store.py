@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Match Results Store
+Persist batch matching decisions into the match_results table
+"""
+
+import hashlib
+import sys
+import os
+from datetime import datetime
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from match import MATCH_ERROR
+
+# Rows passed to one executemany() call
+WRITE_BATCH_SIZE = 1000
+
+# Rows written per transaction before committing
+DEFAULT_COMMIT_INTERVAL = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS match_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    engine TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    processed_count INTEGER,
+    success_count INTEGER,
+    skip_count INTEGER,
+    error_count INTEGER,
+    watermark INTEGER
+);
+
+-- Latest decision per payroll record; run_id tells which run produced it
+CREATE TABLE IF NOT EXISTS match_results (
+    payroll_rowid INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    effected_from TEXT,
+    filter1_count INTEGER,
+    filter2_count INTEGER,
+    代码 TEXT,
+    status TEXT NOT NULL,
+    message TEXT,
+    content_hash TEXT
+);
+
+CREATE INDEX IF NOT EXISTS match_results_run ON match_results (run_id);
+"""
+
+# Columns added after the first version of the schema: table -> [(column, type)]
+ADDED_COLUMNS = {
+    'match_runs': [('watermark', 'INTEGER')],
+    'match_results': [('content_hash', 'TEXT')],
+}
+
+
+def payroll_content_hash(payroll_record):
+    """
+    Hash of the payroll columns that matching depends on (文件名, sheet名, 定额)
+    """
+    key = repr((payroll_record['文件名'], payroll_record['sheet名'], payroll_record['定额']))
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def connect_writable(db_path=None, check_same_thread=True):
+    """
+    Open a writable connection tuned for bulk writes (WAL journal,
+    synchronous=NORMAL) and make sure the results tables exist.
+    """
+    conn = connect(readonly=False, db_path=db_path, row_factory=None,
+                   check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    return conn
+
+
+class MatchResultWriter:
+    """
+    Buffered writer of MatchResults into match_results.
+
+    Rows are collected in memory and written with executemany() every
+    WRITE_BATCH_SIZE rows; the transaction is committed every
+    commit_interval rows (unless it is None) and when the writer is closed.  Messages are only
+    stored for errors: NODECISION details can be rebuilt from the counts.
+    """
+
+    def __init__(self, engine, commit_interval=DEFAULT_COMMIT_INTERVAL, db_path=None,
+                 check_same_thread=True, run_id=None):
+        """
+        Start a new run, or continue an unfinished one.
+
+        Args:
+            engine (str): Name of the matching engine, recorded in match_runs
+            commit_interval (int): Rows written per transaction; None leaves
+                every commit to the caller (commit() / close())
+            db_path (str, optional): Database path, config.DATABASE_PATH by default
+            check_same_thread (bool): Pass False to add rows from another
+                thread than the one creating the writer (one at a time)
+            run_id (int, optional): Unfinished run to continue (see checkpoint.py)
+        """
+        self.commit_interval = commit_interval
+        self.conn = connect_writable(db_path, check_same_thread)
+        # Highest payroll rowid written by this run
+        self.watermark = None
+        if run_id is None:
+            self.run_id = self.conn.execute(
+                "INSERT INTO match_runs (engine, started_at) VALUES (?, ?)",
+                (engine, datetime.now().isoformat(timespec='seconds'))
+            ).lastrowid
+            self.conn.commit()
+        else:
+            self.run_id = run_id
+            self.watermark = self.conn.execute(
+                "SELECT MAX(payroll_rowid) FROM match_results WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+        self.written_count = 0
+        self._buffer = []
+        self._uncommitted = 0
+
+    def add(self, payroll_rowid, result, payroll_record=None):
+        """
+        Queue the MatchResult of one payroll record
+
+        Args:
+            payroll_rowid (int): rowid of the payroll record
+            result (MatchResult): Result of match_record()
+            payroll_record (dict, optional): The record (or its 文件名/sheet名/定额
+                summary); its content hash is stored for incremental runs
+        """
+        self._buffer.append((
+            payroll_rowid, self.run_id, result.effected_from,
+            result.filter1_count, result.filter2_count, result.code, result.status,
+            result.message if result.status == MATCH_ERROR else None,
+            payroll_content_hash(payroll_record) if payroll_record is not None else None,
+        ))
+        if self.watermark is None or payroll_rowid > self.watermark:
+            self.watermark = payroll_rowid
+        if len(self._buffer) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows, committing when commit_interval is reached"""
+        if self._buffer:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO match_results (payroll_rowid, run_id, effected_from, "
+                "filter1_count, filter2_count, 代码, status, message, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._buffer
+            )
+            self.written_count += len(self._buffer)
+            self._uncommitted += len(self._buffer)
+            self._buffer = []
+        if self.commit_interval is not None and self._uncommitted >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """Commit the rows (and anything else) written on the connection so far"""
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self, counters=None, finished=True):
+        """
+        Write the remaining rows, record the run summary and close.
+
+        Args:
+            counters (BatchCounters, optional): Final counters of the run
+            finished (bool): Pass False to leave the run unfinished (resumable):
+                the summary is recorded without finished_at
+        """
+        self.flush()
+        values = [datetime.now().isoformat(timespec='seconds') if finished else None]
+        if counters is not None:
+            values += [counters.processed_count, counters.success_count,
+                       counters.skip_count, counters.error_count]
+        else:
+            values += [None] * 4
+        self.conn.execute(
+            "UPDATE match_runs SET finished_at = ?, processed_count = ?, success_count = ?, "
+            "skip_count = ?, error_count = ?, watermark = ? WHERE run_id = ?",
+            values + [self.watermark, self.run_id]
+        )
+        self.conn.commit()
+        self.conn.close()
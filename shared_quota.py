@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared-Memory Quota Index
+Encode the quota index once into flat NumPy arrays in a shared memory block
+that worker processes attach to read-only, without copying or unpickling
+the quota records
+"""
+
+import functools
+import math
+import pickle
+import struct
+import sys
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import QUOTA_TOLERANCE, QUOTA_ROUND_DIGITS, QUOTA_NEAR_MISS_WINDOW
+from quota_index import QuotaIndex, _numeric
+from records import QuotaRecord, SlottedRecord
+
+# Most decimal places tried for the fixed-point 定额 keys
+MAX_FIXED_POINT_DIGITS = 9
+
+# Largest fixed-point key magnitude (keeps the search bounds within int64)
+MAX_FIXED_POINT_KEY = 2 ** 62
+
+# Byte alignment of every array in the shared block
+ALIGNMENT = 8
+
+# Decoded quota records kept per process
+RECORD_CACHE_SIZE = 4096
+
+# Length prefix of the pickled header at the start of the block
+_HEADER_LENGTH = struct.Struct("<Q")
+
+
+def fixed_point_digits(values):
+    """
+    Fewest decimal places at which every numeric 定额 survives the round trip
+    value -> round(value * 10**digits) -> value, or None when there is none.
+    At that scale two 定额 values are equal exactly when their keys are.
+    """
+    for digits in range(MAX_FIXED_POINT_DIGITS + 1):
+        scale = 10 ** digits
+        if all(abs(value) * scale < MAX_FIXED_POINT_KEY and round(value * scale) / scale == value
+               for value in values):
+            return digits
+    return None
+
+
+def _record_rows(records):
+    """
+    Column names and value tuples of the quota records
+
+    Raises:
+        ValueError: When the records do not all have the same columns
+    """
+    if not records:
+        return ['定额', 'effected_from', '类别1'], []
+    first = records[0]
+    if isinstance(first, SlottedRecord):
+        if any(type(record) is not type(first) for record in records):
+            raise ValueError("Quota records have differing columns")
+        return list(first.keys()), [record.values_tuple() for record in records]
+    names = list(first.keys())
+    if any(list(record.keys()) != names for record in records):
+        raise ValueError("Quota records have differing columns")
+    return names, [tuple(record.values()) for record in records]
+
+
+def _column_kind(name, values):
+    """Array encoding of a quota column: 'text', 'real' or 'integer'"""
+    types = set(map(type, values)) - {type(None)}
+    if types <= {str}:
+        return 'text'
+    if types == {float}:
+        return 'real'
+    if types == {int} and all(abs(value) < 2 ** 63 for value in values if value is not None):
+        return 'integer'
+    raise ValueError(f"Quota column {name} mixes value types")
+
+
+def _encode_column(kind, values):
+    """Arrays (by suffix) of one column in the shared layout"""
+    missing = np.array([value is None for value in values], dtype=np.bool_)
+    if kind == 'text':
+        encoded = [value.encode('utf-8') if value is not None else b'' for value in values]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return {'offsets': offsets,
+                'bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                'missing': missing}
+    dtype = np.float64 if kind == 'real' else np.int64
+    return {'values': np.array([value if value is not None else 0 for value in values],
+                               dtype=dtype),
+            'missing': missing}
+
+
+class SharedQuotaIndex:
+    """
+    A QuotaIndex encoded into one shared memory block.
+
+    Quota records are sorted by (effected_from, 类别1) group, then numeric
+    定额 first by fixed-point key, then quota position.  Each group is a
+    slice of the arrays: filter 1 counts are slice lengths and filter 2
+    (exact or within a range) is a searchsorted on the group's int64 keys.
+    Every column is stored column-wise (text as UTF-8 bytes with offsets,
+    numbers as float64/int64), and only the candidates of a lookup are
+    decoded back into quota records, identical to the original ones.
+
+    The process calling create() owns the block, which its close() unlinks;
+    workers attach(name) and map the same pages read-only.  Lookups give
+    the same results as QuotaIndex, whose filter and near-miss logic is
+    shared.
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self._owner = owner
+        buffer = shm.buf
+        (header_size,) = _HEADER_LENGTH.unpack_from(buffer, 0)
+        header = pickle.loads(bytes(buffer[_HEADER_LENGTH.size:_HEADER_LENGTH.size + header_size]))
+        self._count = header['count']
+        self._scale = 10 ** header['digits']
+        self._columns = header['columns']
+        self._record_class = QuotaRecord.for_columns([name for name, _ in self._columns])
+        self._groups = {key: number for number, key in enumerate(header['groups'])}
+
+        arrays = {}
+        for name, (offset, dtype, length) in header['arrays'].items():
+            array = np.frombuffer(buffer, dtype=np.dtype(dtype), count=length, offset=offset)
+            array.flags.writeable = False
+            arrays[name] = array
+        self._arrays = arrays
+        self._group_offsets = arrays['group_offsets']
+        self._numeric_ends = arrays['numeric_ends']
+        self._keys = arrays['keys']
+        self._positions = arrays['positions']
+        self._record = functools.lru_cache(maxsize=RECORD_CACHE_SIZE)(self._decode_record)
+        self.set_tolerance(QUOTA_TOLERANCE, QUOTA_ROUND_DIGITS, QUOTA_NEAR_MISS_WINDOW)
+
+    @classmethod
+    def create(cls, quota_index):
+        """
+        Encode a QuotaIndex into a new shared memory block owned by the caller.
+
+        Raises:
+            ValueError: When the quota records cannot be encoded (differing
+                columns, mixed value types, or 定额 values without an exact
+                fixed-point form)
+        """
+        names, rows = _record_rows(quota_index.quota_data)
+        values_by_column = list(zip(*rows)) if rows else [()] * len(names)
+        column_values = dict(zip(names, values_by_column))
+        columns = [(name, _column_kind(name, column_values[name])) for name in names]
+
+        quota_values = column_values['定额']
+        numeric = [_numeric(value) for value in quota_values]
+        digits = fixed_point_digits([value for value, is_numeric in zip(quota_values, numeric)
+                                     if is_numeric])
+        if digits is None:
+            raise ValueError("定额 values have no exact fixed-point form")
+        scale = 10 ** digits
+        keys = np.array([round(value * scale) if is_numeric else 0
+                         for value, is_numeric in zip(quota_values, numeric)], dtype=np.int64)
+
+        group_pairs = list(zip(column_values['effected_from'], column_values['类别1']))
+        group_keys = sorted(set(group_pairs), key=repr)
+        group_of = {key: number for number, key in enumerate(group_keys)}
+        groups = np.array([group_of[pair] for pair in group_pairs], dtype=np.int64)
+        numeric = np.array(numeric, dtype=np.bool_)
+        positions = np.array(quota_index.positions, dtype=np.int64)
+        # Sort by group, numeric 定额 first, key, position (last lexsort key first)
+        order = np.lexsort((positions, keys, ~numeric, groups))
+
+        group_offsets = np.zeros(len(group_keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(groups, minlength=len(group_keys)), out=group_offsets[1:])
+        numeric_ends = group_offsets[:-1] + np.bincount(groups, weights=numeric,
+                                                        minlength=len(group_keys)).astype(np.int64)
+
+        arrays = {
+            'group_offsets': group_offsets,
+            'numeric_ends': numeric_ends,
+            'keys': keys[order],
+            'positions': positions[order],
+        }
+        row_order = order.tolist()
+        for name, kind in columns:
+            values = column_values[name]
+            for suffix, array in _encode_column(kind, [values[row] for row in row_order]).items():
+                arrays[f"{name}.{suffix}"] = array
+
+        # Header first, then every array at an aligned offset
+        layout = {}
+        while True:
+            header = pickle.dumps({
+                'count': len(rows), 'digits': digits, 'columns': columns,
+                'groups': group_keys, 'arrays': layout,
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+            offset = -(-(_HEADER_LENGTH.size + len(header)) // ALIGNMENT) * ALIGNMENT
+            new_layout = {}
+            for name, array in arrays.items():
+                new_layout[name] = (offset, array.dtype.str, len(array))
+                offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+            # The header holds the offsets, which depend on the header size
+            if new_layout == layout:
+                break
+            layout = new_layout
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            _HEADER_LENGTH.pack_into(shm.buf, 0, len(header))
+            shm.buf[_HEADER_LENGTH.size:_HEADER_LENGTH.size + len(header)] = header
+            for name, array in arrays.items():
+                start, _, _ = layout[name]
+                shm.buf[start:start + array.nbytes] = array.tobytes()
+            return cls(shm, owner=True)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to a block created by create() in another process"""
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self):
+        """Name of the shared memory block, for attach()"""
+        return self._shm.name
+
+    @property
+    def nbytes(self):
+        """Size of the shared memory block"""
+        return self._shm.size
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Release this process's mapping (the owner also unlinks the block)"""
+        self._record.cache_clear()
+        self._arrays = self._group_offsets = self._numeric_ends = None
+        self._keys = self._positions = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _value(self, name, kind, row):
+        if self._arrays[f"{name}.missing"][row]:
+            return None
+        if kind == 'text':
+            offsets = self._arrays[f"{name}.offsets"]
+            return bytes(self._arrays[f"{name}.bytes"][offsets[row]:offsets[row + 1]]).decode('utf-8')
+        value = self._arrays[f"{name}.values"][row]
+        return float(value) if kind == 'real' else int(value)
+
+    def _decode_record(self, row):
+        return self._record_class(*[self._value(name, kind, row) for name, kind in self._columns])
+
+    def _group_bounds(self, effected_from, categories):
+        """(start, numeric end, end) row slices of the (effected_from, 类别1) groups"""
+        bounds = []
+        for category in categories:
+            number = self._groups.get((effected_from, category))
+            if number is not None:
+                bounds.append((int(self._group_offsets[number]), int(self._numeric_ends[number]),
+                               int(self._group_offsets[number + 1])))
+        return bounds
+
+    def _records(self, rows):
+        """Quota records of the given rows, in quota position order"""
+        rows.sort(key=lambda row: self._positions[row])
+        return [self._record(row) for row in rows]
+
+    def _key_rows(self, bounds, low_key, high_key):
+        rows = []
+        for start, numeric_end, _ in bounds:
+            keys = self._keys[start:numeric_end]
+            rows.extend(range(start + int(np.searchsorted(keys, low_key, 'left')),
+                              start + int(np.searchsorted(keys, high_key, 'right'))))
+        return rows
+
+    # Filter 1 and the comparison settings work as in QuotaIndex
+    valid_categories = staticmethod(QuotaIndex.valid_categories)
+    set_tolerance = QuotaIndex.set_tolerance
+    approximate = QuotaIndex.approximate
+    lookup = QuotaIndex.lookup
+    near_miss = QuotaIndex.near_miss
+
+    def filter1_count(self, effected_from, categories):
+        """Number of quota records passing filter 1"""
+        return sum(end - start for start, _, end in self._group_bounds(effected_from, categories))
+
+    def range_data(self, effected_from, categories, low, high):
+        """
+        Quota records passing filter 1 with low <= 定额 <= high, in the same
+        order as they appear in quota_data.
+        """
+        bound = MAX_FIXED_POINT_KEY
+        low_key = max(-bound, min(bound, math.floor(low * self._scale) - 1))
+        high_key = max(-bound, min(bound, math.ceil(high * self._scale) + 1))
+        rows = [row for row in self._key_rows(self._group_bounds(effected_from, categories),
+                                              low_key, high_key)
+                if low <= self._record(row)['定额'] <= high]
+        return self._records(rows)
+
+    def filter2_data(self, effected_from, categories, quota_value):
+        """
+        Quota records passing filter 1 and filter 2 (定额 matches), in the
+        same order as they appear in quota_data.
+        """
+        if self.approximate and _numeric(quota_value):
+            return QuotaIndex.filter2_data(self, effected_from, categories, quota_value)
+
+        bounds = self._group_bounds(effected_from, categories)
+        if _numeric(quota_value):
+            key = round(quota_value * self._scale)
+            # A 定额 without an exact key equals no quota 定额
+            if abs(key) >= MAX_FIXED_POINT_KEY or key / self._scale != quota_value:
+                return []
+            return self._records(self._key_rows(bounds, key, key))
+        return self._records([
+            row for _, numeric_end, end in bounds for row in range(numeric_end, end)
+            if self._record(row)['定额'] == quota_value
+        ])
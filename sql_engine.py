@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SQL Matching Engine
+Push both quota filters of match.filter_quota_data into SQLite
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import category_mapping, calculate_effected_from
+from db import connect
+from payroll_generator import payroll_rowid_bounds
+from match import match_record, MatchResult, MATCH_SUCCESS, MATCH_SKIP_ZERO, MATCH_NO_MATCH
+
+# Filter 1 counts per (sheet名, effected_from) and filter 2 counts per 定额
+QUOTA_FILTER1_SELECT = """
+    SELECT m.sheet名 AS sheet名, m.effected_from AS effected_from,
+           COUNT(*) AS filter1_count
+    FROM temp.category_map m
+    JOIN quota q ON q.类别1 = m.类别1 AND q.effected_from = m.effected_from
+    GROUP BY m.sheet名, m.effected_from
+"""
+
+QUOTA_FILTER2_SELECT = """
+    SELECT m.sheet名 AS sheet名, m.effected_from AS effected_from, q.定额 AS 定额,
+           COUNT(*) AS filter2_count, MIN(q.代码) AS 代码
+    FROM temp.category_map m
+    JOIN quota q ON q.类别1 = m.类别1 AND q.effected_from = m.effected_from
+    GROUP BY m.sheet名, m.effected_from, q.定额
+"""
+
+
+def _sql_effected_from(file_name, sheet_name):
+    """calculate_effected_from for use inside SQL; NULL when it cannot be resolved"""
+    try:
+        return calculate_effected_from(file_name, sheet_name)
+    except Exception:
+        return None
+
+
+def prepare_connection(conn):
+    """
+    Register calculate_effected_from() and build the temp tables used by the
+    matching query:
+
+    - temp.category_map (sheet名, effected_from, 类别1): category_mapping flattened
+    - temp.quota_filter1 (sheet名, effected_from, filter1_count)
+    - temp.quota_filter2 (sheet名, effected_from, 定额, filter2_count, 代码)
+    """
+    conn.create_function("calculate_effected_from", 2, _sql_effected_from, deterministic=True)
+
+    conn.executescript("""
+        DROP TABLE IF EXISTS temp.category_map;
+        DROP TABLE IF EXISTS temp.quota_filter1;
+        DROP TABLE IF EXISTS temp.quota_filter2;
+        CREATE TEMP TABLE category_map (
+            sheet名 TEXT, effected_from TEXT, 类别1 TEXT,
+            PRIMARY KEY (sheet名, effected_from, 类别1)
+        );
+    """)
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.category_map VALUES (?, ?, ?)",
+        [
+            (sheet_name, effected_from, category)
+            for sheet_name, date_mapping in category_mapping.items()
+            for effected_from, categories in date_mapping.items()
+            for category in categories
+        ]
+    )
+    conn.executescript(f"""
+        CREATE TEMP TABLE quota_filter1 AS {QUOTA_FILTER1_SELECT};
+        CREATE UNIQUE INDEX temp.quota_filter1_key ON quota_filter1 (sheet名, effected_from);
+
+        CREATE TEMP TABLE quota_filter2 AS {QUOTA_FILTER2_SELECT};
+        CREATE UNIQUE INDEX temp.quota_filter2_key ON quota_filter2 (sheet名, effected_from, 定额);
+    """)
+
+
+def payroll_columns(conn):
+    """Return the column names of payroll_details in table order"""
+    return [row[1] for row in conn.execute("PRAGMA table_info(payroll_details)")]
+
+
+def match_query(columns):
+    """
+    The payroll_details JOIN quota matching query for a rowid range.
+
+    Args:
+        columns (list): payroll_details columns to return after the match columns
+
+    Returns:
+        str: SQL with two parameters (first_rowid, last_rowid), selecting
+        payroll rowid, effected_from, filter1_count, filter2_count, 代码 and
+        the payroll columns, in rowid order
+    """
+    column_list = ", ".join(f'p."{column}"' for column in columns)
+    return f"""
+        WITH p AS (
+            SELECT rowid AS payroll_rowid, *,
+                   calculate_effected_from(文件名, sheet名) AS resolved_effected_from
+            FROM payroll_details
+            WHERE rowid BETWEEN ? AND ?
+        )
+        SELECT p.payroll_rowid,
+               p.resolved_effected_from,
+               COALESCE(f1.filter1_count, 0),
+               COALESCE(f2.filter2_count, 0),
+               f2.代码,
+               {column_list}
+        FROM p
+        LEFT JOIN temp.quota_filter1 f1
+               ON f1.sheet名 = p.sheet名 AND f1.effected_from = p.resolved_effected_from
+        LEFT JOIN temp.quota_filter2 f2
+               ON f2.sheet名 = p.sheet名 AND f2.effected_from = p.resolved_effected_from
+              AND f2.定额 IS p.定额
+        ORDER BY p.payroll_rowid
+    """
+
+
+def sql_match_records(quota_index, limit=None, conn=None):
+    """
+    Match payroll records with a single payroll_details JOIN quota query.
+
+    SQLite resolves effected_from and both filter counts for every row;
+    Python only classifies the result (and checks unmatched rows for a near
+    miss in the quota index).  Rows that need the full diagnostics of
+    match_record() (unresolvable effected_from, several candidates) are
+    re-matched through the quota index so that the results are identical to
+    the Python engine.
+
+    Args:
+        quota_index (QuotaIndex): Quota index used for the fallback rows and
+            the near-miss check of unmatched rows
+        limit (int, optional): Only match the first `limit` records
+        conn (sqlite3.Connection, optional): Connection to use; a read-only
+            connection is opened (and closed) when not given.  It must allow
+            temp tables (no query_only).
+
+    Yields:
+        tuple: (payroll rowid, payroll_record, MatchResult) in rowid order
+    """
+    bounds = payroll_rowid_bounds(limit)
+    if bounds is None:
+        return
+    first_rowid, last_rowid, _ = bounds
+
+    own_conn = conn is None
+    if own_conn:
+        # Read-only, but the matching query needs temp tables
+        conn = connect(query_only=False)
+    try:
+        prepare_connection(conn)
+        columns = payroll_columns(conn)
+
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(match_query(columns), (first_rowid, last_rowid))
+
+        for row in cursor:
+            payroll_rowid, effected_from, filter1_count, filter2_count, code = row[:5]
+            payroll_record = dict(zip(columns, row[5:]))
+
+            if payroll_record['定额'] == 0:
+                result = MatchResult(MATCH_SKIP_ZERO, None, None, None, None, None)
+            elif effected_from is not None and filter2_count == 0:
+                near_miss = quota_index.near_miss(payroll_record['sheet名'], effected_from,
+                                                  payroll_record['定额'], [])
+                result = MatchResult(MATCH_NO_MATCH, effected_from, filter1_count, 0, None, None,
+                                     near_miss)
+            elif effected_from is not None and filter2_count == 1 and code is not None:
+                result = MatchResult(MATCH_SUCCESS, effected_from, filter1_count, 1, code, None)
+            else:
+                result = match_record(quota_index, payroll_record)
+            yield payroll_rowid, payroll_record, result
+    finally:
+        if own_conn:
+            conn.close()
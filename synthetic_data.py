@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic Data Generator
+Write a payroll database with the payroll_details and quota schemas, filled
+with generated records that follow category_mapping
+"""
+
+import argparse
+import contextlib
+import random
+import sys
+import os
+import tempfile
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import config
+from config import category_mapping, calculate_effected_from
+from db import connect
+
+PAYROLL_SCHEMA = """
+    CREATE TABLE payroll_details (
+        文件名 TEXT, sheet名 TEXT, 职员全名 TEXT, 日期 TEXT, 客户名称 TEXT,
+        型号 TEXT, 工序全名 TEXT, 工序 TEXT, 计件数量 REAL, 系数 REAL,
+        定额 REAL, 金额 REAL, 备注 TEXT
+    )
+"""
+
+QUOTA_SCHEMA = """
+    CREATE TABLE quota (
+        类别1 TEXT, 类别2 TEXT, 加工工序 TEXT, 型号 TEXT, 定额 REAL,
+        effected_from TEXT, 代码 TEXT
+    )
+"""
+
+# Rows per executemany() call
+INSERT_BATCH_SIZE = 10000
+
+# Payroll file name suffixes (YYYYMM + suffix)
+FILE_SUFFIXES = ['.xls', '.xlsx', '_1.xls', '_2.xlsx']
+
+# sheet名 used for the invalid-sheet share of the payroll records
+INVALID_SHEET_NAME = "其他"
+
+
+def payroll_months():
+    """
+    YYYYMM strings covering every configured effected_from period: from the
+    year before the first dated period to the year after the last one
+    """
+    years = sorted({
+        int(date_str[:4])
+        for date_mapping in category_mapping.values()
+        for date_str in date_mapping
+        if date_str != "19000101"
+    })
+    return [f"{year}{month:02d}"
+            for year in range(years[0] - 1, years[-1] + 2)
+            for month in range(1, 13)]
+
+
+def generate_quota_rows(count, ambiguity_rate, rng):
+    """
+    Generate quota rows.  Each row takes an (effected_from, 类别1) pair of
+    category_mapping and a 定额 unique to the row, except that a share of
+    `ambiguity_rate` rows repeats the (effected_from, 类别1, 定额) key of an
+    earlier row with another 代码, so payroll records hitting it cannot be
+    decided.
+    """
+    pairs = sorted({
+        (effected_from, category)
+        for date_mapping in category_mapping.values()
+        for effected_from, categories in date_mapping.items()
+        for category in categories
+    })
+    # Unique two-decimal 定额 values
+    values = rng.sample(range(1, max(count * 10, 100)), count)
+
+    rows = []
+    for position in range(count):
+        if rows and rng.random() < ambiguity_rate:
+            category, _, _, _, quota_value, effected_from, _ = rng.choice(rows)
+        else:
+            effected_from, category = rng.choice(pairs)
+            quota_value = values[position] / 100
+        rows.append((
+            category,
+            f"类别{position % 20}",
+            f"工序{position}",
+            f"Y{position % 200}",
+            quota_value,
+            effected_from,
+            f"Q{position:07d}",
+        ))
+    return rows
+
+
+def generate_payroll_rows(count, quota_rows, rng, zero_rate=0.02, miss_rate=0.05,
+                          invalid_sheet_rate=0.005):
+    """
+    Generate payroll rows.  File months are spread evenly over payroll_months()
+    and sheet名 over the category_mapping sheets.  The 定额 of a record is
+    taken from a quota row its sheet/month can match, except for a share of
+    `zero_rate` zeros and `miss_rate` values no quota row has.  A share of
+    `invalid_sheet_rate` records uses a sheet名 missing from category_mapping.
+    """
+    # 定额 values per (effected_from, 类别1)
+    quota_values = {}
+    for category, _, _, _, quota_value, effected_from, _ in quota_rows:
+        quota_values.setdefault((effected_from, category), []).append(quota_value)
+
+    months = payroll_months()
+    sheet_names = list(category_mapping)
+    candidates = {}
+
+    rows = []
+    for position in range(count):
+        file_name = rng.choice(months) + rng.choice(FILE_SUFFIXES)
+        if rng.random() < invalid_sheet_rate:
+            sheet_name = INVALID_SHEET_NAME
+        else:
+            sheet_name = rng.choice(sheet_names)
+
+        draw = rng.random()
+        if draw < zero_rate:
+            quota_value = 0
+        elif draw < zero_rate + miss_rate or sheet_name == INVALID_SHEET_NAME:
+            # Three decimals never equal a generated quota 定额
+            quota_value = rng.randrange(1, 100000) / 100 + 0.005
+        else:
+            key = (file_name[:6], sheet_name)
+            if key not in candidates:
+                effected_from = calculate_effected_from(file_name, sheet_name)
+                candidates[key] = [
+                    quota_value
+                    for category in category_mapping[sheet_name][effected_from]
+                    for quota_value in quota_values.get((effected_from, category), ())
+                ]
+            if candidates[key]:
+                quota_value = rng.choice(candidates[key])
+            else:
+                quota_value = rng.randrange(1, 100000) / 100 + 0.005
+
+        pieces = rng.randrange(1, 200)
+        rows.append((
+            file_name,
+            sheet_name,
+            f"员工{position % 500}",
+            f"{file_name[:4]}-{file_name[4:6]}-{rng.randrange(1, 29):02d}",
+            f"客户{position % 50}",
+            f"Y{position % 200}",
+            f"工序全名{position % 300}",
+            f"工序{position % 300}",
+            pieces,
+            1.0,
+            quota_value,
+            round(pieces * quota_value, 2),
+            "",
+        ))
+    return rows
+
+
+def generate_database(path, payroll_count, quota_count, ambiguity_rate=0.02, seed=0,
+                      zero_rate=0.02, miss_rate=0.05, invalid_sheet_rate=0.005):
+    """
+    Write a new synthetic database at `path`, replacing any existing file.
+
+    Args:
+        path (str): Database file to create
+        payroll_count (int): Number of payroll_details rows
+        quota_count (int): Number of quota rows
+        ambiguity_rate (float): Share of quota rows repeating another row's key
+        seed (int): Random seed; equal arguments give an identical database
+        zero_rate (float): Share of payroll records with 定额 0
+        miss_rate (float): Share of payroll records whose 定额 matches no quota row
+        invalid_sheet_rate (float): Share of payroll records with an unknown sheet名
+    """
+    rng = random.Random(seed)
+    quota_rows = generate_quota_rows(quota_count, ambiguity_rate, rng)
+    payroll_rows = generate_payroll_rows(payroll_count, quota_rows, rng, zero_rate,
+                                         miss_rate, invalid_sheet_rate)
+
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    conn = connect(readonly=False, db_path=path, row_factory=None)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(PAYROLL_SCHEMA)
+        conn.execute(QUOTA_SCHEMA)
+        conn.executemany("INSERT INTO quota VALUES (?, ?, ?, ?, ?, ?, ?)", quota_rows)
+        for start in range(0, len(payroll_rows), INSERT_BATCH_SIZE):
+            conn.executemany(
+                "INSERT INTO payroll_details VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                payroll_rows[start:start + INSERT_BATCH_SIZE]
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def temporary_database(payroll_count, quota_count, **kwargs):
+    """
+    Generate a synthetic database in a temporary directory and point
+    config.DATABASE_PATH at it until the block exits.
+
+    Args:
+        payroll_count (int): Number of payroll_details rows
+        quota_count (int): Number of quota rows
+        **kwargs: Further generate_database() arguments (seed, rates)
+
+    Yields:
+        str: Path of the temporary database
+    """
+    original_path = config.DATABASE_PATH
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "payroll.db")
+        generate_database(path, payroll_count, quota_count, **kwargs)
+        config.DATABASE_PATH = path
+        try:
+            yield path
+        finally:
+            config.DATABASE_PATH = original_path
+
+
+def ignore_report(*args):
+    """Report callback printing nothing"""
+
+
+def main(argv=None):
+    """Generate a synthetic database from the command line"""
+    parser = argparse.ArgumentParser(description="生成合成工资数据库")
+    parser.add_argument("path", help="要生成的数据库文件")
+    parser.add_argument("--payroll-rows", type=int, default=100000,
+                        help="工资记录数 (默认: 100000)")
+    parser.add_argument("--quota-rows", type=int, default=5000,
+                        help="定额记录数 (默认: 5000)")
+    parser.add_argument("--ambiguity", type=float, default=0.02,
+                        help="与已有定额键重复的定额记录比例 (默认: 0.02)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 (默认: 0)")
+    args = parser.parse_args(argv)
+
+    generate_database(args.path, args.payroll_rows, args.quota_rows,
+                      args.ambiguity, args.seed)
+    print(f"已生成 {args.path}: {args.payroll_rows} 条工资记录, {args.quota_rows} 条定额记录")
+
+
+if __name__ == "__main__":
+    main()
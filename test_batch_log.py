@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the queued batch logging
+"""
+
+import io
+import json
+import logging
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_log import BatchLog
+from match import MatchResult, NODECISION, MATCH_SUCCESS, MATCH_NODECISION
+
+RECORD = {'文件名': '202006.xls', 'sheet名': '精加工', '职员全名': '张三', '定额': 4.0}
+SUCCESS = MatchResult(MATCH_SUCCESS, '20200301', 10, 1, 'A01', None)
+UNDECIDED = MatchResult(MATCH_NODECISION, '20200301', 10, 2, None,
+                        NODECISION(RECORD, [{'代码': 'A01'}, {'代码': 'A02'}]))
+
+
+def test_jsonl_sampling():
+    """
+    Test that info events are sampled while warnings are always logged
+    """
+    stream = io.StringIO()
+    batch_log = BatchLog('jsonl', logging.INFO, sample=5, stream=stream, progress=False)
+    for number in range(1, 21):
+        batch_log.record(number, number, RECORD, SUCCESS)
+    batch_log.record(21, 21, RECORD, UNDECIDED)
+    batch_log.event("summary", processed=21)
+    batch_log.close()
+
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [event['number'] for event in events[:-2]] == [5, 10, 15, 20]
+    assert events[-2]['status'] == MATCH_NODECISION
+    assert events[-2]['message'].startswith("Cannot make decision - found 2 matching records")
+    assert events[-1] == {'event': 'summary', 'level': 'info', 'processed': 21}
+
+
+def test_text_level():
+    """
+    Test that the text format only logs events at or above the level
+    """
+    stream = io.StringIO()
+    batch_log = BatchLog('text', logging.WARNING, stream=stream, progress=False)
+    batch_log.record(1, 1, RECORD, SUCCESS)
+    batch_log.record(2, 2, RECORD, UNDECIDED)
+    batch_log.close()
+
+    assert stream.getvalue() == (
+        "WARNING #2 rowid=2 202006.xls 精加工 张三 定额=4.0 → nodecision 候选 2 条\n"
+    )
+
+
+if __name__ == "__main__":
+    test_jsonl_sampling()
+    test_text_level()
+    print("All tests passed")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the parallel batch matching
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_matching import serial_results, parallel_results, split_rowid_range
+from columnar_engine import SUMMARY_COLUMNS
+from quota_cache import load_quota_index
+from synthetic_data import temporary_database
+
+
+def _comparable(results):
+    """(rowid, summary, MatchResult with the message as text) of every result"""
+    return [
+        (payroll_rowid, [record[column] for column in SUMMARY_COLUMNS], result._replace(
+            message=str(result.message) if result.message is not None else None))
+        for payroll_rowid, record, result in results
+    ]
+
+
+def test_split_rowid_range():
+    """Test that the ranges are contiguous, cover every rowid and respect the count"""
+    for first_rowid, last_rowid, chunk_count in [(1, 100, 7), (5, 5, 3), (10, 12, 8), (1, 9, 1)]:
+        ranges = split_rowid_range(first_rowid, last_rowid, chunk_count)
+        assert 1 <= len(ranges) <= chunk_count
+        assert ranges[0][0] == first_rowid and ranges[-1][1] == last_rowid
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert start == end + 1
+
+
+def test_parallel_matches_serial():
+    """
+    Test that the workers, with the shared quota index or their own copies,
+    yield the serial results in the same order
+    """
+    with temporary_database(1200, 120, ambiguity_rate=0.2, seed=10):
+        quota_index = load_quota_index(use_cache=False)
+        expected = _comparable(serial_results(quota_index))
+
+        assert _comparable(parallel_results(3, use_quota_cache=False)) == expected
+        assert _comparable(parallel_results(3, quota_index=quota_index)) == expected
+        assert _comparable(parallel_results(2, limit=500, use_quota_cache=False)) == expected[:500]
+
+
+if __name__ == "__main__":
+    test_split_rowid_range()
+    test_parallel_matches_serial()
+    print("All tests passed")
@@ -10,7 +10,8 @@ import os
 
 # Add the current directory to the path to import local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from config import calculate_effected_from, category_mapping
+from config import (calculate_effected_from, category_mapping, compile_category_mapping,
+                    effected_from_cache_info)
 
 
 def test_calculate_effected_from():
@@ -198,12 +199,48 @@ def test_edge_cases():
                 print(f"  ❌ 测试失败 - 意外异常: {e}")
 
 
+def test_effected_from_cache():
+    """
+    Test that repeated lookups of the same month/sheet pair hit the cache
+    """
+    calculate_effected_from('202005.xls', '精加工')
+    before = effected_from_cache_info()
+    
+    # Different file name suffixes of the same month share one cache entry
+    assert calculate_effected_from('202005_1.xlsx', '精加工') == '20200301'
+    assert calculate_effected_from('202005.xls', '精加工') == '20200301'
+    
+    after = effected_from_cache_info()
+    assert after['hits'] == before['hits'] + 2
+    assert after['misses'] == before['misses']
+    assert after['currsize'] <= after['maxsize']
+
+
+def test_sheet_without_dates():
+    """
+    Test that a sheet with an empty date mapping raises ValueError
+    """
+    category_mapping['空'] = {}
+    compile_category_mapping()
+    try:
+        calculate_effected_from('202005.xls', '空')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError for a sheet without dates")
+    finally:
+        del category_mapping['空']
+        compile_category_mapping()
+
+
 if __name__ == "__main__":
     # Run main tests
     success = test_calculate_effected_from()
     
     # Run edge case tests
     test_edge_cases()
+    test_effected_from_cache()
+    test_sheet_without_dates()
     
     if success:
         print("\n🎉 所有主要测试用例通过！")
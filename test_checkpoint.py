@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for checkpointed, resumable matching
+"""
+
+import itertools
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_matching import BatchCounters, process_results
+from checkpoint import checkpointed_results, unfinished_run, CheckpointStats
+from db import connect
+from match import match_record
+from payroll_generator import read_payroll
+from quota_cache import load_quota_index
+from results_store import MatchResultWriter
+from synthetic_data import temporary_database, ignore_report
+
+
+def test_interrupted_run_resumes():
+    """
+    Test that a run interrupted inside a partition resumes from that
+    partition and ends with every record matched once
+    """
+    with temporary_database(1200, 100, seed=11):
+        quota_index = load_quota_index(use_cache=False)
+
+        # First session: stop in the middle of the run, as a crash would
+        writer = MatchResultWriter("checkpoint")
+        counters = BatchCounters()
+        stats = CheckpointStats()
+        results = checkpointed_results(quota_index, writer, counters, stats)
+        process_results(itertools.islice(results, 700), counters, writer, report=ignore_report)
+        results.close()
+        writer.conn.close()
+        assert 0 < stats.completed_count < stats.partition_count
+
+        conn = connect(readonly=False)
+        run_id = unfinished_run(conn)
+        committed = conn.execute("SELECT COUNT(*) FROM match_results").fetchone()[0]
+        checkpointed = conn.execute("SELECT SUM(processed_count) FROM match_checkpoints"
+                                    ).fetchone()[0]
+        conn.close()
+        assert run_id == writer.run_id
+        # Only whole partitions were committed
+        assert committed == checkpointed < 700
+
+        # Second session: skip the completed partitions
+        writer = MatchResultWriter("checkpoint", run_id=run_id)
+        counters = BatchCounters()
+        resumed = CheckpointStats()
+        process_results(checkpointed_results(quota_index, writer, counters, resumed),
+                        counters, writer, report=ignore_report)
+        writer.close(counters, finished=not resumed.stopped)
+        assert resumed.resumed_count == stats.completed_count
+        assert resumed.resumed_count + resumed.completed_count == resumed.partition_count
+        assert counters.processed_count == 1200
+
+        expected = {
+            payroll_rowid: match_record(quota_index, record)
+            for payroll_rowid, record in read_payroll(with_rowid=True)
+        }
+        conn = connect(readonly=False)
+        stored = conn.execute(
+            "SELECT payroll_rowid, status, 代码 FROM match_results WHERE run_id = ?",
+            (run_id,)
+        ).fetchall()
+        assert unfinished_run(conn) is None
+        conn.close()
+        assert len(stored) == 1200
+        for payroll_rowid, status, code in stored:
+            assert (status, code) == (expected[payroll_rowid].status,
+                                      expected[payroll_rowid].code)
+
+
+def test_partition_larger_than_commit_interval():
+    """
+    Test that a partition with more rows than the writer's commit interval
+    is still committed only together with its checkpoint row
+    """
+    with temporary_database(2500, 100, seed=12):
+        conn = connect(readonly=False)
+        conn.execute("UPDATE payroll_details SET 文件名 = '202005.xls'")
+        conn.commit()
+        conn.close()
+        quota_index = load_quota_index(use_cache=False)
+
+        writer = MatchResultWriter("checkpoint", commit_interval=10)
+        counters = BatchCounters()
+        stats = CheckpointStats()
+        results = checkpointed_results(quota_index, writer, counters, stats)
+        process_results(itertools.islice(results, 2200), counters, writer, report=ignore_report)
+        results.close()
+        writer.conn.close()
+        assert stats.partition_count == 1 and stats.completed_count == 0
+
+        conn = connect(readonly=False)
+        assert conn.execute("SELECT COUNT(*) FROM match_results").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM match_checkpoints").fetchone()[0] == 0
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_interrupted_run_resumes()
+    test_partition_larger_than_commit_interval()
+    print("All tests passed")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the index management command
+"""
+
+import sqlite3
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db_indexes import create_indexes, full_scans, verify_plans
+
+
+def make_database():
+    """An empty in-memory database with the project tables"""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE payroll_details (文件名 TEXT, sheet名 TEXT, 职员全名 TEXT, 定额 REAL);
+        CREATE TABLE quota (effected_from TEXT, 类别1 TEXT, 定额 REAL, 代码 TEXT);
+    """)
+    return conn
+
+
+def test_full_scans():
+    """
+    Test that only SCAN lines are reported as full scans
+    """
+    plan = [
+        "SEARCH payroll_details USING INDEX idx_payroll_sheet (sheet名=?)",
+        "SCAN CONSTANT ROW",
+        "SCAN quota",
+        "USE TEMP B-TREE FOR ORDER BY",
+    ]
+    assert full_scans(plan) == ["SCAN quota"]
+
+
+def test_indexes_remove_full_scans():
+    """
+    Test that the filtered queries scan without the indexes and search with them
+    """
+    conn = make_database()
+    assert verify_plans(conn) > 0
+
+    create_indexes(conn)
+    assert verify_plans(conn) == 0
+    conn.close()
+
+
+if __name__ == "__main__":
+    test_full_scans()
+    test_indexes_remove_full_scans()
+    print("All tests passed")
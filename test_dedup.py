@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for distinct-key matching
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from dedup import dedup_results, DedupStats
+from match import match_record
+from payroll_generator import read_payroll
+from quota_cache import load_quota_index
+from synthetic_data import temporary_database
+
+
+def test_dedup_matches_serial():
+    """
+    Test that fanning key results out gives every record the result (and
+    message) of matching it on its own
+    """
+    # Few quota rows, so many payroll records share a key
+    with temporary_database(2000, 30, ambiguity_rate=0.3, seed=5):
+        quota_index = load_quota_index(use_cache=False)
+
+        expected = [
+            (payroll_rowid, match_record(quota_index, record))
+            for payroll_rowid, record in read_payroll(with_rowid=True, row_format='record')
+        ]
+        stats = DedupStats()
+        actual = [(payroll_rowid, result)
+                  for payroll_rowid, _, result in dedup_results(quota_index, stats=stats)]
+
+        assert len(actual) == len(expected) == 2000
+        for (rowid, result), (expected_rowid, expected_result) in zip(actual, expected):
+            assert rowid == expected_rowid
+            assert result[:5] == expected_result[:5]
+            assert str(result.message) == str(expected_result.message)
+        assert stats.row_count == 2000
+        assert stats.key_count < 1000
+        assert sum(stats.key_statuses.values()) == stats.key_count
+
+
+if __name__ == "__main__":
+    test_dedup_matches_serial()
+    print("All tests passed")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the incremental record selection
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_matching import BatchCounters, process_results, serial_results
+from db import connect
+from incremental import last_watermark, select_rowids, IncrementalStats
+from match import match_record, MATCH_SUCCESS
+from payroll_generator import read_payroll
+from quota_cache import load_quota_index
+from results_store import MatchResultWriter
+from synthetic_data import temporary_database, ignore_report
+
+
+def _decision(result):
+    """The stored fields select_rowids() compares"""
+    return [result.status, result.effected_from, result.filter1_count, result.filter2_count,
+            result.code]
+
+
+def test_select_new_edited_and_quota_changed_rows():
+    """
+    Test that rows past the watermark, edited rows and rows whose quota
+    candidates changed are selected, and that untouched rows are skipped
+    """
+    with temporary_database(800, 100, seed=4):
+        quota_index = load_quota_index(use_cache=False)
+        writer = MatchResultWriter("python")
+        conn = connect(readonly=False)
+        # The run is not finished yet
+        assert last_watermark(conn) is None
+
+        counters = BatchCounters()
+        process_results(serial_results(quota_index), counters, writer, report=ignore_report)
+        writer.close(counters)
+        assert last_watermark(conn) == 800
+
+        # Nothing changed: nothing selected
+        stats = IncrementalStats()
+        assert select_rowids(quota_index, conn, 1, 800, stats) == []
+        assert stats.unchanged_count == 800
+
+        # Two new rows, one edited 定额 and one deleted quota row
+        conn.executemany("INSERT INTO payroll_details (文件名, sheet名, 定额) VALUES (?, ?, ?)",
+                         [('202005.xls', '精加工', 1.5), ('202006.xls', '精加工', 2.5)])
+        conn.execute("UPDATE payroll_details SET 定额 = 定额 + 1 WHERE rowid = 5")
+        success_rowid, code = next(
+            (payroll_rowid, result.code) for payroll_rowid, _, result in serial_results(quota_index)
+            if result.status == MATCH_SUCCESS and payroll_rowid != 5)
+        conn.execute("DELETE FROM quota WHERE 代码 = ?", (code,))
+        conn.commit()
+        changed_index = load_quota_index(use_cache=False)
+
+        quota_changed = [
+            payroll_rowid for payroll_rowid, record in read_payroll(with_rowid=True)
+            if payroll_rowid <= 800 and payroll_rowid != 5
+            and _decision(match_record(quota_index, record)) !=
+            _decision(match_record(changed_index, record))
+        ]
+        assert success_rowid in quota_changed
+
+        stats = IncrementalStats()
+        selected = select_rowids(changed_index, conn, 1, 802, stats)
+        conn.close()
+        assert selected == sorted([5, 801, 802] + quota_changed)
+        assert stats.watermark == 800
+        assert stats.new_count == 2
+        assert stats.changed_count == 1
+        assert stats.quota_changed_count == len(quota_changed)
+        assert stats.unchanged_count == 800 - 1 - len(quota_changed)
+
+
+if __name__ == "__main__":
+    test_select_new_edited_and_quota_changed_rows()
+    print("All tests passed")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the matching service
+"""
+
+import http.client
+import json
+import sqlite3
+import sys
+import os
+import threading
+import urllib.error
+import urllib.request
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from match import match_record
+from match_service import make_server, result_json
+from payroll_generator import read_payroll
+from quota_cache import load_quota_index
+from synthetic_data import temporary_database
+
+
+def request(base_url, path, body=None):
+    """Send a GET (or a POST with a JSON body) and return (status, JSON payload)"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data,
+                                 method="POST" if data is not None or path == "/reload" else "GET")
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def raw_post(base_url, path, content_length):
+    """POST with a raw Content-Length header and no body, return (status, JSON payload)"""
+    host, port = base_url[len("http://"):].split(":")
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    try:
+        conn.putrequest("POST", path)
+        conn.putheader("Content-Length", content_length)
+        conn.endheaders()
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_service_endpoints():
+    """
+    Test that the service answers like match_record() for single records,
+    batches and stored records, and picks up quota changes on reload
+    """
+    with temporary_database(300, 100, ambiguity_rate=0.2, seed=9) as db_path:
+        server = make_server(port=0, use_cache=False)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = "http://%s:%d" % server.server_address[:2]
+        try:
+            quota_index = load_quota_index(use_cache=False)
+            stored = list(read_payroll(file_name_prefix="2020", with_rowid=True))
+            records = [record for _, record in stored]
+            expected = [result_json(match_record(quota_index, record)) for record in records]
+
+            status, payload = request(base_url, "/match", records[0])
+            assert status == 200 and payload == expected[0]
+
+            status, payload = request(base_url, "/match/batch", {'records': records})
+            assert status == 200 and payload['results'] == expected
+
+            status, payload = request(base_url, "/match/prefix?file_prefix=2020")
+            assert status == 200
+            assert [result.pop('rowid') for result in payload['results']] == \
+                [rowid for rowid, _ in stored]
+            assert payload['results'] == expected
+
+            status, payload = request(base_url, "/match", {'文件名': '202005.xls'})
+            assert status == 400 and 'sheet名' in payload['error']
+            status, _ = request(base_url, "/nothing")
+            assert status == 404
+            # '²' is a digit to str.isdigit() but not to int()
+            for limit in ("-1", "%C2%B2"):
+                status, payload = request(base_url, f"/match/prefix?limit={limit}")
+                assert status == 400 and 'limit' in payload['error']
+            # Bad lengths are refused before the body is read
+            for content_length in ("-1", "abc"):
+                status, payload = raw_post(base_url, "/match", content_length)
+                assert status == 400 and 'Content-Length' in payload['error']
+
+            # Drop every quota row: after a reload nothing matches
+            conn = sqlite3.connect(db_path)
+            conn.execute("DELETE FROM quota")
+            conn.commit()
+            conn.close()
+            status, payload = request(base_url, "/reload")
+            assert status == 200 and payload['quota_count'] == 0
+            status, payload = request(base_url, "/health")
+            assert payload['quota_count'] == 0
+            status, payload = request(base_url, "/match", records[0])
+            assert payload['filter1_count'] in (0, None)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    test_service_endpoints()
+    print("All tests passed")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the batch run metrics
+"""
+
+import json
+import sys
+import os
+import tempfile
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from metrics import LatencyHistogram, RunMetrics
+
+
+class _Counters:
+    processed_count = 3
+    success_count = 1
+    skip_count = 1
+    error_count = 1
+
+
+def test_latency_quantiles():
+    """
+    Test that quantiles fall within one bucket of the exact value
+    """
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+    for micros in range(1, 1001):
+        histogram.add(micros * 1e-6)
+    assert 500e-6 <= histogram.quantile(0.50) <= 500e-6 * 1.1
+    assert 990e-6 <= histogram.quantile(0.99) <= 1000e-6
+    assert histogram.max == 1000e-6
+
+
+def test_run_metrics_export():
+    """
+    Test the stage totals, the JSON report and the Prometheus textfile
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_path = os.path.join(temp_dir, "metrics.json")
+        prom_path = os.path.join(temp_dir, "metrics.prom")
+        metrics = RunMetrics("python", json_path=json_path, prom_path=prom_path)
+        metrics.add_stage('quota_load', 0.5)
+        for _ in range(3):
+            metrics.clock.start()
+            metrics.clock.lap('match')
+            metrics.clock.lap('report')
+            metrics.record_done()
+        metrics.finish(_Counters())
+
+        with open(json_path, encoding='utf-8') as f:
+            report = json.load(f)
+        assert report['records'] == 3
+        assert report['running'] is False
+        assert report['counters']['success'] == 1
+        assert report['stages']['match']['count'] == 3
+        assert report['stages']['quota_load']['seconds'] == 0.5
+
+        with open(prom_path, encoding='utf-8') as f:
+            text = f.read()
+        assert 'payroll_batch_records_total{engine="python"} 3\n' in text
+        assert 'payroll_batch_stage_seconds_total{engine="python",stage="quota_load"} 0.5\n' in text
+        assert 'payroll_batch_results_total{engine="python",outcome="error"} 1\n' in text
+
+
+if __name__ == "__main__":
+    test_latency_quantiles()
+    test_run_metrics_export()
+    print("All tests passed")
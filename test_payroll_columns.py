@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the memory-mapped payroll column cache
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import payroll_columns
+from batch_matching import serial_results
+from columnar_engine import columnar_match_records
+from db import connect
+from match import MATCH_SUCCESS, MATCH_NODECISION
+from payroll_columns import load_payroll_columns, cached_columns, column_results
+from quota_cache import load_quota_index
+from synthetic_data import temporary_database
+
+SUMMARY_COLUMNS = ['文件名', 'sheet名', '职员全名', '定额']
+
+
+def _comparable(results):
+    """Reported fields of (rowid, record, MatchResult) results"""
+    return [
+        (payroll_rowid, [record[column] for column in SUMMARY_COLUMNS],
+         result.status, result.effected_from, result.filter1_count, result.filter2_count,
+         result.code, str(result.message) if result.message is not None else None,
+         result.near_miss)
+        for payroll_rowid, record, result in results
+    ]
+
+
+def test_column_cache_matches_table_reads():
+    """
+    Test that matching from the column cache gives the serial and columnar
+    results of the table, and that new rows invalidate the cache
+    """
+    with temporary_database(2000, 150, seed=7):
+        conn = connect(readonly=False)
+        # A 定额 stored as text and a NULL 职员全名
+        conn.execute("INSERT INTO payroll_details (文件名, sheet名, 职员全名, 定额) "
+                     "VALUES ('202005.xls', '精加工', NULL, 'abc')")
+        quota_index = load_quota_index(use_cache=False)
+        # A matched 定额 moved off by less than the near-miss window
+        near_rowid = next(payroll_rowid for payroll_rowid, _, result in serial_results(quota_index)
+                          if result.status == MATCH_SUCCESS)
+        conn.execute("UPDATE payroll_details SET 定额 = 定额 + 0.005 WHERE rowid = ?",
+                     (near_rowid,))
+        conn.commit()
+        conn.close()
+
+        columns = load_payroll_columns()
+        assert payroll_columns.last_load_source == 'exported'
+        assert len(columns) == 2001
+        assert columns.arrays['irregular'].sum() == 1
+
+        expected = _comparable(serial_results(quota_index))
+        assert _comparable(column_results(quota_index, columns)) == expected
+        assert _comparable(column_results(quota_index, columns, limit=10)) == expected[:10]
+        assert any(row[2] == MATCH_NODECISION for row in expected)
+        assert [row[0] for row in expected if row[-1]] == [near_rowid]
+
+        # Over the whole table, text 定额 included
+        expected_columnar = _comparable(columnar_match_records(quota_index))
+        assert len(expected_columnar) == 2001
+        assert _comparable(columnar_match_records(quota_index,
+                                                  columns=columns)) == expected_columnar
+        assert [row[-1] for row in expected_columnar] == [row[-1] for row in expected]
+
+        # Reused while the table is unchanged, re-exported after an insert
+        load_payroll_columns()
+        assert payroll_columns.last_load_source == 'cache'
+        conn = connect(readonly=False)
+        conn.execute("INSERT INTO payroll_details (文件名, sheet名, 定额) "
+                     "VALUES ('202006.xls', '精加工', 1.5)")
+        conn.commit()
+        conn.close()
+        assert cached_columns() is None
+        assert len(load_payroll_columns()) == 2002
+        assert payroll_columns.last_load_source == 'exported'
+
+
+if __name__ == "__main__":
+    test_column_cache_matches_table_reads()
+    print("All tests passed")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the seekable payroll cursor
+"""
+
+import random
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from match import next_ambiguous, match_record
+from payroll_cursor import PayrollCursor
+from payroll_generator import read_payroll
+from quota_cache import load_quota_index
+from synthetic_data import temporary_database
+
+
+def test_cursor_seeks_like_a_list():
+    """
+    Test that positions, rowid seeks and iteration agree with a full read,
+    whatever order the pages are visited in
+    """
+    with temporary_database(1500, 50, seed=7):
+        for prefix in (None, "2020"):
+            expected = list(read_payroll(file_name_prefix=prefix, with_rowid=True))
+            with PayrollCursor(prefix, page_size=32, cache_pages=2) as cursor:
+                assert len(cursor) == len(expected)
+
+                # Backwards from the end: pages read by keyset from the next page
+                for position in range(len(expected) - 1, len(expected) - 100, -1):
+                    assert cursor.get(position) == expected[position]
+
+                rng = random.Random(1)
+                for position in rng.sample(range(len(expected)), 50):
+                    assert cursor.get(position) == expected[position]
+                    rowid = expected[position][0]
+                    assert cursor.position_of(rowid) == position
+
+                items = list(cursor.iter_from(10))
+                assert [(rowid, record) for _, rowid, record in items] == expected[10:]
+                assert items[0][0] == 10
+                try:
+                    cursor.get(len(expected))
+                    assert False, "expected IndexError"
+                except IndexError:
+                    pass
+
+
+def _ambiguous(quota_index, record):
+    """Whether more than one quota record passes both filters"""
+    return (match_record(quota_index, record).filter2_count or 0) > 1
+
+
+def test_next_ambiguous_skips_unknown_sheets():
+    """
+    Test that the search for the next ambiguous record steps over a record
+    with an unknown sheet名 instead of failing
+    """
+    with temporary_database(600, 40, ambiguity_rate=0.5, seed=3):
+        quota_index = load_quota_index(use_cache=False)
+        file_name, records = next(
+            (file_name, records) for file_name, records in (
+                (file_name, list(read_payroll(file_name_prefix=file_name, with_rowid=True)))
+                for file_name in sorted({record['文件名'] for record in read_payroll()}))
+            if len(records) > 2 and any(_ambiguous(quota_index, record)
+                                        for _, record in records[1:]))
+        expected = next(position for position, (_, record) in enumerate(records)
+                        if position > 0 and _ambiguous(quota_index, record))
+
+        conn = connect(readonly=False)
+        conn.execute("UPDATE payroll_details SET sheet名 = '不存在的部门' WHERE rowid = ?",
+                     (records[0][0],))
+        conn.commit()
+        conn.close()
+        with PayrollCursor(file_name, page_size=16) as cursor:
+            assert next_ambiguous(cursor, quota_index, file_name, -1) == expected
+            assert next_ambiguous(cursor, quota_index, file_name, len(records) - 1) is None
+
+
+if __name__ == "__main__":
+    test_cursor_seeks_like_a_list()
+    test_next_ambiguous_skips_unknown_sheets()
+    print("All tests passed")
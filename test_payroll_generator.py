@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the payroll query builder
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from payroll_generator import build_payroll_query
+
+
+def test_build_payroll_query():
+    """
+    Test that filters are bound as parameters and the projection is honoured
+    """
+    sql, params = build_payroll_query()
+    assert sql == "select * from payroll_details order by rowid"
+    assert params == []
+    
+    sql, params = build_payroll_query(file_name_prefix="202005", sheet_name="精加工")
+    assert sql == ("select * from payroll_details "
+                   "where 文件名 like ? and sheet名 = ? order by rowid")
+    assert params == ["202005%", "精加工"]
+    
+    sql, params = build_payroll_query(columns=["文件名", "定额"], rowid_range=(10, 20),
+                                      with_rowid=True)
+    assert sql == ('select rowid, "文件名", "定额" from payroll_details '
+                   'where rowid between ? and ? order by rowid')
+    assert params == [10, 20]
+    
+    sql, params = build_payroll_query(columns=[], sheet_name="精加工", with_rowid=True,
+                                      descending=True, limit=5, offset=10)
+    assert sql == ("select rowid from payroll_details "
+                   "where sheet名 = ? order by rowid desc limit ? offset ?")
+    assert params == ["精加工", 5, 10]
+
+
+def test_build_payroll_query_rejects_quoted_column():
+    """
+    Test that column names cannot break out of their quotes
+    """
+    try:
+        build_payroll_query(columns=['定额" from quota --'])
+    except ValueError:
+        return
+    assert False, "expected ValueError"
+
+
+if __name__ == "__main__":
+    test_build_payroll_query()
+    test_build_payroll_query_rejects_quoted_column()
+    print("✅ 查询构造测试通过")
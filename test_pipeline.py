@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the pipelined matching
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from match import match_record
+from payroll_generator import read_payroll
+from pipeline import pipeline_results
+from quota_cache import load_quota_index
+from synthetic_data import temporary_database
+
+
+def test_pipeline_matches_serial():
+    """
+    Test that the pipeline emits every record once, in rowid order, with the
+    same results as matching the records one by one
+    """
+    with temporary_database(1000, 200, ambiguity_rate=0.1, seed=3):
+        quota_index = load_quota_index(use_cache=False)
+
+        expected = [
+            (payroll_rowid, match_record(quota_index, record))
+            for payroll_rowid, record in read_payroll(with_rowid=True)
+        ]
+        emitted = []
+        batch_sizes = []
+
+        def emit(results):
+            batch_sizes.append(len(results))
+            emitted.extend((payroll_rowid, result) for payroll_rowid, _, result in results)
+
+        pipeline_results(quota_index, emit, batch_size=64, queue_size=1)
+        assert [rowid for rowid, _ in emitted] == [rowid for rowid, _ in expected]
+        assert [result[:5] for _, result in emitted] == [result[:5] for _, result in expected]
+        assert max(batch_sizes) == 64
+
+        emitted.clear()
+        pipeline_results(quota_index, emit, limit=100, batch_size=64)
+        assert len(emitted) == 100
+
+
+if __name__ == "__main__":
+    test_pipeline_matches_serial()
+    print("All tests passed")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the background prefetching
+"""
+
+import sys
+import os
+import threading
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from prefetch import Prefetcher
+
+
+def test_prefetch_order_and_errors():
+    """
+    Test that prepared items come back in order and that an error is raised
+    where it happened
+    """
+    def items():
+        yield from range(5)
+        raise ValueError("bad record")
+
+    prefetcher = Prefetcher(items(), lambda item: item * 10, depth=2)
+    assert [next(prefetcher) for _ in range(5)] == [0, 10, 20, 30, 40]
+    try:
+        next(prefetcher)
+        assert False, "expected ValueError"
+    except ValueError as e:
+        assert str(e) == "bad record"
+    prefetcher.close()
+
+    with Prefetcher(iter(range(3)), str) as prefetcher:
+        assert list(prefetcher) == ['0', '1', '2']
+
+
+def test_close_stops_background_thread():
+    """
+    Test that close() stops a prefetch blocked on a full queue and closes the
+    source generator on the background thread
+    """
+    closed_on = []
+
+    def items():
+        try:
+            yield from range(1000)
+        finally:
+            closed_on.append(threading.current_thread().name)
+
+    prefetcher = Prefetcher(items(), lambda item: item, depth=3)
+    assert next(prefetcher) == 0
+    prefetcher.close()
+    assert closed_on == ["prefetch"]
+    assert list(prefetcher) == []
+
+
+if __name__ == "__main__":
+    test_prefetch_order_and_errors()
+    test_close_stops_background_thread()
+    print("All tests passed")
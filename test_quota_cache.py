@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the quota snapshot cache
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import quota_cache
+from db import connect
+from quota_cache import load_quota_index, cache_path, database_stamp
+from synthetic_data import temporary_database
+
+
+def _execute(sql):
+    """Run one write statement on the test database"""
+    conn = connect(readonly=False)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_cache_reuse_and_invalidation():
+    """
+    Test that a valid cache is reused, that a database change only rebuilds
+    the index when the quota table changed, and that a broken file is rebuilt
+    """
+    with temporary_database(200, 80, seed=2):
+        index = load_quota_index()
+        assert quota_cache.last_load_source == 'rebuilt'
+        assert os.path.exists(cache_path())
+        assert load_quota_index().quota_data == index.quota_data
+        assert quota_cache.last_load_source == 'cache'
+
+        # Another table changed: new stamp, same quota checksum
+        stamp = database_stamp()
+        _execute("DELETE FROM payroll_details WHERE rowid <= 100")
+        assert database_stamp() != stamp
+        assert load_quota_index().quota_data == index.quota_data
+        assert quota_cache.last_load_source == 'checksum'
+        load_quota_index()
+        assert quota_cache.last_load_source == 'cache'
+
+        # The quota table changed: rebuilt with the new rows
+        _execute("DELETE FROM quota WHERE rowid = 1")
+        assert len(load_quota_index()) == len(index) - 1
+        assert quota_cache.last_load_source == 'rebuilt'
+
+        # An unreadable cache file is replaced
+        with open(cache_path(), 'wb') as f:
+            f.write(b'not a pickle')
+        assert len(load_quota_index()) == len(index) - 1
+        assert quota_cache.last_load_source == 'rebuilt'
+        load_quota_index()
+        assert quota_cache.last_load_source == 'cache'
+
+        assert len(load_quota_index(use_cache=False)) == len(index) - 1
+        assert quota_cache.last_load_source == 'uncached'
+
+
+if __name__ == "__main__":
+    test_cache_reuse_and_invalidation()
+    print("All tests passed")
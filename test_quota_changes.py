@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for quota change tracking and targeted re-matching
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_matching import BatchCounters, process_results
+from db import connect
+from match import match_record
+from payroll_generator import read_payroll
+import quota_cache
+from quota_cache import load_quota_index, cached_snapshot, quota_change_id
+from quota_changes import install, apply_changes
+from results_store import MatchResultWriter
+from synthetic_data import temporary_database, ignore_report
+
+
+def test_changes_patch_index_and_rematch():
+    """
+    Test that logged quota changes patch the cached index and that re-matching
+    only the affected records leaves the same decisions as a full run
+    """
+    with temporary_database(1500, 200, seed=5):
+        install()
+        quota_index = load_quota_index()
+        assert cached_snapshot()['change_id'] == 0
+
+        writer = MatchResultWriter("python")
+        counters = BatchCounters()
+        process_results(
+            ((payroll_rowid, record, match_record(quota_index, record))
+             for payroll_rowid, record in read_payroll(with_rowid=True)),
+            counters, writer, report=ignore_report
+        )
+        writer.close(counters)
+
+        # Give a matched payroll 定额 a second quota row, move one quota row
+        # to another 定额 and delete another
+        conn = connect(readonly=False)
+        file_name, sheet_name, quota_value = conn.execute(
+            "SELECT p.文件名, p.sheet名, p.定额 FROM payroll_details p "
+            "JOIN match_results r ON r.payroll_rowid = p.rowid "
+            "WHERE r.status = 'success' LIMIT 1"
+        ).fetchone()
+        effected_from, category = conn.execute(
+            "SELECT effected_from, 类别1 FROM quota WHERE 代码 = ("
+            "SELECT r.代码 FROM match_results r JOIN payroll_details p "
+            "ON r.payroll_rowid = p.rowid WHERE p.文件名 = ? AND p.sheet名 = ? "
+            "AND p.定额 = ? LIMIT 1)", (file_name, sheet_name, quota_value)
+        ).fetchone()
+        conn.execute("INSERT INTO quota (类别1, 定额, effected_from, 代码) VALUES (?, ?, ?, ?)",
+                     (category, quota_value, effected_from, "NEW-1"))
+        conn.execute("UPDATE quota SET 定额 = 定额 + 0.5 WHERE rowid = 10")
+        conn.execute("DELETE FROM quota WHERE rowid = 20")
+        conn.commit()
+        logged = conn.execute("SELECT COUNT(*) FROM quota_changes").fetchone()[0]
+        conn.close()
+        assert logged == 4
+
+        stats = apply_changes(dry_run=True)
+        assert stats.change_count == 4
+        assert 0 < stats.changed_count <= stats.affected_count < 1500
+
+        stats = apply_changes()
+        assert stats.index_source == 'patched'
+        assert 0 < stats.patched_group_count <= stats.group_count <= 4
+        assert stats.changed_count > 0
+
+        # Every stored decision equals a full match with a rebuilt index
+        rebuilt = load_quota_index(use_cache=False)
+        expected = {
+            payroll_rowid: match_record(rebuilt, record)
+            for payroll_rowid, record in read_payroll(with_rowid=True)
+        }
+        conn = connect()
+        stored = conn.execute(
+            "SELECT payroll_rowid, status, 代码, filter1_count FROM match_results"
+        ).fetchall()
+        assert conn.execute("SELECT COUNT(*) FROM quota_changes").fetchone()[0] == 0
+        conn.close()
+        assert len(stored) == 1500
+        for payroll_rowid, status, code, filter1_count in stored:
+            result = expected[payroll_rowid]
+            assert (status, code, filter1_count) == (result.status, result.code,
+                                                     result.filter1_count)
+
+        # The saved index is the patched one, with the applied change id,
+        # trusted without reading the quota table while no change is logged
+        assert cached_snapshot()['change_id'] == quota_change_id()
+        assert load_quota_index().quota_data == rebuilt.quota_data
+        assert quota_cache.last_load_source == 'change_id'
+        assert apply_changes().change_count == 0
+
+        # Changes applied without the cache leave a gap after the saved change
+        # id: the next changes are not patched onto the stale index
+        conn = connect(readonly=False)
+        conn.execute("UPDATE quota SET 定额 = 定额 + 0.5 WHERE rowid = 30")
+        conn.commit()
+        assert apply_changes(use_cache=False).index_source == 'uncached'
+        conn.execute("UPDATE quota SET 定额 = 定额 + 0.5 WHERE rowid = 40")
+        conn.commit()
+        conn.close()
+        stats = apply_changes()
+        assert stats.index_source == 'rebuilt'
+        assert load_quota_index().quota_data == load_quota_index(use_cache=False).quota_data
+
+
+if __name__ == "__main__":
+    test_changes_patch_index_and_rematch()
+    print("All tests passed")
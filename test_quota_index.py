@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for QuotaIndex
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import category_mapping
+from quota_index import QuotaIndex
+
+
+QUOTA_DATA = [
+    {'类别1': '机座', '定额': 4.0, 'effected_from': '20200301', '代码': 'A1'},
+    {'类别1': '转子', '定额': 4.0, 'effected_from': '20200301', '代码': 'A2'},
+    {'类别1': '机座', '定额': 5.0, 'effected_from': '20200301', '代码': 'A3'},
+    {'类别1': '机座', '定额': 4.0, 'effected_from': '19000101', '代码': 'A4'},
+    {'类别1': '装配', '定额': 4.0, 'effected_from': '20200301', '代码': 'A5'},
+    {'类别1': '机座', '定额': 4, 'effected_from': '20200301', '代码': 'A6'},
+    {'类别1': '绕嵌排', '定额': 2.5, 'effected_from': '20201201', '代码': 'A7'},
+]
+
+
+def linear_filter(quota_data, sheet_name, effected_from, quota_value):
+    """Reference implementation: the original two-pass linear scan"""
+    valid_categories = category_mapping.get(sheet_name, {}).get(effected_from, [])
+    filter1_data = [item for item in quota_data
+                    if item.get('类别1') in valid_categories
+                    and item.get('effected_from') == effected_from]
+    filter2_data = [item for item in filter1_data if item.get('定额') == quota_value]
+    return len(filter1_data), len(filter2_data), filter2_data
+
+
+def test_lookup_matches_linear_scan():
+    """QuotaIndex.lookup must return exactly what the linear scan returns"""
+    index = QuotaIndex(QUOTA_DATA)
+    cases = [
+        ('精加工', '20200301', 4.0),
+        ('精加工', '20200301', 5),
+        ('精加工', '19000101', 4.0),
+        ('喷漆装配', '20200301', 4.0),
+        ('绕嵌排', '20201201', 2.5),
+        ('绕嵌排', '20210101', 2.5),
+        ('不存在的部门', '20200301', 4.0),
+    ]
+    for sheet_name, effected_from, quota_value in cases:
+        expected = linear_filter(QUOTA_DATA, sheet_name, effected_from, quota_value)
+        assert index.lookup(sheet_name, effected_from, quota_value) == expected, \
+            (sheet_name, effected_from, quota_value)
+
+
+def test_lookup_keeps_quota_order():
+    """Records from several categories come back in quota table order"""
+    index = QuotaIndex(QUOTA_DATA)
+    _, _, filtered = index.lookup('精加工', '20200301', 4.0)
+    assert [item['代码'] for item in filtered] == ['A1', 'A2', 'A6']
+
+
+def test_tolerance_and_rounding():
+    """Approximate 定额 matching returns the linear-scan records within range"""
+    quota_data = QUOTA_DATA + [
+        {'类别1': '转子', '定额': 4.004, 'effected_from': '20200301', '代码': 'A8'},
+        {'类别1': '机座', '定额': 3.996, 'effected_from': '20200301', '代码': 'A9'},
+        {'类别1': '机座', '定额': 4.02, 'effected_from': '20200301', '代码': 'A10'},
+    ]
+    index = QuotaIndex(quota_data)
+    filter1_count, _, _ = linear_filter(quota_data, '精加工', '20200301', 4.0)
+
+    index.set_tolerance(tolerance=0.005)
+    expected = [item for item in quota_data
+                if item['effected_from'] == '20200301' and item['类别1'] in ('机座', '转子')
+                and abs(item['定额'] - 4.0) <= 0.005]
+    assert index.lookup('精加工', '20200301', 4.0) == (filter1_count, len(expected), expected)
+    assert [item['代码'] for item in expected] == ['A1', 'A2', 'A6', 'A8', 'A9']
+
+    index.set_tolerance(round_digits=2)
+    _, _, filtered = index.lookup('精加工', '20200301', 4.0)
+    assert [item['代码'] for item in filtered] == ['A1', 'A2', 'A6', 'A8', 'A9']
+    _, _, filtered = index.lookup('精加工', '20200301', 4.018)
+    assert [item['代码'] for item in filtered] == ['A10']
+
+
+def test_near_miss():
+    """Near misses: close but never exactly equal 定额 values"""
+    index = QuotaIndex(QUOTA_DATA)
+    assert index.near_miss('精加工', '20200301', 4.005, [])
+    assert not index.near_miss('精加工', '20200301', 4.5, [])
+
+    index.set_tolerance(tolerance=0.01)
+    _, _, filtered = index.lookup('精加工', '20200301', 4.005)
+    assert index.near_miss('精加工', '20200301', 4.005, filtered)
+    _, _, filtered = index.lookup('精加工', '20200301', 4.0)
+    assert not index.near_miss('精加工', '20200301', 4.0, filtered)
+
+
+def test_patch_replaces_groups():
+    """A patched index answers like an index rebuilt from the changed data"""
+    changed = [dict(item) for item in QUOTA_DATA]
+    changed[2]['定额'] = 4.0
+    del changed[5]
+    changed.append({'类别1': '转子', '定额': 4.0, 'effected_from': '20200301', '代码': 'A8'})
+    positions = [0, 1, 2, 3, 4, 6, 7]
+
+    index = QuotaIndex(QUOTA_DATA)
+    index.patch({
+        ('20200301', '机座'): [(0, changed[0]), (2, changed[2])],
+        ('20200301', '转子'): [(1, changed[1]), (7, changed[6])],
+    })
+    rebuilt = QuotaIndex(changed, positions)
+    assert index.positions == positions
+    assert index.quota_data == changed
+    for sheet_name, effected_from, quota_value in [('精加工', '20200301', 4.0),
+                                                   ('精加工', '20200301', 5.0),
+                                                   ('精加工', '19000101', 4.0)]:
+        assert (index.lookup(sheet_name, effected_from, quota_value)
+                == rebuilt.lookup(sheet_name, effected_from, quota_value))
+    _, _, filtered = index.lookup('精加工', '20200301', 4.0)
+    assert [item['代码'] for item in filtered] == ['A1', 'A2', 'A3', 'A8']
+
+
+if __name__ == "__main__":
+    test_lookup_matches_linear_scan()
+    test_lookup_keeps_quota_order()
+    test_tolerance_and_rounding()
+    test_near_miss()
+    test_patch_replaces_groups()
+    print("✅ QuotaIndex 测试通过")
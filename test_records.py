@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the slotted record types
+"""
+
+import pickle
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from records import PayrollRecord, QuotaRecord
+from payroll_generator import format_record
+
+
+PAYROLL_COLUMNS = ['文件名', 'sheet名', '职员全名', '日期', '客户名称', '型号', '工序全名',
+                   '工序', '计件数量', '系数', '定额', '金额', '备注']
+PAYROLL_ROW = ('202005.xls', '精加工', '张三', '2020-05-01', '客户A', 'Y1', '车削',
+               '车', 3, 1.0, 4.2, 12.6, '')
+
+
+def test_record_behaves_like_dict():
+    """
+    Test the dict-compatible adapter used by format_record and match.py
+    """
+    expected = dict(zip(PAYROLL_COLUMNS, PAYROLL_ROW))
+    record = PayrollRecord.from_row(PAYROLL_COLUMNS, PAYROLL_ROW)
+    
+    assert record == expected
+    assert record['定额'] == 4.2
+    assert record.get('不存在', 'N/A') == 'N/A'
+    assert '文件名' in record and '不存在' not in record
+    assert list(record.items()) == list(expected.items())
+    assert repr(record) == repr(expected)
+    assert format_record(record) == format_record(expected)
+    assert not hasattr(record, '__dict__')
+
+
+def test_record_pickle_and_odd_columns():
+    """
+    Test pickling and columns that are not valid Python identifiers
+    """
+    record = QuotaRecord.from_row(['类别1', 'effected from', 'class', '_x'],
+                                  ('机座', '20200301', 'A', 1))
+    assert record['effected from'] == '20200301'
+    assert record['class'] == 'A'
+    assert record['_x'] == 1
+    
+    restored = pickle.loads(pickle.dumps(record))
+    assert isinstance(restored, QuotaRecord)
+    assert type(restored) is type(record)
+    assert restored == record
+
+    # Columns named like Mapping methods do not shadow them
+    record = QuotaRecord.from_row(['get', 'keys', 'items', '定额'], (1, 2, 3, 4.0))
+    assert record['get'] == 1 and record['keys'] == 2 and record['items'] == 3
+    assert record.get('定额') == 4.0
+    assert list(record.keys()) == ['get', 'keys', 'items', '定额']
+    assert dict(record.items()) == {'get': 1, 'keys': 2, 'items': 3, '定额': 4.0}
+
+
+if __name__ == "__main__":
+    test_record_behaves_like_dict()
+    test_record_pickle_and_odd_columns()
+    print("✅ 记录类型测试通过")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the match results store
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from match import BatchCounters, MatchResult, MATCH_SUCCESS, MATCH_ERROR
+from results_store import MatchResultWriter, connect_writable, payroll_content_hash
+from synthetic_data import temporary_database
+
+RECORD = {'文件名': '202005.xls', 'sheet名': '精加工', '定额': 4.0}
+SUCCESS = MatchResult(MATCH_SUCCESS, '20200301', 3, 1, 'A1', None)
+ERROR = MatchResult(MATCH_ERROR, None, None, None, None, 'Invalid sheet')
+
+
+def _committed_count(table="match_results"):
+    """Rows of a table visible to another connection"""
+    conn = connect()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_writer_rows_and_commit_interval():
+    """
+    Test the stored run and result rows, and that rows are committed every
+    commit_interval rows, or only on close when it is None
+    """
+    with temporary_database(10, 10, seed=1):
+        writer = MatchResultWriter("python", commit_interval=2500)
+        counters = BatchCounters()
+        for payroll_rowid in range(1, 3001):
+            result = ERROR if payroll_rowid == 7 else SUCCESS
+            writer.add(payroll_rowid, result, RECORD)
+            counters.add(result)
+            if payroll_rowid == 2000:
+                # Written (flushed twice) but not committed yet
+                assert writer.written_count == 2000
+                assert _committed_count() == 0
+        assert _committed_count() == 3000
+        writer.close(counters)
+
+        conn = connect()
+        run = conn.execute("SELECT engine, finished_at, processed_count, success_count, "
+                           "skip_count, error_count, watermark FROM match_runs").fetchone()
+        assert run[0] == "python" and run[1] is not None
+        assert tuple(run[2:]) == (3000, 2999, 0, 1, 3000)
+        rows = {row[0]: tuple(row[1:]) for row in conn.execute(
+            "SELECT payroll_rowid, run_id, effected_from, filter1_count, filter2_count, 代码, "
+            "status, message, content_hash FROM match_results")}
+        conn.close()
+        content_hash = payroll_content_hash(RECORD)
+        assert rows[1] == (writer.run_id, '20200301', 3, 1, 'A1', MATCH_SUCCESS, None,
+                           content_hash)
+        assert rows[7] == (writer.run_id, None, None, None, None, MATCH_ERROR, 'Invalid sheet',
+                           content_hash)
+
+        # Without a commit interval nothing is committed before close()
+        writer = MatchResultWriter("python", commit_interval=None)
+        for payroll_rowid in range(3001, 6001):
+            writer.add(payroll_rowid, SUCCESS)
+        assert _committed_count() == 3000
+        assert _committed_count("match_runs") == 2
+        writer.close(finished=False)
+        assert _committed_count() == 6000
+
+
+def test_old_schema_is_migrated():
+    """Test that the columns added later are added to existing tables"""
+    with temporary_database(10, 10, seed=1):
+        conn = connect(readonly=False)
+        conn.executescript("""
+            CREATE TABLE match_runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, engine TEXT,
+                started_at TEXT, finished_at TEXT, processed_count INTEGER,
+                success_count INTEGER, skip_count INTEGER, error_count INTEGER);
+            CREATE TABLE match_results (payroll_rowid INTEGER PRIMARY KEY,
+                run_id INTEGER NOT NULL, effected_from TEXT, filter1_count INTEGER,
+                filter2_count INTEGER, 代码 TEXT, status TEXT NOT NULL, message TEXT);
+            INSERT INTO match_runs (engine) VALUES ('python');
+            INSERT INTO match_results (payroll_rowid, run_id, status) VALUES (1, 1, 'success');
+        """)
+        conn.commit()
+        conn.close()
+
+        connect_writable().close()
+        writer = MatchResultWriter("python")
+        writer.add(2, SUCCESS, RECORD)
+        writer.close()
+
+        conn = connect()
+        assert [row[1] for row in conn.execute("PRAGMA table_info(match_runs)")][-1] == 'watermark'
+        results = conn.execute("SELECT payroll_rowid, status, content_hash FROM match_results "
+                               "ORDER BY payroll_rowid").fetchall()
+        watermarks = conn.execute("SELECT watermark FROM match_runs ORDER BY run_id").fetchall()
+        conn.close()
+        assert [tuple(row) for row in results] == [(1, 'success', None),
+                                                   (2, 'success', payroll_content_hash(RECORD))]
+        assert [row[0] for row in watermarks] == [None, 2]
+
+
+if __name__ == "__main__":
+    test_writer_rows_and_commit_interval()
+    test_old_schema_is_migrated()
+    print("All tests passed")
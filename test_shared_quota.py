@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the shared-memory quota index
+"""
+
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from quota_index import QuotaIndex
+from shared_quota import SharedQuotaIndex, fixed_point_digits
+from test_quota_index import QUOTA_DATA
+
+CASES = [
+    ('精加工', '20200301', 4.0),
+    ('精加工', '20200301', 4),
+    ('精加工', '20200301', 5.0),
+    ('精加工', '20200301', 4.005),
+    ('精加工', '20200301', 4.004999),
+    ('精加工', '20200301', None),
+    ('精加工', '19000101', 4.0),
+    ('喷漆装配', '20200301', 4.0),
+    ('绕嵌排', '20201201', 2.5),
+    ('不存在的部门', '20200301', 4.0),
+]
+
+# QUOTA_DATA with uniform column types, a NULL 定额 and a 3-decimal 定额
+QUOTA_ROWS = [dict(item, 定额=float(item['定额'])) for item in QUOTA_DATA] + [
+    {'类别1': '机座', '定额': None, 'effected_from': '20200301', '代码': 'B1'},
+    {'类别1': '转子', '定额': 4.125, 'effected_from': '20200301', '代码': 'B2'},
+]
+
+
+def _lookups(quota_index):
+    results = []
+    for tolerance, round_digits in [(0.0, None), (0.01, None), (0.0, 2)]:
+        quota_index.set_tolerance(tolerance, round_digits)
+        for sheet_name, effected_from, quota_value in CASES:
+            filter1_count, filter2_count, filtered = quota_index.lookup(
+                sheet_name, effected_from, quota_value)
+            results.append((filter1_count, filter2_count, [dict(item) for item in filtered],
+                            quota_index.near_miss(sheet_name, effected_from, quota_value,
+                                                  filtered)))
+    return results
+
+
+def _attached_lookups(name):
+    shared = SharedQuotaIndex.attach(name)
+    try:
+        assert not shared._keys.flags.writeable
+        return _lookups(shared)
+    finally:
+        shared.close()
+
+
+def test_shared_lookups_match_quota_index():
+    """
+    Test that the shared index, in this process and attached from a worker,
+    answers every lookup like QuotaIndex
+    """
+    quota_index = QuotaIndex(QUOTA_ROWS)
+    expected = _lookups(quota_index)
+    with SharedQuotaIndex.create(quota_index) as shared:
+        assert len(shared) == len(QUOTA_ROWS)
+        assert _lookups(shared) == expected
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(_attached_lookups, shared.name).result() == expected
+
+
+def test_fixed_point_and_unsupported_data():
+    """Test the fixed-point scale and the refusal of data it cannot encode"""
+    assert fixed_point_digits([4.0, 2.5, 4.125]) == 3
+    assert fixed_point_digits([4, 5]) == 0
+    assert fixed_point_digits([1e300]) is None
+
+    for quota_data in (QUOTA_DATA, [dict(QUOTA_ROWS[0], 定额=1e300)]):
+        try:
+            SharedQuotaIndex.create(QuotaIndex(quota_data))
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_shared_lookups_match_quota_index()
+    test_fixed_point_and_unsupported_data()
+    print("All tests passed")
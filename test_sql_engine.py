@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the SQL matching engine
+"""
+
+import sys
+import os
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_matching import serial_results
+from db import connect
+from match import MATCH_SUCCESS, MATCH_NODECISION, MATCH_ERROR
+from quota_cache import load_quota_index
+from sql_engine import sql_match_records
+from synthetic_data import temporary_database
+
+
+def _comparable(results):
+    """(rowid, MatchResult with the message as text) of every result"""
+    return [
+        (payroll_rowid, result._replace(
+            message=str(result.message) if result.message is not None else None))
+        for payroll_rowid, _, result in results
+    ]
+
+
+def test_sql_matches_serial():
+    """
+    Test that the SQL engine gives the serial results, including NULL 定额
+    joined with IS, ambiguous candidates and unresolvable effected_from
+    """
+    with temporary_database(1500, 150, ambiguity_rate=0.2, seed=6):
+        quota_index = load_quota_index(use_cache=False)
+        file_name, sheet_name, code = next(
+            (record['文件名'], record['sheet名'], result.code)
+            for _, record, result in serial_results(quota_index)
+            if result.status == MATCH_SUCCESS)
+
+        conn = connect(readonly=False)
+        # A NULL 定额 quota row in the group of a matched record, and payroll
+        # rows with a NULL 定额, an unknown sheet名 and a 文件名 without a date
+        conn.execute("INSERT INTO quota (类别1, 定额, effected_from, 代码) "
+                     "SELECT 类别1, NULL, effected_from, 'NULL-1' FROM quota WHERE 代码 = ?",
+                     (code,))
+        conn.executemany("INSERT INTO payroll_details (文件名, sheet名, 职员全名, 定额) "
+                         "VALUES (?, ?, ?, ?)",
+                         [(file_name, sheet_name, '张三', None),
+                          ('202005.xls', '不存在的部门', '李四', 4.0),
+                          ('未知.xls', sheet_name, '王五', 4.0)])
+        conn.commit()
+        conn.close()
+        quota_index = load_quota_index(use_cache=False)
+
+        expected = _comparable(serial_results(quota_index))
+        statuses = {result.status for _, result in expected}
+        assert {MATCH_SUCCESS, MATCH_NODECISION, MATCH_ERROR} <= statuses
+        assert expected[-3][1].filter2_count == 1
+        assert _comparable(sql_match_records(quota_index)) == expected
+        assert _comparable(sql_match_records(quota_index, limit=100)) == expected[:100]
+
+
+if __name__ == "__main__":
+    test_sql_matches_serial()
+    print("All tests passed")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test program for the synthetic data generator
+"""
+
+import sys
+import os
+import tempfile
+from collections import Counter
+
+# Add the current directory to the path to import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import connect
+from match import match_record, MATCH_NODECISION, MATCH_SUCCESS
+from payroll_generator import read_payroll
+from quota_cache import load_quota_index
+from synthetic_data import generate_database
+
+
+def match_statuses(db_path):
+    """Status counts of matching every payroll record of a database"""
+    quota_index = load_quota_index(use_cache=False, db_path=db_path)
+    conn = connect(db_path=db_path)
+    try:
+        return Counter(match_record(quota_index, record).status
+                       for record in read_payroll(conn=conn))
+    finally:
+        conn.close()
+
+
+def test_generate_database():
+    """
+    Test row counts, reproducibility and the ambiguity rate
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "synthetic.db")
+
+        generate_database(db_path, 2000, 300, ambiguity_rate=0.0, seed=1)
+        statuses = match_statuses(db_path)
+        assert sum(statuses.values()) == 2000
+        assert statuses[MATCH_NODECISION] == 0
+        assert statuses[MATCH_SUCCESS] > 1500
+
+        # Same seed, same data
+        assert match_statuses(db_path) == statuses
+        generate_database(db_path, 2000, 300, ambiguity_rate=0.0, seed=1)
+        assert match_statuses(db_path) == statuses
+
+        generate_database(db_path, 2000, 300, ambiguity_rate=0.5, seed=1)
+        assert match_statuses(db_path)[MATCH_NODECISION] > 200
+
+
+if __name__ == "__main__":
+    test_generate_database()
+    print("All tests passed")